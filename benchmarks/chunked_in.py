@@ -0,0 +1,105 @@
+# coding: utf-8
+'''
+Times :py:func:`hammers.query.chunked_in` looking up a list of IDs in an
+``owned_ips``-shaped table at several chunk sizes, one chunk at a time and
+in parallel on a :py:class:`hammers.mysqlshim.MySqlPool`. Creates (and
+drops, afterwards) a ``hammers_bench`` database, so point it at a scratch
+MySQL server.
+
+.. code-block:: bash
+
+    python benchmarks/chunked_in.py -H scratch-db [--ids 50000] [--chunk-sizes 100 500 2000 10000]
+'''
+import argparse
+import random
+import sys
+import time
+
+from hammers import query
+from hammers.mysqlargs import MySqlArgs
+
+DATABASE = 'hammers_bench'
+
+SQL = '''
+SELECT id
+     , status
+     , project_id
+FROM   hammers_bench.floatingips
+WHERE  project_id IN ({ids});
+'''
+
+
+def populate(db, rows, projects, seed):
+    rng = random.Random(seed)
+    db.query('''CREATE TABLE {}.floatingips (
+        id VARCHAR(36) PRIMARY KEY,
+        project_id VARCHAR(255),
+        status VARCHAR(16),
+        KEY (project_id)
+    )'''.format(DATABASE), no_rows=True)
+    values = [('ip-{}'.format(n), 'project-{}'.format(rng.randrange(projects)),
+               rng.choice(['DOWN', 'ACTIVE'])) for n in range(rows)]
+    for chunk in query.chunks(values, 10000):
+        db.cursor.executemany(
+            'INSERT INTO {}.floatingips VALUES (%s, %s, %s)'.format(DATABASE),
+            chunk)
+    db.commit()
+    db.query('ANALYZE TABLE {}.floatingips'.format(DATABASE), limit=None,
+             immediate=True)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    mysqlargs = MySqlArgs({
+        'user': 'root',
+        'password': '',
+        'host': 'localhost',
+        'port': 3306,
+    })
+    mysqlargs.inject(parser)
+    parser.add_argument('--rows', type=int, default=500000)
+    parser.add_argument('--ids', type=int, default=50000,
+        help='Project IDs to look up. Default: %(default)s')
+    parser.add_argument('--chunk-sizes', type=int, nargs='+',
+                        default=[50, 100, 500, 2000, 10000])
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv[1:])
+
+    mysqlargs.extract(args)
+    db = mysqlargs.connect()
+    pool = mysqlargs.connect(pool=True, size=args.pool_size)
+
+    existing = {row[0] for row in db.query('SHOW DATABASES', rows='tuple',
+                                           limit=None, immediate=True)}
+    if DATABASE in existing:
+        print('refusing to run: {} already exists'.format(DATABASE))
+        return 1
+
+    db.query('CREATE DATABASE {}'.format(DATABASE), no_rows=True)
+    try:
+        populate(db, args.rows, args.ids * 2, args.seed)
+        ids = ['project-{}'.format(n) for n in range(0, args.ids * 2, 2)]
+
+        print('{:>10s} {:>8s} {:>12s} {:>10s}'.format(
+            'chunk', 'mode', 'seconds', 'rows'))
+        for chunk_size in args.chunk_sizes:
+            for mode, chunk_pool in [('serial', None), ('pool', pool)]:
+                best = None
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    count = sum(1 for _ in query.chunked_in(
+                        db, SQL, ids, chunk_size, pool=chunk_pool,
+                        rows='tuple'))
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                print('{:10d} {:>8s} {:12.3f} {:10d}'.format(
+                    chunk_size, mode, best, count))
+    finally:
+        pool.close()
+        db.query('DROP DATABASE IF EXISTS {}'.format(DATABASE), no_rows=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
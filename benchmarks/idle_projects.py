@@ -0,0 +1,151 @@
+# coding: utf-8
+'''
+Times both methods of :py:func:`hammers.query.idle_projects` against a
+synthetic Rocky-shaped dataset, and checks they agree. Creates (and drops,
+afterwards) the ``keystone``, ``neutron``, ``nova`` and ``nova_cell0``
+databases, so **only point it at a scratch MySQL server**; it refuses to
+run if any of them already exist.
+
+.. code-block:: bash
+
+    python benchmarks/idle_projects.py -H scratch-db [--instances 200000]
+'''
+import argparse
+import datetime
+import random
+import sys
+import time
+
+from hammers import query
+from hammers.mysqlargs import MySqlArgs
+
+DATABASES = ['keystone', 'neutron', 'nova', 'nova_cell0']
+
+SCHEMA = [
+    '''CREATE TABLE keystone.project (
+        id VARCHAR(64) PRIMARY KEY,
+        name VARCHAR(64) NOT NULL
+    )''',
+    '''CREATE TABLE neutron.floatingips (
+        id VARCHAR(36) PRIMARY KEY,
+        project_id VARCHAR(255),
+        status VARCHAR(16),
+        KEY (project_id)
+    )''',
+] + [
+    '''CREATE TABLE {}.instances (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        project_id VARCHAR(255),
+        vm_state VARCHAR(255),
+        deleted_at DATETIME,
+        KEY instances_project_id_idx (project_id)
+    )'''.format(db) for db in ['nova', 'nova_cell0']
+]
+
+VM_STATES = ['active'] * 2 + ['deleted'] * 6 + ['error', 'stopped', None]
+
+
+def populate(db, projects, ips, instances, seed):
+    rng = random.Random(seed)
+    cursor = db.cursor
+    project_ids = ['{:032x}'.format(n) for n in range(projects)]
+    cursor.executemany(
+        'INSERT INTO keystone.project VALUES (%s, %s)',
+        [(p, 'project-{}'.format(n)) for n, p in enumerate(project_ids)])
+    cursor.executemany(
+        'INSERT INTO neutron.floatingips VALUES (%s, %s, %s)',
+        [('ip-{}'.format(n), rng.choice(project_ids),
+          rng.choice(['down', 'down', 'active'])) for n in range(ips)])
+
+    start = datetime.datetime(2015, 1, 1)
+    for novatable in ['nova', 'nova_cell0']:
+        # about a third of the projects only ever used one of the cells
+        cell_projects = [p for p in project_ids if rng.random() > 0.3]
+        rows = []
+        for n in range(instances // 2):
+            vm_state = rng.choice(VM_STATES)
+            deleted_at = None
+            if vm_state == 'deleted' or rng.random() < 0.05:
+                deleted_at = start + datetime.timedelta(
+                    minutes=rng.randrange(60 * 24 * 365 * 4))
+            rows.append((rng.choice(cell_projects), vm_state, deleted_at))
+            if len(rows) == 10000:
+                cursor.executemany(
+                    'INSERT INTO {}.instances (project_id, vm_state, deleted_at) '
+                    'VALUES (%s, %s, %s)'.format(novatable), rows)
+                rows = []
+        if rows:
+            cursor.executemany(
+                'INSERT INTO {}.instances (project_id, vm_state, deleted_at) '
+                'VALUES (%s, %s, %s)'.format(novatable), rows)
+    db.commit()
+    for table in ['keystone.project', 'neutron.floatingips',
+                  'nova.instances', 'nova_cell0.instances']:
+        db.query('ANALYZE TABLE {}'.format(table), limit=None, immediate=True)
+
+
+def timed(db, method, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = list(query.idle_projects(db, method=method))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, rows
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    mysqlargs = MySqlArgs({
+        'user': 'root',
+        'password': '',
+        'host': 'localhost',
+        'port': 3306,
+    })
+    mysqlargs.inject(parser)
+    parser.add_argument('--projects', type=int, default=2000)
+    parser.add_argument('--floating-ips', type=int, default=5000)
+    parser.add_argument('--instances', type=int, default=200000,
+        help='Split between the two cells. Default: %(default)s')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv[1:])
+
+    mysqlargs.extract(args)
+    db = mysqlargs.connect()
+    db.version = query.ROCKY
+
+    existing = {row[0] for row in db.query('SHOW DATABASES', rows='tuple',
+                                           limit=None, immediate=True)}
+    if existing.intersection(DATABASES):
+        print('refusing to run: {} already exist(s)'.format(
+            ', '.join(sorted(existing.intersection(DATABASES)))))
+        return 1
+
+    try:
+        for database in DATABASES:
+            db.query('CREATE DATABASE {}'.format(database), no_rows=True)
+        for statement in SCHEMA:
+            db.query(statement, no_rows=True)
+        populate(db, args.projects, args.floating_ips, args.instances,
+                 args.seed)
+
+        results = {}
+        print('{:10s} {:>10s} {:>8s}'.format('method', 'seconds', 'rows'))
+        for method in ['subquery', 'aggregate']:
+            elapsed, rows = timed(db, method, args.repeat)
+            results[method] = rows
+            print('{:10s} {:10.3f} {:8d}'.format(method, elapsed, len(rows)))
+
+        def key(row):
+            return row['id'], row['latest_deletion']
+        if sorted(map(key, results['subquery'])) != sorted(map(key, results['aggregate'])):
+            print('methods disagree!')
+            return 1
+    finally:
+        for database in DATABASES:
+            db.query('DROP DATABASE IF EXISTS {}'.format(database), no_rows=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,123 @@
+# coding: utf-8
+'''
+Times :py:class:`hammers.scripts.lease_stack_replay.LeaseHistoryReplay`
+over a synthetic year of lease history, evaluating the policy once a day,
+against building a fresh
+:py:class:`~hammers.scripts.lease_stack_notifier.LeaseComplianceManager`
+for the leases at each step (timed on every ``--rebuild-every``-th step
+and scaled up), and checks they agree on those steps.
+
+.. code-block:: bash
+
+    python benchmarks/lease_stack_replay.py [--leases 50000] [--days 365]
+'''
+import argparse
+import contextlib
+import io
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from hammers.scripts.lease_stack_notifier import LeaseComplianceManager
+from hammers.scripts.lease_stack_replay import LeaseHistoryReplay
+
+NODE_TYPES = ['compute_skylake', 'compute_cascadelake', 'compute_haswell',
+              'gpu_v100', 'gpu_rtx_6000', 'storage', 'fpga']
+
+CONFIG = {
+    'site': 'bench',
+    'exclude_projects': [],
+    'lease_coverage_threshold': 0.5,
+    'high_end_node_coverage_threshold': 0.05,
+    'minimum_lease_window_days': 21,
+    'min_nodes_for_coverage': 4,
+    'exclude_node_types': ['fpga'],
+    'high_end_node_types': [],
+    'sender_email': '',
+    'manager_email': '',
+}
+
+START = datetime(2024, 1, 1)
+
+
+def synthetic_history(projects, leases, hosts, days, seed):
+    rng = random.Random(seed)
+    host_list = [{'id': 'host{}'.format(n), 'node_type': rng.choice(NODE_TYPES)}
+                 for n in range(hosts)]
+    history = []
+    for n in range(leases):
+        created = START + timedelta(minutes=rng.randrange(60 * 24 * days))
+        start = created + timedelta(minutes=rng.randrange(60 * 24 * 30))
+        end = start + timedelta(minutes=rng.randrange(60, 60 * 24 * 14))
+        deleted = None
+        if rng.random() < 0.1:
+            deleted = created + timedelta(minutes=rng.randrange(1, 60 * 24 * 30))
+        history.append({
+            'id': 'lease{}'.format(n),
+            'project_id': 'project{}'.format(int(projects * rng.random() ** 3)),
+            'status': 'TERMINATED',
+            'start_date': start.isoformat(),
+            'end_date': end.isoformat(),
+            'created_at': created.isoformat(),
+            'deleted_at': deleted.isoformat() if deleted else None,
+            'hosts': [h['id'] for h in rng.sample(host_list, rng.randint(1, 4))],
+        })
+    return host_list, history
+
+
+def rebuild(hosts, history, now):
+    leases = []
+    allocations = []
+    for lease in history:
+        gone = min(filter(None, [lease['end_date'], lease['deleted_at']]))
+        if lease['created_at'] <= now.isoformat() < gone:
+            leases.append(dict(lease, status='ACTIVE'))
+            for host_id in lease['hosts']:
+                allocations.append({'resource_id': host_id,
+                                    'reservations': [{'lease_id': lease['id']}]})
+    lcm = LeaseComplianceManager(CONFIG, leases, hosts, allocations, now=now)
+    return lcm.violations_by_project()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--projects', type=int, default=2000)
+    parser.add_argument('--leases', type=int, default=50000)
+    parser.add_argument('--hosts', type=int, default=600)
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--rebuild-every', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv[1:])
+
+    hosts, history = synthetic_history(
+        args.projects, args.leases, args.hosts, args.days, args.seed)
+    times = [START + timedelta(days=n) for n in range(args.days)]
+
+    start = time.perf_counter()
+    replay = LeaseHistoryReplay(CONFIG, hosts, history)
+    replayed = dict(replay.run(times))
+    replay_elapsed = time.perf_counter() - start
+
+    sampled = times[::args.rebuild_every]
+    rebuilt = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for now in sampled:
+            rebuilt[now] = rebuild(hosts, history, now)
+        rebuild_elapsed = time.perf_counter() - start
+
+    print('{} leases, {} steps'.format(len(history), len(times)))
+    print('replay:  {:.3f}s'.format(replay_elapsed))
+    print('rebuild: {:.3f}s (estimated from {} steps)'.format(
+        rebuild_elapsed / len(sampled) * len(times), len(sampled)))
+
+    for now in sampled:
+        if {p: sorted(v) for p, v in rebuilt[now].items()} != \
+                {p: sorted(v) for p, v in replayed[now].items()}:
+            print('results differ at {}!'.format(now))
+            return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,89 @@
+# coding: utf-8
+'''
+How :py:mod:`hammers.scripts.lease_stack_notifier` scales with the number
+of stacked leases in a project: builds a
+:py:class:`~hammers.scripts.lease_stack_notifier.LeaseComplianceManager`
+from synthetic Blazar hosts, leases and allocations for one project with
+more and more leases, and times that plus evaluating its violations.
+
+.. code-block:: bash
+
+    python benchmarks/lease_stack_scaling.py [--leases 100 1000 10000] [--hosts-per-lease 4]
+'''
+import argparse
+import random
+import sys
+import time
+from datetime import timedelta
+
+from hammers.scripts.lease_stack_notifier import (
+    DATETIME_NOW, LeaseComplianceManager,
+)
+
+NODE_TYPES = ['compute_skylake', 'compute_cascadelake', 'gpu_v100', 'storage']
+
+CONFIG = {
+    'site': 'bench',
+    'exclude_projects': [],
+    'lease_coverage_threshold': 0.9,
+    'high_end_node_coverage_threshold': 0.5,
+    'minimum_lease_window_days': 21,
+    'min_nodes_for_coverage': 4,
+    'exclude_node_types': [],
+    'high_end_node_types': [],
+    'sender_email': '',
+    'manager_email': '',
+}
+
+
+def synthetic_site(leases, hosts_per_lease, seed):
+    rng = random.Random(seed)
+    hosts = [{'id': 'host{}'.format(n), 'node_type': NODE_TYPES[n % len(NODE_TYPES)]}
+             for n in range(max(100, hosts_per_lease * 10))]
+    lease_list = []
+    allocations = {}
+    for n in range(leases):
+        start = DATETIME_NOW + timedelta(hours=rng.randrange(-24 * 7, 24 * 365))
+        end = start + timedelta(hours=rng.randrange(1, 24 * 14))
+        lease_id = 'lease{}'.format(n)
+        lease_list.append({
+            'id': lease_id,
+            'start_date': start.isoformat(),
+            'end_date': end.isoformat(),
+            'status': 'ACTIVE',
+            'project_id': 'project1',
+        })
+        for host in rng.sample(hosts, hosts_per_lease):
+            allocations.setdefault(host['id'], []).append({'lease_id': lease_id})
+    allocation_list = [{'resource_id': host_id, 'reservations': reservations}
+                       for host_id, reservations in allocations.items()]
+    return hosts, lease_list, allocation_list
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--leases', type=int, nargs='+',
+                        default=[100, 300, 1000, 3000, 10000])
+    parser.add_argument('--hosts-per-lease', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv[1:])
+
+    print('{:>8s} {:>12s} {:>12s} {:>14s}'.format(
+        'leases', 'build (s)', 'check (s)', 'us per lease'))
+    for leases in args.leases:
+        hosts, lease_list, allocations = synthetic_site(
+            leases, args.hosts_per_lease, args.seed)
+
+        start = time.perf_counter()
+        lcm = LeaseComplianceManager(CONFIG, lease_list, hosts, allocations)
+        built = time.perf_counter()
+        lcm.get_project_violations('project1')
+        checked = time.perf_counter()
+
+        print('{:8d} {:12.3f} {:12.3f} {:14.1f}'.format(
+            leases, built - start, checked - built,
+            (checked - start) / leases * 1e6))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,72 @@
+# coding: utf-8
+'''
+Times a steady-state run of :py:mod:`hammers.scripts.lease_stack_notifier`
+with a :py:class:`~hammers.scripts.lease_stack_notifier.ViolationState`
+kept from the run before, when ``--churn`` of the leases changed since,
+against evaluating every project again, and checks they agree.
+
+.. code-block:: bash
+
+    python benchmarks/lease_stack_state.py [--leases 20000] [--churn 0.01]
+'''
+import argparse
+import contextlib
+import io
+import random
+import sys
+import time
+from datetime import timedelta
+
+from hammers.scripts.lease_stack_notifier import (
+    DATETIME_NOW, ViolationState, evaluate,
+)
+
+from lease_stack_violations import CONFIG, synthetic_site
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--projects', type=int, default=2000)
+    parser.add_argument('--leases', type=int, default=20000)
+    parser.add_argument('--hosts', type=int, default=600)
+    parser.add_argument('--churn', type=float, default=0.01,
+        help='Fraction of leases changed between runs. Default: %(default)s')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv[1:])
+
+    hosts, leases, allocations = synthetic_site(
+        args.projects, args.leases, args.hosts, args.seed)
+    state = ViolationState()
+    with contextlib.redirect_stdout(io.StringIO()):
+        evaluate(CONFIG, leases, hosts, allocations,
+                 now=DATETIME_NOW, state=state)
+        for project_id in list(state.unnotified()):
+            state.notified(project_id)
+
+        # some leases extended, as happens between daily runs
+        rng = random.Random(args.seed)
+        for lease in rng.sample(leases, int(len(leases) * args.churn)):
+            lease['end_date'] = (DATETIME_NOW + timedelta(
+                minutes=rng.randrange(60 * 24, 60 * 24 * 30))).isoformat()
+
+        start = time.perf_counter()
+        _, full = evaluate(CONFIG, leases, hosts, allocations, now=DATETIME_NOW)
+        full_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        lcm, kept = evaluate(CONFIG, leases, hosts, allocations,
+                             now=DATETIME_NOW, state=state)
+        kept_elapsed = time.perf_counter() - start
+
+    print('{} projects, {} evaluated again'.format(
+        len(state.projects), len(lcm.projects_by_id)))
+    print('full:  {:.3f}s'.format(full_elapsed))
+    print('state: {:.3f}s'.format(kept_elapsed))
+
+    if full.keys() != kept.keys():
+        print('results differ!')
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
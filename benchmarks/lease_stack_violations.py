@@ -0,0 +1,113 @@
+# coding: utf-8
+'''
+Times :py:meth:`~hammers.scripts.lease_stack_notifier.LeaseComplianceManager.violations_by_project`
+for a whole synthetic site, with NumPy and with the per-project Python
+fallback, and checks they agree.
+
+.. code-block:: bash
+
+    python benchmarks/lease_stack_violations.py [--projects 2000] [--leases 20000]
+'''
+import argparse
+import contextlib
+import io
+import math
+import random
+import sys
+import time
+from datetime import timedelta
+from unittest import mock
+
+from hammers.scripts import lease_stack_notifier
+from hammers.scripts.lease_stack_notifier import (
+    DATETIME_NOW, LeaseComplianceManager,
+)
+
+NODE_TYPES = ['compute_skylake', 'compute_cascadelake', 'compute_haswell',
+              'gpu_v100', 'gpu_rtx_6000', 'storage', 'fpga']
+
+CONFIG = {
+    'site': 'bench',
+    'exclude_projects': [],
+    'lease_coverage_threshold': 0.5,
+    'high_end_node_coverage_threshold': 0.05,
+    'minimum_lease_window_days': 21,
+    'min_nodes_for_coverage': 4,
+    'exclude_node_types': ['fpga'],
+    'high_end_node_types': [],
+    'sender_email': '',
+    'manager_email': '',
+}
+
+
+def synthetic_site(projects, leases, hosts, seed):
+    rng = random.Random(seed)
+    host_list = [{'id': 'host{}'.format(n), 'node_type': rng.choice(NODE_TYPES)}
+                 for n in range(hosts)]
+    lease_list = []
+    allocations = {}
+    for n in range(leases):
+        start = DATETIME_NOW + timedelta(minutes=rng.randrange(-60 * 24 * 7, 60 * 24 * 60))
+        end = start + timedelta(minutes=rng.randrange(60, 60 * 24 * 14))
+        lease_id = 'lease{}'.format(n)
+        lease_list.append({
+            'id': lease_id,
+            'start_date': start.isoformat(),
+            'end_date': end.isoformat(),
+            'status': rng.choice(['ACTIVE'] * 9 + ['TERMINATED']),
+            # a few busy projects and a long tail
+            'project_id': 'project{}'.format(int(projects * rng.random() ** 3)),
+        })
+        for host in rng.sample(host_list, rng.randint(1, 4)):
+            allocations.setdefault(host['id'], []).append({'lease_id': lease_id})
+    allocation_list = [{'resource_id': host_id, 'reservations': reservations}
+                       for host_id, reservations in allocations.items()]
+    return host_list, lease_list, allocation_list
+
+
+def same(a, b):
+    if a.keys() != b.keys():
+        return False
+    for project_id in a:
+        if a[project_id].keys() != b[project_id].keys():
+            return False
+        for node_type, violation in a[project_id].items():
+            other = b[project_id][node_type]
+            if violation.keys() != other.keys() or not all(
+                    math.isclose(violation[k], other[k]) for k in violation):
+                return False
+    return True
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--projects', type=int, default=2000)
+    parser.add_argument('--leases', type=int, default=20000)
+    parser.add_argument('--hosts', type=int, default=600)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv[1:])
+
+    hosts, leases, allocations = synthetic_site(
+        args.projects, args.leases, args.hosts, args.seed)
+    start = time.perf_counter()
+    lcm = LeaseComplianceManager(CONFIG, leases, hosts, allocations)
+    print('build: {:.3f}s'.format(time.perf_counter() - start))
+
+    results = {}
+    for name, numpy in [('python', None), ('numpy', lease_stack_notifier.numpy)]:
+        # quiet the per-node-type skip messages
+        with mock.patch.object(lease_stack_notifier, 'numpy', numpy), \
+                contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            results[name] = lcm.violations_by_project()
+            elapsed = time.perf_counter() - start
+        print('{:8s} {:.3f}s, {} projects in violation'.format(
+            name, elapsed, len(results[name])))
+
+    if not same(results['python'], results['numpy']):
+        print('results differ!')
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
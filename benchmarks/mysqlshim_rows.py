@@ -0,0 +1,85 @@
+# coding: utf-8
+'''
+Rows/sec and peak RSS of each :py:class:`hammers.mysqlshim.MySqlShim` row
+mode, reading every row of a fake result set (shaped like a ``nova.instances``
+scan) into a list. Each mode runs in its own process so peak RSS isn't
+shared.
+
+.. code-block:: bash
+
+    python benchmarks/mysqlshim_rows.py [-n ROWS]
+'''
+import argparse
+import datetime
+import multiprocessing
+import resource
+import sys
+import time
+import types
+
+from hammers.mysqlshim import MySqlShim, ROW_MODES
+
+COLUMNS = ['uuid', 'user_id', 'project_id', 'vm_state', 'host',
+           'created_at', 'updated_at', 'deleted_at']
+
+
+class FakeCursor(object):
+    def __init__(self, rows):
+        self.rows = rows
+        self.description = [(c,) for c in COLUMNS]
+
+    def execute(self, *args, **kwargs):
+        self.position = 0
+        return self.rows
+
+    def fetchmany(self, size):
+        # build rows as they're fetched, like the driver does
+        start, self.position = self.position, min(self.position + size, self.rows)
+        stamp = datetime.datetime(2020, 1, 1)
+        return [
+            ('{:036d}'.format(n), 'user-{}'.format(n % 500),
+             'project-{}'.format(n % 300), 'active', 'host-{}'.format(n % 400),
+             stamp, stamp, None)
+            for n in range(start, self.position)
+        ]
+
+
+def fake_shim(rows):
+    shim = MySqlShim.__new__(MySqlShim)
+    shim.cursor = FakeCursor(rows)
+    shim._stream = None
+    shim.db = types.SimpleNamespace(cursor=lambda cls=None: shim.cursor)
+    shim._MySQLdb = None
+    return shim
+
+
+def run(mode, rows, results):
+    shim = fake_shim(rows)
+    start = time.perf_counter()
+    data = shim.query('SELECT', rows=mode, limit=None, immediate=True)
+    elapsed = time.perf_counter() - start
+    assert len(data) == (len(COLUMNS) if mode == 'columns' else rows)
+    # ru_maxrss is KiB on Linux
+    results.put((mode, rows / elapsed,
+                 resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--rows', type=int, default=1000000)
+    args = parser.parse_args(argv[1:])
+
+    results = multiprocessing.Queue()
+    print('{:8s} {:>12s} {:>14s}'.format('mode', 'rows/sec', 'peak RSS (MB)'))
+    for mode in ['dict', 'record', 'tuple', 'columns']:
+        assert mode in ROW_MODES
+        proc = multiprocessing.Process(target=run,
+                                       args=(mode, args.rows, results))
+        proc.start()
+        mode, rate, rss = results.get()
+        proc.join()
+        print('{:8s} {:12.0f} {:14.1f}'.format(mode, rate, rss))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
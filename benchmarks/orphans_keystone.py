@@ -0,0 +1,162 @@
+# coding: utf-8
+'''
+Times :py:func:`hammers.query.orphans` for instances joined with Keystone in
+SQL against checking them with a :py:class:`hammers.query.KeystoneMembership`
+(load included), on a synthetic Keystone, and checks they agree. Creates
+(and drops, afterwards) the ``keystone``, ``nova`` and ``nova_cell0``
+databases, so **only point it at a scratch MySQL server**; it refuses to
+run if any of them already exist.
+
+.. code-block:: bash
+
+    python benchmarks/orphans_keystone.py -H scratch-db [--users 50000] [--assignments 500000]
+'''
+import argparse
+import random
+import sys
+import time
+
+from hammers import query
+from hammers.mysqlargs import MySqlArgs
+
+DATABASES = ['keystone', 'nova', 'nova_cell0']
+
+SCHEMA = [
+    '''CREATE TABLE keystone.user (
+        id VARCHAR(64) PRIMARY KEY,
+        enabled TINYINT(1)
+    )''',
+    '''CREATE TABLE keystone.local_user (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id VARCHAR(64) NOT NULL UNIQUE,
+        name VARCHAR(255) NOT NULL
+    )''',
+    '''CREATE TABLE keystone.project (
+        id VARCHAR(64) PRIMARY KEY,
+        name VARCHAR(64) NOT NULL,
+        enabled TINYINT(1)
+    )''',
+    # like keystone's, the primary key leads with type, actor_id, target_id
+    '''CREATE TABLE keystone.assignment (
+        type ENUM('UserProject', 'GroupProject', 'UserDomain', 'GroupDomain') NOT NULL,
+        actor_id VARCHAR(64) NOT NULL,
+        target_id VARCHAR(64) NOT NULL,
+        role_id VARCHAR(64) NOT NULL,
+        inherited TINYINT(1) NOT NULL DEFAULT 0,
+        PRIMARY KEY (type, actor_id, target_id, role_id, inherited)
+    )''',
+] + [
+    '''CREATE TABLE {}.instances (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        uuid VARCHAR(36) NOT NULL,
+        user_id VARCHAR(255),
+        project_id VARCHAR(255),
+        deleted_at DATETIME
+    )'''.format(db) for db in ['nova', 'nova_cell0']
+]
+
+
+def insert(db, sql, rows):
+    for chunk in query.chunks(rows, 10000):
+        db.cursor.executemany(sql, chunk)
+
+
+def populate(db, users, projects, assignments, instances, seed):
+    rng = random.Random(seed)
+    user_ids = ['{:032x}'.format(n) for n in range(users)]
+    project_ids = ['{:032x}'.format(n + users) for n in range(projects)]
+
+    insert(db, 'INSERT INTO keystone.user VALUES (%s, %s)',
+           ((u, int(rng.random() > 0.05)) for u in user_ids))
+    insert(db, 'INSERT INTO keystone.local_user (user_id, name) VALUES (%s, %s)',
+           ((u, 'user-{}'.format(n)) for n, u in enumerate(user_ids)))
+    insert(db, 'INSERT INTO keystone.project VALUES (%s, %s, %s)',
+           ((p, 'project-{}'.format(n), int(rng.random() > 0.05))
+            for n, p in enumerate(project_ids)))
+    insert(db, 'INSERT IGNORE INTO keystone.assignment VALUES (%s, %s, %s, %s, 0)',
+           (('UserProject', rng.choice(user_ids), rng.choice(project_ids), 'member')
+            for _ in range(assignments)))
+
+    # most instances belong to real members
+    members = list(db.query('SELECT actor_id, target_id FROM keystone.assignment',
+                            rows='tuple', limit=None, immediate=True))
+    for novatable in ['nova', 'nova_cell0']:
+        def rows():
+            for n in range(instances // 2):
+                if rng.random() < 0.9:
+                    user_id, project_id = rng.choice(members)
+                else:
+                    user_id, project_id = rng.choice(user_ids), rng.choice(project_ids)
+                yield ('{}-{}'.format(novatable, n), user_id, project_id,
+                       None if rng.random() < 0.7 else '2020-01-01')
+        insert(db, 'INSERT INTO {}.instances (uuid, user_id, project_id, deleted_at) '
+                   'VALUES (%s, %s, %s, %s)'.format(novatable), rows())
+    db.commit()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    mysqlargs = MySqlArgs({
+        'user': 'root',
+        'password': '',
+        'host': 'localhost',
+        'port': 3306,
+    })
+    mysqlargs.inject(parser)
+    parser.add_argument('--users', type=int, default=50000)
+    parser.add_argument('--projects', type=int, default=5000)
+    parser.add_argument('--assignments', type=int, default=500000)
+    parser.add_argument('--instances', type=int, default=100000,
+        help='Split between the two cells. Default: %(default)s')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv[1:])
+
+    mysqlargs.extract(args)
+    db = mysqlargs.connect()
+    db.version = query.ROCKY
+
+    existing = {row[0] for row in db.query('SHOW DATABASES', rows='tuple',
+                                           limit=None, immediate=True)}
+    if existing.intersection(DATABASES):
+        print('refusing to run: {} already exist(s)'.format(
+            ', '.join(sorted(existing.intersection(DATABASES)))))
+        return 1
+
+    try:
+        for database in DATABASES:
+            db.query('CREATE DATABASE {}'.format(database), no_rows=True)
+        for statement in SCHEMA:
+            db.query(statement, no_rows=True)
+        populate(db, args.users, args.projects, args.assignments,
+                 args.instances, args.seed)
+
+        def join():
+            return query.orphans(db, 'instance')
+
+        def memory():
+            keystone = query.KeystoneMembership.load(db)
+            return query.orphans(db, 'instance', keystone=keystone)
+
+        results = {}
+        print('{:8s} {:>10s} {:>8s}'.format('method', 'seconds', 'orphans'))
+        for name, method in [('join', join), ('memory', memory)]:
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                rows = [tuple(row) for row in method()]
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            results[name] = sorted(rows)
+            print('{:8s} {:10.3f} {:8d}'.format(name, best, len(rows)))
+
+        if results['join'] != results['memory']:
+            print('methods disagree!')
+            return 1
+    finally:
+        for database in DATABASES:
+            db.query('DROP DATABASE IF EXISTS {}'.format(database), no_rows=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,84 @@
+# coding: utf-8
+'''
+Compare calls/sec of one-shot ``requests.get`` against the pooled
+:py:class:`hammers.osrest.base.BaseAPI` session, using a local stub HTTP
+server that speaks HTTP/1.1 keep-alive.
+
+.. code-block:: bash
+
+    python benchmarks/osrest_session.py [-n CALLS]
+'''
+import argparse
+import http.server
+import json
+import sys
+import threading
+import time
+
+import requests
+
+from hammers.osrest.base import BaseAPI
+
+BODY = json.dumps({'nodes': [{'uuid': str(n)} for n in range(20)]}).encode()
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out in separate writes; without this, Nagle and
+    # delayed ACKs stall every kept-alive response by ~40 ms
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubAuth(object):
+    token = 'stub-token'
+
+    def __init__(self, url):
+        self.url = url
+
+    def endpoint(self, type):
+        return self.url
+
+
+def rate(func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    return calls / (time.perf_counter() - start)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--calls', type=int, default=2000)
+    args = parser.parse_args(argv[1:])
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    auth = StubAuth('http://127.0.0.1:{}'.format(server.server_port))
+    api = BaseAPI('baremetal')
+
+    def unpooled():
+        response = requests.get(url=auth.endpoint('baremetal') + '/v1/nodes',
+                                headers=api.headers(auth.token))
+        response.raise_for_status()
+
+    def pooled():
+        api.get(auth, '/v1/nodes')
+
+    print('requests.get (before): {:8.1f} calls/sec'.format(rate(unpooled, args.calls)))
+    print('BaseAPI.get  (after):  {:8.1f} calls/sec'.format(rate(pooled, args.calls)))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,135 @@
+# coding: utf-8
+'''
+Times :py:func:`hammers.scripts.unutilized_lease_reaper.classify_leases`
+sorting synthetic active leases (with their nodes and events, like
+``leases_with_node_details`` gives) into warn and terminate buckets,
+against the two filters and list membership checks it replaced, and
+checks they agree.
+
+.. code-block:: bash
+
+    python benchmarks/unutilized_leases.py [--leases 10000] [--nodes-per-lease 4]
+'''
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from hammers.scripts.unutilized_lease_reaper import (
+    DEFAULT_GRACE_HOURS, DEFAULT_WARN_HOURS, EXCLUDED_PROJECT_IDS, UTC,
+    classify_leases,
+)
+
+NOW = datetime.utcnow().replace(microsecond=0)
+
+
+def synthetic_leases(leases, nodes_per_lease, seed):
+    rng = random.Random(seed)
+    lease_list = []
+    for n in range(leases):
+        start = NOW - timedelta(minutes=rng.randrange(60 * 24))
+        nodes = []
+        for m in range(rng.randint(1, nodes_per_lease * 2 - 1)):
+            # most nodes were deployed on soon after the lease started
+            changed = start + timedelta(minutes=rng.randrange(-60 * 24, 60))
+            nodes.append({
+                'uuid': 'node-{}-{}'.format(n, m),
+                'provision_state': rng.choice(['active'] + ['available'] * 4),
+                'provision_updated_at': changed.isoformat() + '.000000+00:00',
+            })
+        lease_list.append({
+            'id': 'lease{}'.format(n),
+            'name': 'lease-{}'.format(n),
+            'project_id': 'project{}'.format(rng.randrange(500)),
+            'status': 'ACTIVE',
+            'events': [
+                {'event_type': 'start_lease',
+                 'updated_at': start.strftime('%Y-%m-%d %H:%M:%S')},
+                {'event_type': 'before_end_lease', 'updated_at': None},
+                {'event_type': 'end_lease', 'updated_at': None},
+            ],
+            'nodes': nodes,
+        })
+    return lease_list
+
+
+def baseline(leases, warn_period, grace_period):
+    """The per-threshold filters, and O(n^2) warn-only check, as they were."""
+    def inviolation_filter(hour):
+        now = datetime.utcnow().replace(tzinfo=UTC)
+        threshold = now - timedelta(minutes=hour*60)
+
+        def inviolation(lease):
+            start_event = [
+                x for x in lease['events']
+                if x['event_type'] == 'start_lease'].pop()
+            start_time = datetime.strptime(
+                start_event['updated_at'], '%Y-%m-%d %H:%M:%S'
+            ).replace(tzinfo=UTC)
+            if lease['project_id'] in EXCLUDED_PROJECT_IDS:
+                return False
+            if len(lease['nodes']) == 0:
+                return False
+            if start_time > threshold:
+                return False
+            active_nodes = any([
+                x['provision_state'] == 'active'
+                for x in lease['nodes']])
+            provision_state_change = any([
+                datetime.strptime(
+                    x['provision_updated_at'].split('+')[0].split('.')[0],
+                    '%Y-%m-%dT%H:%M:%S').replace(tzinfo=UTC)
+                > start_time
+                for x in lease['nodes']])
+            return not active_nodes and not provision_state_change
+        return inviolation
+
+    warn = list(filter(inviolation_filter(warn_period), leases))
+    terminate = list(filter(inviolation_filter(grace_period), leases))
+    warn_only = [lease for lease in warn if lease not in terminate]
+    return warn, terminate, warn_only
+
+
+def classified(leases, warn_period, grace_period):
+    pairs = classify_leases(leases, [warn_period, grace_period])
+    warn = [lease for lease, _ in pairs]
+    terminate = [lease for lease, hours in pairs if hours >= grace_period]
+    terminate_ids = {lease['id'] for lease in terminate}
+    warn_only = [lease for lease in warn if lease['id'] not in terminate_ids]
+    return warn, terminate, warn_only
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--leases', type=int, default=10000)
+    parser.add_argument('--nodes-per-lease', type=int, default=4)
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv[1:])
+
+    leases = synthetic_leases(args.leases, args.nodes_per_lease, args.seed)
+
+    results = {}
+    print('{:10s} {:>10s} {:>6s} {:>10s}'.format(
+        'method', 'seconds', 'warn', 'terminate'))
+    for name, method in [('baseline', baseline), ('classify', classified)]:
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            warn, terminate, warn_only = method(
+                leases, DEFAULT_WARN_HOURS, DEFAULT_GRACE_HOURS)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results[name] = [[lease['id'] for lease in bucket]
+                         for bucket in (warn, terminate, warn_only)]
+        print('{:10s} {:10.3f} {:6d} {:10d}'.format(
+            name, best, len(warn), len(terminate)))
+
+    if results['baseline'] != results['classify']:
+        print('methods disagree!')
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,179 @@
+# coding: utf-8
+"""
+Consume OpenStack versioned notifications and hand them to functions
+registered by event type, so hammers can react to a node going into error
+or an instance being deleted as it happens instead of polling listings.
+
+:py:class:`AmqpSource` reads from the services' notification exchanges on
+the message bus (``kombu`` is only needed for this); :py:class:`FakeSource`
+is an in-memory stand-in with the same interface.
+"""
+import collections
+import fnmatch
+import json
+import logging
+import queue
+import socket
+
+DEFAULT_TOPIC = 'versioned_notifications'
+# topics each service publishes its versioned notifications on by default
+# (``[DEFAULT]versioned_notifications_topics`` in Ironic,
+# ``[notifications]versioned_notifications_topics`` in Nova)
+DEFAULT_TOPICS = {
+    'ironic': 'ironic_versioned_notifications',
+    'nova': 'versioned_notifications',
+}
+DEFAULT_EXCHANGES = ('ironic', 'nova')
+DEFAULT_QUEUE = 'hammers-events'
+
+Notification = collections.namedtuple(
+    'Notification', ['event_type', 'publisher_id', 'timestamp', 'payload'])
+
+_L = logging.getLogger(__name__)
+
+
+def parse(body):
+    """
+    Turn a message body into a :py:class:`Notification`. Unwraps the
+    oslo.messaging envelope (if any) and the versioned object around the
+    payload, so ``payload`` is just the fields, e.g. ``payload['uuid']``.
+    """
+    if isinstance(body, (bytes, str)):
+        body = json.loads(body)
+    if 'oslo.message' in body:
+        body = json.loads(body['oslo.message'])
+
+    payload = body.get('payload') or {}
+    for key in payload:
+        # ironic_object.data, nova_object.data, ...
+        if key.endswith('_object.data'):
+            payload = payload[key]
+            break
+
+    return Notification(
+        event_type=body['event_type'],
+        publisher_id=body.get('publisher_id'),
+        timestamp=body.get('timestamp'),
+        payload=payload,
+    )
+
+
+class Router(object):
+    """
+    Maps event types (shell-style patterns, e.g.
+    ``baremetal.node.provision_set.*``) to handlers that take a
+    :py:class:`Notification`.
+    """
+
+    def __init__(self):
+        self.routes = []
+
+    def add(self, pattern, handler):
+        self.routes.append((pattern, handler))
+
+    def route(self, pattern):
+        """Decorator form of :py:meth:`add`."""
+        def decorator(handler):
+            self.add(pattern, handler)
+            return handler
+        return decorator
+
+    def dispatch(self, notification):
+        """Call every handler matching the notification. Exceptions are
+        logged, not raised, so one bad event doesn't stop the consumer.
+        Returns the number of handlers called."""
+        called = 0
+        for pattern, handler in self.routes:
+            if not fnmatch.fnmatchcase(notification.event_type, pattern):
+                continue
+            called += 1
+            try:
+                handler(notification)
+            except Exception:
+                _L.exception('handler {!r} failed on {}'.format(
+                    handler, notification.event_type))
+        return called
+
+
+class FakeSource(object):
+    """In-memory source for tests, or trying handlers out by hand."""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def publish(self, event_type, payload, publisher_id='fake',
+                timestamp=None, object_key='nova_object'):
+        """Queue a notification shaped like one from oslo.messaging."""
+        message = {
+            'event_type': event_type,
+            'publisher_id': publisher_id,
+            'timestamp': timestamp,
+            'payload': {object_key + '.data': payload},
+        }
+        self.queue.put({'oslo.version': '2.0',
+                        'oslo.message': json.dumps(message)})
+
+    def consume(self, callback, stop=None):
+        """Pass everything queued to *callback*, then return (or keep
+        waiting until *stop* returns true, if given)."""
+        while True:
+            try:
+                body = self.queue.get(timeout=1 if stop else 0)
+            except queue.Empty:
+                if stop is None or stop():
+                    return
+                continue
+            callback(parse(body))
+
+
+class AmqpSource(object):
+    """
+    Reads notifications from the *exchanges* at *url* (an oslo.messaging
+    ``transport_url``), through a queue of our own so the notifications
+    aren't taken from anyone else listening. The queue goes away when we
+    disconnect, so nothing piles up while not running.
+
+    *topics* maps an exchange to the topic its service publishes on, for
+    those not using the topic in :py:data:`DEFAULT_TOPICS` (or
+    :py:data:`DEFAULT_TOPIC`, for services not listed there).
+    """
+
+    def __init__(self, url, exchanges=DEFAULT_EXCHANGES, topics=None,
+                 queue=DEFAULT_QUEUE):
+        self.url = url
+        self.exchanges = exchanges
+        self.topics = dict(DEFAULT_TOPICS, **(topics or {}))
+        self.queue_name = queue
+
+    def topic(self, exchange):
+        return self.topics.get(exchange, DEFAULT_TOPIC)
+
+    def consume(self, callback, stop=None):
+        """Pass notifications to *callback* until *stop* returns true."""
+        import kombu
+
+        bindings = [
+            kombu.binding(
+                # already declared by the services; don't risk redeclaring
+                # with different durability
+                kombu.Exchange(exchange, type='topic', passive=True),
+                routing_key=self.topic(exchange) + '.*',
+            )
+            for exchange in self.exchanges
+        ]
+        amqp_queue = kombu.Queue(self.queue_name, bindings=bindings,
+                                 durable=False, auto_delete=True)
+
+        def on_message(body, message):
+            try:
+                callback(parse(body))
+            finally:
+                message.ack()
+
+        with kombu.Connection(self.url) as connection:
+            with connection.Consumer(amqp_queue, callbacks=[on_message]):
+                while not (stop and stop()):
+                    try:
+                        connection.drain_events(timeout=1)
+                    except socket.timeout:
+                        connection.heartbeat_check()
@@ -0,0 +1,163 @@
+# coding: utf-8
+"""
+Local mirrors of OpenStack collections that are kept current by asking only
+for what's changed since the last sync, with a full re-listing now and then
+to catch anything the incremental queries can't see (e.g. deleted Ironic
+nodes or Neutron ports).
+
+How "changed since" is asked for depends on the service:
+
+* Nova: the ``changes-since`` filter, which also returns deleted instances
+  so they can be dropped.
+* Ironic and Neutron: list sorted by ``updated_at``, newest first, and stop
+  reading at the high-water mark of the last sync. Records that have never
+  been updated (``updated_at`` is null) only turn up on a full sync.
+
+Blazar can't filter or sort leases server-side, so it isn't mirrored.
+
+Mirrors are stored as JSON, one file per collection in a state directory,
+and locked while syncing so concurrent hammers don't clobber each other.
+"""
+import collections
+import contextlib
+import datetime
+import fcntl
+import json
+import logging
+import os
+import time
+
+from dateutil.parser import isoparse
+
+from hammers import osrest
+
+DEFAULT_FULL_SYNC_INTERVAL = 3600
+# re-ask for a bit before the high-water mark in case of clock skew between
+# API workers, or updates committed out of order
+SINCE_OVERLAP = datetime.timedelta(seconds=60)
+
+Source = collections.namedtuple(
+    'Source', ['key', 'updated', 'full', 'changed', 'deleted'])
+
+
+def _newest_first(items, since, updated='updated_at'):
+    for item in items:
+        if item[updated] is None or isoparse(item[updated]) < since:
+            return
+        yield item
+
+
+SOURCES = {
+    'ironic_nodes': Source(
+        key='uuid',
+        updated='updated_at',
+        full=lambda auth: osrest.ironic.iter_nodes(auth, details=True),
+        changed=lambda auth, since: _newest_first(osrest.ironic.iter_nodes(
+            auth, details=True, sort_key='updated_at', sort_dir='desc'), since),
+        deleted=lambda node: False,
+    ),
+    'neutron_ports': Source(
+        key='id',
+        updated='updated_at',
+        full=osrest.neutron.iter_ports,
+        changed=lambda auth, since: _newest_first(osrest.neutron.iter_ports(
+            auth, sort_key='updated_at', sort_dir='desc'), since),
+        deleted=lambda port: False,
+    ),
+    'nova_instances': Source(
+        key='id',
+        updated='updated',
+        full=lambda auth: osrest.nova.iter_instances(auth, details=True),
+        changed=lambda auth, since: osrest.nova.iter_instances(
+            auth, details=True, **{'changes-since': since.isoformat()}),
+        deleted=lambda server: server['status'] == 'DELETED',
+    ),
+}
+
+
+class Mirror(object):
+    """
+    Mirror of collection *name* (a key of ``SOURCES``), kept in
+    *state_dir*. :py:meth:`sync` brings it up to date and ``items`` is the
+    same dictionary the matching :py:mod:`hammers.osrest` function returns.
+    """
+
+    _L = logging.getLogger(__name__ + '.Mirror')
+
+    def __init__(self, auth, name, state_dir,
+                 full_sync_interval=DEFAULT_FULL_SYNC_INTERVAL):
+        self.auth = auth
+        self.name = name
+        self.source = SOURCES[name]
+        self.path = os.path.join(state_dir, name + '.json')
+        self.full_sync_interval = full_sync_interval
+        self.items = {}
+        self.high_water = None
+        self.full_synced_at = 0
+
+    @contextlib.contextmanager
+    def _locked(self):
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        with os.fdopen(fd, 'r+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield f
+
+    def _load(self, f):
+        try:
+            state = json.load(f)
+        except ValueError:
+            return
+        self.items = state['items']
+        self.high_water = state['high_water'] and isoparse(state['high_water'])
+        self.full_synced_at = state['full_synced_at']
+
+    def _save(self, f):
+        f.seek(0)
+        f.truncate()
+        json.dump({
+            'items': self.items,
+            'high_water': self.high_water and self.high_water.isoformat(),
+            'full_synced_at': self.full_synced_at,
+        }, f)
+
+    def _bump(self, item):
+        updated = item[self.source.updated]
+        if updated is not None:
+            updated = isoparse(updated)
+            if self.high_water is None or updated > self.high_water:
+                self.high_water = updated
+
+    def sync(self, full=False):
+        """Update from the service, re-listing everything if *full* or it's
+        been too long since the last full sync. Returns self."""
+        with self._locked() as f:
+            self._load(f)
+            if (full or self.high_water is None
+                    or time.time() - self.full_synced_at > self.full_sync_interval):
+                self._sync_full()
+            else:
+                self._sync_changes()
+            self._save(f)
+        return self
+
+    def _sync_full(self):
+        key = self.source.key
+        self.items, self.high_water = {}, None
+        for item in self.source.full(self.auth):
+            self.items[item[key]] = item
+            self._bump(item)
+        self.full_synced_at = time.time()
+        self._L.debug('{}: full sync, {} items'.format(self.name, len(self.items)))
+
+    def _sync_changes(self):
+        key = self.source.key
+        changes = 0
+        for item in self.source.changed(self.auth, self.high_water - SINCE_OVERLAP):
+            if self.source.deleted(item):
+                self.items.pop(item[key], None)
+            else:
+                self.items[item[key]] = item
+            self._bump(item)
+            changes += 1
+        self._L.debug('{}: {} changes'.format(self.name, changes))
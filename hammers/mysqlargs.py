@@ -2,7 +2,7 @@
 import configparser
 from urllib.parse import urlparse
 
-from . import MyCnf, MySqlShim
+from . import MyCnf, MySqlShim, MySqlPool, querystats
 
 __all__ = ['MySqlArgs']
 
@@ -40,6 +40,8 @@ class MySqlArgs(object):
         * ``-P``/``--port``
         * ``--service-conf``: A configuration file like ``/etc/ironic/ironic.conf``
           that contains a database connection string.
+        * ``--query-stats``/``--explain-queries``: see
+          :py:mod:`hammers.querystats`
 
         """
         parser.add_argument('-u', '--db-user', type=str,
@@ -64,6 +66,14 @@ class MySqlArgs(object):
                  'Overrides other settings if provided. Looks for section '
                  '"database" with key "connection"'
         )
+        parser.add_argument('--query-stats', type=str, action='append',
+            default=[], metavar='SINK',
+            help='Record timing and row counts of each query to "log", '
+                 '"json:PATH" or "prom:PATH" (Prometheus textfile). Repeatable.'
+        )
+        parser.add_argument('--explain-queries', action='store_true',
+            help='Include EXPLAIN FORMAT=JSON plans in the query stats.'
+        )
 
     def extract(self, args):
         """
@@ -71,6 +81,9 @@ class MySqlArgs(object):
         :py:meth:`argparse.ArgumentParser.parse_args` to generate the
         final set of connection arguments.
         """
+        if getattr(args, 'query_stats', None):
+            querystats.configure(args.query_stats, explain=args.explain_queries)
+
         if args.service_conf:
             cp = configparser.ConfigParser()
             with open(args.service_conf, mode='r') as f:
@@ -96,10 +109,15 @@ class MySqlArgs(object):
                 'port': args.port,
             }
 
-    def connect(self):
+    def connect(self, pool=False, **pool_kwargs):
         """
         Uses the prepared connection arguments and creates a
         :py:class:`hammers.mysqlshim.MySqlShim` object that connects to
         the database.
+
+        If *pool* is true, returns a :py:class:`hammers.mysqlshim.MySqlPool`
+        instead, created with *pool_kwargs* (``size``, ``max_lifetime``...).
         """
+        if pool:
+            return MySqlPool(**dict(self.connect_kwargs, **pool_kwargs))
         return MySqlShim(**self.connect_kwargs)
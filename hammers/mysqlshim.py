@@ -1,11 +1,58 @@
 # coding: utf-8
 
 
+import collections
+import contextlib
+import functools
 import itertools
+import logging
+import queue
+import re
+import threading
+import time
 
 from .query import LIBERTY
 
-__all__ = ['MySqlShim']
+__all__ = ['MySqlShim', 'MySqlPool']
+
+# MySQL client error "Commands out of sync; you can't run this command now"
+CR_COMMANDS_OUT_OF_SYNC = 2014
+ROW_MODES = {'dict', 'tuple', 'record', 'columns'}
+# statements that don't leave anything behind in a transaction to lose
+READ_VERBS = {'select', 'show', 'explain', 'describe', 'desc'}
+LOCKING_READ = re.compile(r'\bfor\s+update\b|\block\s+in\s+share\s+mode\b',
+                          re.IGNORECASE)
+
+
+class _Record(object):
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self._index[key]
+        return tuple.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return self._index.keys()
+
+
+@functools.lru_cache(maxsize=128)
+def record_class(fields):
+    """
+    A :py:func:`~collections.namedtuple` class for rows with the column
+    names *fields* (a tuple). Besides attributes, the columns can be looked
+    up like a dictionary, ``row['name']``, including any names (like
+    ``COUNT(*)``) that aren't valid identifiers.
+    """
+    base = collections.namedtuple('Record', fields, rename=True)
+    index = {field: n for n, field in enumerate(fields)}
+    return type('Record', (_Record, base), {'__slots__': (), '_index': index})
 
 
 class MySqlShim(object):
@@ -14,23 +61,72 @@ class MySqlShim(object):
     directly to :py:func:`MySQLdb.connect`
 
     This class provides some quality-of-life stuff like providing column
-    names and emitting dictionaries for rows.
+    names and emitting dictionaries (or other shapes, see :py:meth:`query`)
+    for rows.
+
+    Queries run with ``stream=True`` use an unbuffered, server-side cursor so
+    rows are fetched as they're iterated over rather than all up front. Only
+    one stream can be open on the connection; starting another query first
+    reads off and discards whatever is left of an unfinished one.
+
+    A query that finds the connection out of step (error 2014) reconnects
+    and runs again, unless something written since the last
+    :py:meth:`commit` or :py:meth:`rollback` would be lost that way, in
+    which case the error is raised.
     """
     batch_size = 100
     limit = 1000
+    row_mode = 'dict'
+
+    _L = logging.getLogger(__name__ + '.MySqlShim')
 
     def __init__(self, **connect_args):
         # lazy load so to avoid installing the Python
         # package which also requires the MySQL headers...
         import MySQLdb
+        import MySQLdb.cursors
 
+        self._MySQLdb = MySQLdb
+        self.connect_args = connect_args
         self.db = MySQLdb.connect(**connect_args)
         self.cursor = self.db.cursor()
+        self.connected_at = time.monotonic()
         self.version = LIBERTY
+        self._stream = None
+        self._in_transaction = False
+
+    def reconnect(self):
+        """Drop the connection and open a new one. Anything uncommitted is
+        lost."""
+        self._stream = None
+        try:
+            self.db.close()
+        except self._MySQLdb.Error:
+            pass
+        self.db = self._MySQLdb.connect(**self.connect_args)
+        self.cursor = self.db.cursor()
+        self.connected_at = time.monotonic()
+        self._in_transaction = False
+
+    def commit(self):
+        self.db.commit()
+        self._in_transaction = False
+
+    def rollback(self):
+        self.db.rollback()
+        self._in_transaction = False
+
+    def ping(self):
+        """Check the connection is alive, reconnecting if it isn't."""
+        try:
+            self.db.ping()
+        except self._MySQLdb.Error:
+            self._L.info('connection lost, reconnecting')
+            self.reconnect()
 
-    def columns(self):
+    def columns(self, cursor=None):
         """Returns column names from the most recent query."""
-        return [cd[0] for cd in self.cursor.description]
+        return [cd[0] for cd in (cursor or self.cursor).description]
 
     def query(self, *cargs, **ckwargs):
         '''
@@ -43,28 +139,285 @@ class MySqlShim(object):
             database or else you may not complete the transaction.
         :param bool immediate: If true, immediately runs the query and puts it
             into a list. Otherwise, an iterator is returned.
+        :param bool stream: If true, rows are read from the server as they're
+            iterated over instead of all at once when the query runs, so
+            memory use doesn't grow with the size of the result. Iterate to
+            the end (or ``close()`` the iterator) before expecting the next
+            query to start promptly.
+        :param str rows: Shape of the rows, cheapest first:
+
+            * ``'tuple'``: tuples of values, as the cursor returns them.
+            * ``'record'``: :py:func:`record_class` instances, read-only, that
+              can be indexed by column name like dictionaries.
+            * ``'dict'`` (default): a dictionary per row.
+            * ``'columns'``: instead of rows, returns a dictionary mapping
+              each column name to a list of its values.
         '''
         limit = ckwargs.pop('limit', self.limit)
+        rows = ckwargs.pop('rows', self.row_mode)
+        if rows not in ROW_MODES:
+            raise ValueError('rows must be one of {}, not {!r}'.format(
+                sorted(ROW_MODES), rows))
 
         if ckwargs.pop('no_rows', False):
             return self._query_no_rows(*cargs, **ckwargs)
 
-        if ckwargs.pop('immediate', False):
+        immediate = ckwargs.pop('immediate', False)
+        if rows == 'columns':
+            return self._query_columns(limit, *cargs, **ckwargs)
+        ckwargs['rows'] = rows
+
+        if immediate:
             return list(itertools.islice(self._query(*cargs, **ckwargs), limit))
         else:
             return itertools.islice(self._query(*cargs, **ckwargs), limit)
 
     def _query(self, *cargs, **ckwargs):
-        self.cursor.execute(*cargs, **ckwargs)
+        stream = ckwargs.pop('stream', False)
+        mode = ckwargs.pop('rows', self.row_mode)
+        cursor = self._execute(stream, *cargs, **ckwargs)
+
+        try:
+            fields = self.columns(cursor)
+            if mode == 'tuple':
+                make = None
+            elif mode == 'record':
+                # skip namedtuple._make's per-row method call
+                make = functools.partial(tuple.__new__,
+                                         record_class(tuple(fields)))
+            else:
+                make = lambda row: dict(zip(fields, row))
+
+            rows = cursor.fetchmany(self.batch_size)
+            while rows:
+                if make is None:
+                    yield from rows
+                else:
+                    yield from map(make, rows)
+                rows = cursor.fetchmany(self.batch_size)
+        finally:
+            # unless another query already finished it off
+            if stream and self._stream is cursor:
+                self._end_stream()
+
+    def _query_columns(self, limit, *cargs, **ckwargs):
+        stream = ckwargs.pop('stream', False)
+        cursor = self._execute(stream, *cargs, **ckwargs)
+
+        try:
+            fields = self.columns(cursor)
+            columns = [[] for _ in fields]
+            count = 0
+            while limit is None or count < limit:
+                size = self.batch_size
+                if limit is not None:
+                    size = min(size, limit - count)
+                rows = cursor.fetchmany(size)
+                if not rows:
+                    break
+                count += len(rows)
+                for column, values in zip(columns, zip(*rows)):
+                    column.extend(values)
+        finally:
+            if stream and self._stream is cursor:
+                self._end_stream()
 
-        fields = self.columns()
-        rows = self.cursor.fetchmany(self.batch_size)
-        while rows:
-            for row in rows:
-                yield dict(zip(fields, row))
-            rows = self.cursor.fetchmany(self.batch_size)
+        return dict(zip(fields, columns))
 
     def _query_no_rows(self, *cargs, **ckwargs):
         # split function as _query is a generator, this isn't, so doesn't
         # need to be consumed
-        return self.cursor.execute(*cargs, **ckwargs)
+        return self._execute(False, *cargs, **ckwargs).rowcount
+
+    def _execute(self, stream, *cargs, **ckwargs):
+        """Run a query on the shared cursor, or on a new server-side one if
+        *stream*, and return the cursor."""
+        self._end_stream()
+        for attempt in range(2):
+            if stream:
+                cursor = self.db.cursor(self._MySQLdb.cursors.SSCursor)
+            else:
+                cursor = self.cursor
+            try:
+                cursor.execute(*cargs, **ckwargs)
+            except (self._MySQLdb.ProgrammingError,
+                    self._MySQLdb.OperationalError) as e:
+                if attempt or e.args[0] != CR_COMMANDS_OUT_OF_SYNC:
+                    raise
+                if self._in_transaction:
+                    # starting over would silently drop the writes made so
+                    # far, leaving the caller to commit the rest alone
+                    raise
+                # some result wasn't read off the connection; there's no
+                # getting it back in step but to start over
+                self._L.warning('connection out of sync, reconnecting')
+                self.reconnect()
+            else:
+                break
+        self._track_transaction(cargs[0] if cargs else ckwargs.get('query', ''))
+        if stream:
+            self._stream = cursor
+        return cursor
+
+    def _track_transaction(self, sql):
+        """Note whether *sql*, just run, leaves a transaction open that
+        reconnecting would lose. Reads don't, unless they lock rows, nor
+        does anything with autocommit on, bar an explicit ``BEGIN``. Use
+        :py:meth:`commit` and :py:meth:`rollback` (rather than those of
+        ``db``) so the transaction is known to be over."""
+        if isinstance(sql, bytes):
+            sql = sql.decode('utf-8', 'replace')
+        words = sql.lstrip(' \t\r\n(').split(None, 1)
+        verb = words[0].lower() if words else ''
+        if verb in ('commit', 'rollback'):
+            self._in_transaction = False
+        elif verb in ('begin', 'start'):
+            self._in_transaction = True
+        elif not self._in_transaction and (
+                verb not in READ_VERBS or LOCKING_READ.search(sql)):
+            self._in_transaction = not self.db.get_autocommit()
+
+    def _end_stream(self):
+        """Finish off the open stream, if any, so the connection can be
+        used again."""
+        cursor, self._stream = self._stream, None
+        if cursor is None:
+            return
+        try:
+            # discard what's left a batch at a time, keeping memory flat
+            while cursor.fetchmany(self.batch_size):
+                pass
+            cursor.close()
+        except self._MySQLdb.Error:
+            self._L.warning('failed to finish stream, reconnecting',
+                            exc_info=True)
+            self.reconnect()
+
+
+class MySqlPool(object):
+    """
+    Hands out :py:class:`MySqlShim` connections, up to *size* of them, so
+    long-running processes reuse connections and callers can, for example,
+    stream from one connection while writing on another. ``connect_args``
+    are passed to each :py:class:`MySqlShim`.
+
+    Connections are pinged before being handed out and reopened once they're
+    older than *max_lifetime* seconds (keep it under the server's
+    ``wait_timeout``). Anything left uncommitted is rolled back when a
+    connection is returned, so use :py:meth:`transaction` (or commit) for
+    writes.
+
+    .. code-block:: python
+
+        with pool.connection() as reader, pool.transaction() as writer:
+            for alloc in query.blazar_find_old_host_alloc(reader):
+                query.blazar_old_host_alloc_delete(writer, alloc['id'])
+    """
+    size = 4
+    max_lifetime = 3600
+    timeout = 60
+
+    _L = logging.getLogger(__name__ + '.MySqlPool')
+
+    def __init__(self, size=None, max_lifetime=None, timeout=None,
+                 **connect_args):
+        if size is not None:
+            self.size = size
+        if max_lifetime is not None:
+            self.max_lifetime = max_lifetime
+        if timeout is not None:
+            self.timeout = timeout
+        self.connect_args = connect_args
+        self.version = LIBERTY
+
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _checkout(self):
+        with self._lock:
+            create = self._idle.empty() and self._opened < self.size
+            if create:
+                self._opened += 1
+        if create:
+            try:
+                return MySqlShim(**self.connect_args)
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+
+        try:
+            shim = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise RuntimeError('no database connection free after {} seconds'
+                               .format(self.timeout))
+        if time.monotonic() - shim.connected_at > self.max_lifetime:
+            shim.reconnect()
+        else:
+            shim.ping()
+        return shim
+
+    def _checkin(self, shim):
+        try:
+            shim._end_stream()
+            shim.rollback()
+        except shim._MySQLdb.Error:
+            self._L.warning('discarding broken connection', exc_info=True)
+            with self._lock:
+                self._opened -= 1
+            return
+        self._idle.put(shim)
+
+    def free(self):
+        """How many connections could be lent right now without waiting:
+        the idle ones, and those not yet opened."""
+        with self._lock:
+            return self._idle.qsize() + self.size - self._opened
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Context manager lending a :py:class:`MySqlShim`."""
+        shim = self._checkout()
+        shim.version = self.version
+        try:
+            yield shim
+        finally:
+            self._checkin(shim)
+
+    @contextlib.contextmanager
+    def cursor(self, stream=False):
+        """Context manager lending a bare ``MySQLdb`` cursor on its own
+        connection, server-side (unbuffered) if *stream*."""
+        with self.connection() as shim:
+            if stream:
+                cursor = shim.db.cursor(shim._MySQLdb.cursors.SSCursor)
+            else:
+                cursor = shim.db.cursor()
+            try:
+                yield cursor
+            finally:
+                cursor.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Context manager lending a :py:class:`MySqlShim` whose changes are
+        committed if the block completes, or rolled back if it raises."""
+        with self.connection() as shim:
+            try:
+                yield shim
+            except BaseException:
+                shim.rollback()
+                raise
+            shim.commit()
+
+    def close(self):
+        """Close the idle connections."""
+        while True:
+            try:
+                shim = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                self._opened -= 1
+            shim.db.close()
@@ -12,8 +12,13 @@ exacerbated by the Blazar client being fairly nacent.
 """
 
 
+import collections
+import contextlib
 import datetime
+import fcntl
 import getpass
+import hashlib
+import json
 import logging
 import os
 import re
@@ -24,6 +29,9 @@ import requests
 
 
 OS_ENV_PREFIX = 'OS_'
+INTERFACES = ['public', 'internal', 'admin']
+# cached tokens this close to expiring aren't handed out
+TOKEN_CACHE_MARGIN = datetime.timedelta(minutes=5)
 
 
 def add_arguments(parser):
@@ -34,6 +42,11 @@ def add_arguments(parser):
     """
     parser.add_argument('--osrc', type=str,
         help='OpenStack parameters file that overrides envvars.')
+    parser.add_argument('--os-interface', type=str, choices=INTERFACES,
+        help='Endpoint interface to use (overrides OS_INTERFACE, defaulting '
+             'to public). Use "internal" when running on a controller.')
+    parser.add_argument('--token-cache', type=str, metavar='DIR',
+        help='Directory to cache Keystone tokens in, shared between runs.')
 
 
 def load_osrc(fn, get_pass=False):
@@ -70,14 +83,83 @@ def load_osrc(fn, get_pass=False):
     return rc
 
 
+class TokenCache(object):
+    """
+    Keeps a token, its expiry and the service catalog in a file under
+    *directory* so that later processes using the same credentials can skip
+    authenticating with Keystone. There's one file per set of credentials,
+    named by a hash of the RC values and only readable by the owner.
+    """
+
+    _L = logging.getLogger(__name__ + '.TokenCache')
+
+    def __init__(self, directory):
+        self.directory = os.path.expanduser(directory)
+
+    def path(self, rc):
+        digest = hashlib.sha256(
+            json.dumps(sorted(rc.items())).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, '{}.json'.format(digest))
+
+    @contextlib.contextmanager
+    def locked(self, rc):
+        """
+        Context manager that holds an exclusive lock on the cache file for
+        *rc*, yielding the open file. Other processes wanting the same
+        credentials wait rather than authenticating at the same time.
+        """
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        fd = os.open(self.path(rc), os.O_RDWR | os.O_CREAT, 0o600)
+        os.fchmod(fd, 0o600)
+        with os.fdopen(fd, 'r+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield f
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read(self, f):
+        """Returns the cached entry from the locked file, or ``None`` if it's
+        empty, unreadable or about to expire."""
+        f.seek(0)
+        try:
+            entry = json.load(f)
+            entry['expires_at'] = dateparse(entry['expires_at'])
+        except (ValueError, KeyError, TypeError):
+            return None
+
+        remaining = entry['expires_at'] - datetime.datetime.now(tz=tzutc())
+        if remaining < TOKEN_CACHE_MARGIN:
+            return None
+        return entry
+
+    def write(self, f, token, expiry, catalog):
+        f.seek(0)
+        f.truncate()
+        json.dump({
+            'token': token,
+            'expires_at': expiry.isoformat(),
+            'catalog': catalog,
+        }, f)
+        f.flush()
+
+
 class Auth(object):
     """
     The Auth object consumes credentials and provides tokens and endpoints.
     Create either directly by providing a mapping with the keys in
     ``required_os_vars`` or via the :py:meth:`Auth.from_env_or_args` method.
+
+    Endpoints are looked up for the *interface* given, else ``OS_INTERFACE``
+    (or ``OS_ENDPOINT_TYPE``) from the RC values, else ``public``.
+
+    If *token_cache* (a directory or :py:class:`TokenCache`) is provided,
+    a token from a previous run is reused until shortly before it expires.
+    Otherwise ``Auth.default_token_cache`` is used, if it's been set.
     """
 
     _L = logging.getLogger(__name__ + '.Auth')
+    default_token_cache = None
 
     required_os_vars = {
         'OS_USERNAME',
@@ -106,9 +188,10 @@ class Auth(object):
             os_vars = {k: os.environ[k] for k in os.environ if k.startswith(OS_ENV_PREFIX)}
         if args and args.osrc:
             os_vars.update(load_osrc(args.osrc))
-        return cls(os_vars)
+        return cls(os_vars, interface=getattr(args, 'os_interface', None),
+                   token_cache=getattr(args, 'token_cache', None))
 
-    def __init__(self, rc):
+    def __init__(self, rc, interface=None, token_cache=None):
         self.rc = rc
         missing_vars = self.required_os_vars - set(rc)
         if 'OS_PROJECT_DOMAIN_NAME' not in self.rc and 'OS_PROJECT_DOMAIN_ID' not in self.rc:
@@ -121,12 +204,48 @@ class Auth(object):
             self.auth_url += '/v3'
 
         self.region = self.rc.get('OS_REGION_NAME', None)
+        if interface is None:
+            interface = (self.rc.get('OS_INTERFACE')
+                         or self.rc.get('OS_ENDPOINT_TYPE')
+                         or 'public')
+        # also accept the old-style "internalURL", etc.
+        self.interface = interface.lower().replace('url', '')
+        if token_cache is None:
+            token_cache = self.default_token_cache
+        if isinstance(token_cache, str):
+            token_cache = TokenCache(token_cache)
+        self.token_cache = token_cache
         self.authenticate()
 
     def authenticate(self):
         """
-        Authenticate with Keystone to get a token and endpoint listing
+        Authenticate with Keystone to get a token and endpoint listing, or
+        pick up an unexpired one from the token cache, if there is one.
         """
+        if self.token_cache is None:
+            self._request_token()
+            return
+
+        with self.token_cache.locked(self.rc) as f:
+            cached = self.token_cache.read(f)
+            # re-authenticating explicitly shouldn't hand back the same token
+            if cached is not None and cached['token'] != getattr(self, '_token', None):
+                self._set_token(cached['token'], cached['expires_at'], cached['catalog'])
+                self._L.debug('Reusing cached token, expires in {:.2f} minutes'.format(
+                    (self.expiry - datetime.datetime.now(tz=tzutc())).total_seconds() / 60
+                ))
+                return
+
+            self._request_token()
+            self.token_cache.write(f, self._token, self.expiry, self.service_catalog)
+
+    def _set_token(self, token, expiry, catalog):
+        self._token = token
+        self.service_catalog = catalog
+        self.expiry = expiry
+        self._index_catalog()
+
+    def _request_token(self):
         if 'OS_PROJECT_DOMAIN_ID' in self.rc:
             domain_info = {"id": self.rc['OS_PROJECT_DOMAIN_ID']}
         else:
@@ -170,9 +289,11 @@ class Auth(object):
             )
 
         json = response.json()
-        self._token = response.headers['x-subject-token']
-        self.service_catalog = json['token']['catalog']
-        self.expiry = dateparse(json['token']['expires_at'])
+        self._set_token(
+            response.headers['x-subject-token'],
+            dateparse(json['token']['expires_at']),
+            json['token']['catalog'],
+        )
 
         self._L.debug('New token "{}" expires in {:.2f} minutes'.format(
             self._token,
@@ -191,32 +312,44 @@ class Auth(object):
 
         return self._token
 
-    def endpoint(self, type):
+    def _index_catalog(self):
+        """
+        Build the ``(type, interface, region) -> url`` mapping that
+        :py:meth:`endpoint` looks up, once per (re)authentication.
+        """
+        index = {}
+        service_counts = collections.Counter()
+        for service in self.service_catalog:
+            # skip services with no endpoints, because kvm site contains artifacts from older version.
+            if not service['endpoints']:
+                continue
+            service_counts[service['type']] += 1
+            for e in service['endpoints']:
+                index.setdefault(
+                    (service['type'], e['interface'], e.get('region')),
+                    e['url'])
+
+        self._ambiguous_types = {t for t, n in service_counts.items() if n > 1}
+        self._endpoints = index
+
+    def endpoint(self, type, interface=None):
         """
         Find the endpoint for a given service *type*. Examples include ``compute`` for Nova,
-        ``reservation`` for Blazar, or ``image`` for Glance.
+        ``reservation`` for Blazar, or ``image`` for Glance. *interface*
+        (``public``, ``internal`` or ``admin``) overrides the one the object
+        was created with.
         """
-        # add filter service['endpoints'] is not empty, because kvm site contains artifacts from older version.
-        services = [
-            service
-            for service
-            in self.service_catalog
-            if service['type'] == type and len(service['endpoints']) > 0
-        ]
-        if len(services) < 1:
-            raise RuntimeError("didn't find any services matching type '{}'".format(type))
-        elif len(services) > 1:
+        if type in self._ambiguous_types:
             raise RuntimeError("found multiple services matching type '{}'".format(type))
-        service = services[0]
-        endpoint = [
-            e for e in service['endpoints']
-            if e['interface'] == 'public' and e['region'] == self.region
-        ][0]
-
-        if not endpoint:
-            raise RuntimeError("didn't find endpoint for service")
+        try:
+            return self._endpoints[(type, interface or self.interface, self.region)]
+        except KeyError:
+            pass
 
-        return endpoint['url']
+        if not any(key[0] == type for key in self._endpoints):
+            raise RuntimeError("didn't find any services matching type '{}'".format(type))
+        raise RuntimeError("didn't find {} endpoint for service '{}' in region '{}'".format(
+            interface or self.interface, type, self.region))
 
 
 class Authv2(object):
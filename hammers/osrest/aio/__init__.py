@@ -0,0 +1,14 @@
+"""
+Asyncio flavor of :py:mod:`hammers.osrest`. Each submodule mirrors the
+shim functions of the same name as coroutines, e.g.
+``await aio.ironic.node(auth, node_id)``.
+"""
+from . import blazar
+from . import glance
+from . import ironic
+from . import keystone
+from . import neutron
+from . import nova
+from . import placement
+
+from .base import coroutine, gather_map, run, set_concurrency
@@ -0,0 +1,76 @@
+"""
+Plumbing to run the blocking :py:mod:`hammers.osrest` shims as coroutines.
+
+Calls are made with the same pooled sessions as the synchronous shims, on a
+shared thread pool, so each coroutine only waits on its own HTTP round trip.
+Each service has a concurrency limit so a big fan-out doesn't flood one API.
+"""
+import asyncio
+import functools
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from hammers.osrest.base import BaseAPI
+
+DEFAULT_CONCURRENCY = 8
+MAX_WORKERS = 32
+
+_limits = {}
+_semaphores = weakref.WeakKeyDictionary()
+_executor = None
+
+
+def set_concurrency(service, limit):
+    """Allow at most *limit* calls in flight to *service* (e.g.
+    ``'placement'``), growing its connection pool to match."""
+    _limits[service] = limit
+    for api in BaseAPI.instances:
+        if api.service == service and api.pool_size < limit:
+            api.configure(pool_size=limit)
+
+
+def _semaphore(service):
+    # asyncio primitives are bound to the loop they're first used on
+    loop = asyncio.get_running_loop()
+    by_service = _semaphores.setdefault(loop, {})
+    if service not in by_service:
+        by_service[service] = asyncio.Semaphore(
+            _limits.get(service, DEFAULT_CONCURRENCY))
+    return by_service[service]
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS,
+                                       thread_name_prefix='osrest-aio')
+    return _executor
+
+
+def coroutine(func, api):
+    """Wrap blocking *func*, which talks to the service of *api*, as a
+    coroutine function with the same signature."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        async with _semaphore(api.service):
+            return await asyncio.get_running_loop().run_in_executor(
+                _get_executor(), functools.partial(func, *args, **kwargs))
+    return wrapper
+
+
+async def gather_map(func, auth, items, *args, **kwargs):
+    """
+    Concurrently await ``func(auth, item, *args, **kwargs)`` for each of
+    *items*, returning the results in the same order. Pass
+    ``return_exceptions=True`` to get exceptions back in place of results
+    rather than failing on the first one.
+    """
+    return_exceptions = kwargs.pop('return_exceptions', False)
+    return await asyncio.gather(
+        *(func(auth, item, *args, **kwargs) for item in items),
+        return_exceptions=return_exceptions)
+
+
+def run(coro):
+    """Run *coro* to completion from synchronous code."""
+    return asyncio.run(coro)
@@ -0,0 +1,11 @@
+"""Coroutine versions of :py:mod:`hammers.osrest.blazar`."""
+from hammers.osrest import blazar as _sync
+from hammers.osrest.aio.base import coroutine
+
+host = coroutine(_sync.host, _sync.API)
+hosts = coroutine(_sync.hosts, _sync.API)
+host_update = coroutine(_sync.host_update, _sync.API)
+leases = coroutine(_sync.leases, _sync.API)
+lease = coroutine(_sync.lease, _sync.API)
+lease_delete = coroutine(_sync.lease_delete, _sync.API)
+host_allocations = coroutine(_sync.host_allocations, _sync.API)
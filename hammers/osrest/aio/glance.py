@@ -0,0 +1,11 @@
+"""Coroutine versions of :py:mod:`hammers.osrest.glance`."""
+from hammers.osrest import glance as _sync
+from hammers.osrest.aio.base import coroutine
+
+images = coroutine(_sync.images, _sync.API)
+image = coroutine(_sync.image, _sync.API)
+image_create = coroutine(_sync.image_create, _sync.API)
+image_delete = coroutine(_sync.image_delete, _sync.API)
+image_tag = coroutine(_sync.image_tag, _sync.API)
+image_untag = coroutine(_sync.image_untag, _sync.API)
+image_properties = coroutine(_sync.image_properties, _sync.API)
@@ -0,0 +1,9 @@
+"""Coroutine versions of :py:mod:`hammers.osrest.ironic`."""
+from hammers.osrest import ironic as _sync
+from hammers.osrest.aio.base import coroutine
+
+node = coroutine(_sync.node, _sync.API)
+node_set_state = coroutine(_sync.node_set_state, _sync.API)
+node_update = coroutine(_sync.node_update, _sync.API)
+nodes = coroutine(_sync.nodes, _sync.API)
+ports = coroutine(_sync.ports, _sync.API)
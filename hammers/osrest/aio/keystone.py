@@ -0,0 +1,10 @@
+"""Coroutine versions of :py:mod:`hammers.osrest.keystone`."""
+from hammers.osrest import keystone as _sync
+from hammers.osrest.aio.base import coroutine
+
+project = coroutine(_sync.project, _sync.API)
+projects = coroutine(_sync.projects, _sync.API)
+project_lookup = coroutine(_sync.project_lookup, _sync.API)
+user = coroutine(_sync.user, _sync.API)
+users = coroutine(_sync.users, _sync.API)
+user_lookup = coroutine(_sync.user_lookup, _sync.API)
@@ -0,0 +1,12 @@
+"""Coroutine versions of :py:mod:`hammers.osrest.neutron`."""
+from hammers.osrest import neutron as _sync
+from hammers.osrest.aio.base import coroutine
+
+floatingip_delete = coroutine(_sync.floatingip_delete, _sync.API)
+floatingips = coroutine(_sync.floatingips, _sync.API)
+network = coroutine(_sync.network, _sync.API)
+networks = coroutine(_sync.networks, _sync.API)
+port_delete = coroutine(_sync.port_delete, _sync.API)
+ports = coroutine(_sync.ports, _sync.API)
+subnet = coroutine(_sync.subnet, _sync.API)
+subnets = coroutine(_sync.subnets, _sync.API)
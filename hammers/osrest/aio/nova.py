@@ -0,0 +1,15 @@
+"""Coroutine versions of :py:mod:`hammers.osrest.nova`."""
+from hammers.osrest import nova as _sync
+from hammers.osrest.aio.base import coroutine
+
+hypervisors = coroutine(_sync.hypervisors, _sync.API)
+instance = coroutine(_sync.instance, _sync.API)
+instances = coroutine(_sync.instances, _sync.API)
+instances_details = coroutine(_sync.instances_details, _sync.API)
+aggregates = coroutine(_sync.aggregates, _sync.API)
+aggregate_details = coroutine(_sync.aggregate_details, _sync.API)
+aggregate_delete = coroutine(_sync.aggregate_delete, _sync.API)
+aggregate_add_host = coroutine(_sync.aggregate_add_host, _sync.API)
+aggregate_remove_host = coroutine(_sync.aggregate_remove_host, _sync.API)
+aggregate_move_host = coroutine(_sync.aggregate_move_host, _sync.API)
+availabilityzones = coroutine(_sync.availabilityzones, _sync.API)
@@ -0,0 +1,6 @@
+"""Coroutine versions of :py:mod:`hammers.osrest.placement`."""
+from hammers.osrest import placement as _sync
+from hammers.osrest.aio.base import coroutine
+
+resource_providers = coroutine(_sync.resource_providers, _sync.API)
+resource_provider = coroutine(_sync.resource_provider, _sync.API)
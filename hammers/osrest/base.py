@@ -1,12 +1,84 @@
+import threading
+from urllib.parse import urlsplit
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from hammers.osrest import cache
+
+
+DEFAULT_POOL_SIZE = 10
+# (connect, read) in seconds, see requests' "Timeouts" docs
+DEFAULT_TIMEOUT = (10, 300)
+DEFAULT_PAGE_SIZE = 500
 
 
 class BaseAPI:
+    """
+    Service API accessor. Each instance owns a :py:class:`requests.Session`
+    so that connections to the service endpoint are pooled and kept alive
+    across calls instead of paying for a fresh TCP+TLS handshake every time.
+
+    :param str service: service type to look up in the catalog
+    :param dict extra_headers: headers sent with every request
+    :param int pool_size: connections kept open per endpoint host
+    :param timeout: seconds, or a ``(connect, read)`` tuple, passed to
+        every request
+    :param bool keep_alive: if false, ask the server to close the
+        connection after each response
+    """
+    instances = []
 
-    def __init__(self, service, extra_headers=None):
+    def __init__(self, service, extra_headers=None,
+                 pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT,
+                 keep_alive=True):
 
         self.service = service
         self.extra_headers = extra_headers
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+
+        self._session = None
+        self._session_lock = threading.Lock()
+        BaseAPI.instances.append(self)
+
+    @property
+    def session(self):
+        """Lazily-created session shared by all calls to this service."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._new_session()
+        return self._session
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size,
+                              pool_maxsize=self.pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def configure(self, pool_size=None, timeout=None, keep_alive=None):
+        """Change connection settings. The existing session (if any) is
+        closed and a new one is created on the next call."""
+        if pool_size is not None:
+            self.pool_size = pool_size
+        if timeout is not None:
+            self.timeout = timeout
+        if keep_alive is not None:
+            self.keep_alive = keep_alive
+        self.close()
+
+    def close(self):
+        """Close pooled connections."""
+        with self._session_lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
 
     def headers(self, token, content_type=None):
         headers = {'X-Auth-Token': token}
@@ -18,35 +90,131 @@ class BaseAPI:
 
         return headers
 
-    def get(self, auth, path, params=None):
-        response = requests.get(url=auth.endpoint(self.service) + path,
-                                params=params,
-                                headers=self.headers(auth.token))
+    def request(self, method, auth, path, content_type=None, **kwargs):
+        return self.request_url(method, auth, auth.endpoint(self.service) + path,
+                                content_type=content_type, **kwargs)
+
+    def request_url(self, method, auth, url, content_type=None, **kwargs):
+        store = cache.active()
+        if store is not None and method != 'GET':
+            store.invalidate(auth.endpoint(self.service))
+
+        response = self.session.request(
+            method,
+            url=url,
+            headers=self.headers(auth.token, content_type),
+            timeout=self.timeout,
+            **kwargs)
         response.raise_for_status()
         return response
 
+    def paginate(self, auth, path, key, params=None,
+                 page_size=DEFAULT_PAGE_SIZE, marker_key='id'):
+        """
+        Generator over the items in the *key* list of a collection at
+        *path*, fetching a page at a time and yielding as each one arrives.
+
+        Follows whichever "next" link the service provides (``<key>_links``
+        for Nova/Neutron, ``next`` for Ironic/Glance, ``links.next`` for
+        Keystone). If there's no link but a full page came back, asks for the
+        following page with ``marker`` set to the last item's *marker_key*.
+        A page longer than *page_size* means the service ignored ``limit``
+        and sent everything, and one ending on the marker asked for means it
+        ignored ``marker``; either way, that's the end of the listing.
+        A *page_size* of ``None`` doesn't send ``limit`` at all, for services
+        that don't understand it.
+
+        If the :py:mod:`hammers.osrest.cache` is on, a recent enough copy of
+        the whole listing is served from it, and a listing that's read to
+        the end is stored there.
+        """
+        store = cache.active()
+        if store is None:
+            yield from self._paginate(auth, path, key, params, page_size,
+                                      marker_key)
+            return
+
+        endpoint = auth.endpoint(self.service)
+        cache_params = dict(params or {}, limit=page_size, key=key)
+        items = store.get(auth, self.service, endpoint, path, cache_params)
+        if items is not None:
+            yield from items
+            return
+
+        items = []
+        for item in self._paginate(auth, path, key, params, page_size,
+                                   marker_key):
+            items.append(item)
+            yield item
+        store.put(auth, self.service, endpoint, path, cache_params, items)
+
+    def _paginate(self, auth, path, key, params, page_size, marker_key):
+        endpoint = auth.endpoint(self.service)
+        base_params = dict(params or {})
+        if page_size:
+            base_params['limit'] = page_size
+        url, params = endpoint + path, base_params
+        seen = set()
+
+        while True:
+            body = self.request_url('GET', auth, url, params=params).json()
+            items = body[key]
+            marker = (params or {}).get('marker')
+            if marker is not None and items and \
+                    items[-1][marker_key] == marker:
+                # the marker was ignored and we got the same page again
+                return
+            for item in items:
+                yield item
+
+            next_url = _next_link(body, key)
+            if next_url:
+                if not urlsplit(next_url).scheme:
+                    # Glance's links are relative to the endpoint
+                    next_url = endpoint + next_url
+                url, params = next_url, None
+                page = next_url
+            elif page_size and items and len(items) == page_size:
+                # a longer page means the limit was ignored and that was all
+                url = endpoint + path
+                params = dict(base_params, marker=items[-1][marker_key])
+                page = params['marker']
+            else:
+                return
+
+            if page in seen:
+                return
+            seen.add(page)
+
+    def get(self, auth, path, params=None):
+        return self.request('GET', auth, path, params=params)
+
     def post(self, auth, path, json):
-        response = requests.post(url=auth.endpoint(self.service) + path,
-                                 headers=self.headers(auth.token), json=json)
-        response.raise_for_status()
-        return response
+        return self.request('POST', auth, path, json=json)
 
     def put(self, auth, path, json):
-        response = requests.put(url=auth.endpoint(self.service) + path,
-                                headers=self.headers(auth.token), json=json)
-        response.raise_for_status()
-        return response
+        return self.request('PUT', auth, path, json=json)
 
     def delete(self, auth, path):
-        response = requests.delete(url=auth.endpoint(self.service) + path,
-                                   headers=self.headers(auth.token))
-        response.raise_for_status()
-        return response
+        return self.request('DELETE', auth, path)
 
-    def patch(self, auth, path, content_type, json):
-        response = requests.patch(url=auth.endpoint(self.service) + path,
-                                  headers=self.headers(auth.token,
-                                                       content_type),
-                                  json=json)
-        response.raise_for_status()
-        return response
+    def patch(self, auth, path, content_type=None, json=None):
+        return self.request('PATCH', auth, path, content_type=content_type,
+                            json=json)
+
+
+def _next_link(body, key):
+    for link in body.get(key + '_links') or []:
+        if link.get('rel') == 'next':
+            return link['href']
+    links = body.get('links')
+    if isinstance(links, dict):
+        return links.get('next')
+    return body.get('next')
+
+
+def configure(pool_size=None, timeout=None, keep_alive=None):
+    """Apply :py:meth:`BaseAPI.configure` to every service API."""
+    for api in BaseAPI.instances:
+        api.configure(pool_size=pool_size, timeout=timeout,
+                      keep_alive=keep_alive)
@@ -13,9 +13,9 @@ def host(auth, host_id):
 
 def hosts(auth):
     """Retrieves all hosts, returning a dictionary keyed by ID."""
-    response = API.get(auth, '/os-hosts')
+    hosts = API.paginate(auth, '/os-hosts', 'hosts', page_size=None)
 
-    return {h['id']: h for h in response.json()['hosts']}
+    return {h['id']: h for h in hosts}
 
 
 def host_update(auth, host_id, values_payload):
@@ -27,8 +27,9 @@ def host_update(auth, host_id, values_payload):
 
 def leases(auth, all_tenants=True):
     """Retrieves all leases, returning a dictionary keyed by ID"""
-    response = API.get(auth, '/leases', params={'all_tenants': all_tenants})
-    return {l['id']: l for l in response.json()['leases']}
+    leases = API.paginate(auth, '/leases', 'leases',
+                          params={'all_tenants': all_tenants}, page_size=None)
+    return {l['id']: l for l in leases}
 
 
 def lease(auth, lease_id):
@@ -47,9 +48,8 @@ def lease_delete(auth, lease_id):
 
 def host_allocations(auth):
     """Retrieve host allocations"""
-    response = API.get(auth, '/os-hosts/allocations')
-
-    return response.json()['allocations']
+    return list(API.paginate(auth, '/os-hosts/allocations', 'allocations',
+                             page_size=None))
 
 
 __all__ = [
@@ -0,0 +1,166 @@
+"""
+Optional on-disk cache of collection listings made with
+:py:meth:`hammers.osrest.base.BaseAPI.paginate`, so several hammers running
+within a few minutes of each other can share one download of, e.g., the
+Ironic node details.
+
+Listings are stored in a SQLite file keyed by the credentials they were
+fetched with, endpoint, path and query parameters, so a user never sees what
+another user's (or project's) listing returned. An entry is used if it's
+younger than both the collection's TTL and the ``max_staleness`` the cache
+was configured with, and each store drops entries too old to ever be used.
+Any write made through :py:class:`~hammers.osrest.base.BaseAPI` drops that
+endpoint's entries.
+
+Disabled unless :py:func:`configure` is called. Scripts using
+:py:func:`hammers.util.base_parser` pass their arguments to
+:py:func:`configure_from_args` to honour ``--max-staleness``.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+
+DEFAULT_PATH = '/var/cache/hammers/osrest.sqlite'
+DEFAULT_TTL = 300
+SCHEMA_VERSION = 2
+# seconds, by (service type, collection path)
+TTLS = {
+    ('baremetal', '/v1/nodes'): 300,
+    ('baremetal', '/v1/nodes/detail'): 300,
+    ('baremetal', '/v1/ports/detail'): 900,
+    ('compute', '/servers'): 120,
+    ('compute', '/servers/detail'): 120,
+    ('compute', '/os-aggregates'): 120,
+    ('network', '/v2.0/ports'): 120,
+    ('network', '/v2.0/floatingips'): 120,
+    ('reservation', '/leases'): 300,
+    ('reservation', '/os-hosts'): 900,
+    ('reservation', '/os-hosts/allocations'): 300,
+    ('placement', '/resource_providers'): 900,
+    ('identity', '/v3/users'): 900,
+    ('image', '/v2/images'): 900,
+}
+
+_L = logging.getLogger(__name__)
+_active = None
+
+
+class ListCache(object):
+    """SQLite-backed store of listings. See the module docs."""
+
+    def __init__(self, path=DEFAULT_PATH, max_staleness=None, ttls=None):
+        self.path = path
+        self.max_staleness = max_staleness
+        self.ttls = TTLS if ttls is None else ttls
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+        with self._connect() as db:
+            if db.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+                # entries from an older layout aren't scoped, start over
+                db.execute('DROP TABLE IF EXISTS listings')
+                db.execute('PRAGMA user_version = {:d}'.format(SCHEMA_VERSION))
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS listings (
+                    scope TEXT,
+                    endpoint TEXT,
+                    path TEXT,
+                    params TEXT,
+                    fetched_at REAL,
+                    items TEXT,
+                    PRIMARY KEY (scope, endpoint, path, params)
+                )''')
+            db.execute('CREATE INDEX IF NOT EXISTS listings_fetched_at '
+                       'ON listings (fetched_at)')
+        os.chmod(self.path, 0o600)
+
+    def _connect(self):
+        # one connection per use, so it's safe across threads and processes
+        return sqlite3.connect(self.path, timeout=30)
+
+    def ttl(self, service, path):
+        ttl = self.ttls.get((service, path), DEFAULT_TTL)
+        if self.max_staleness is not None:
+            ttl = min(ttl, self.max_staleness)
+        return ttl
+
+    def longest_ttl(self):
+        """How old an entry can be and still be used for any collection, by
+        any process sharing the file."""
+        return max([DEFAULT_TTL] + list(self.ttls.values()))
+
+    def get(self, auth, service, endpoint, path, params):
+        """Returns the list of items cached for the credentials of *auth*, or
+        ``None`` if missing or too old."""
+        oldest = time.time() - self.ttl(service, path)
+        with self._connect() as db:
+            row = db.execute(
+                'SELECT items FROM listings '
+                'WHERE scope = ? AND endpoint = ? AND path = ? AND params = ? '
+                'AND fetched_at >= ?',
+                (_scope_key(auth), endpoint, path, _params_key(params),
+                 oldest)).fetchone()
+        if row is None:
+            return None
+        _L.debug('cache hit for {}{}'.format(endpoint, path))
+        return json.loads(row[0])
+
+    def put(self, auth, service, endpoint, path, params, items):
+        """Stores *items* for the credentials of *auth*, and drops entries
+        too old to be used again (listings with ever-changing parameters,
+        like Nova's ``changes-since``, would otherwise pile up)."""
+        now = time.time()
+        with self._connect() as db:
+            db.execute('DELETE FROM listings WHERE fetched_at < ?',
+                       (now - self.longest_ttl(),))
+            db.execute(
+                'INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?, ?, ?)',
+                (_scope_key(auth), endpoint, path, _params_key(params), now,
+                 json.dumps(items)))
+
+    def invalidate(self, endpoint):
+        """Drop everything cached from *endpoint*."""
+        with self._connect() as db:
+            db.execute('DELETE FROM listings WHERE endpoint = ?', (endpoint,))
+
+
+def _params_key(params):
+    return json.dumps(sorted((params or {}).items()), default=str)
+
+
+def _scope_key(auth):
+    # who's asking: the RC values bar the password, like TokenCache's names
+    rc = {k: v for k, v in getattr(auth, 'rc', {}).items()
+          if k != 'OS_PASSWORD'}
+    rc['interface'] = getattr(auth, 'interface', None)
+    return hashlib.sha256(
+        json.dumps(sorted(rc.items()), default=str).encode('utf-8')).hexdigest()
+
+
+def configure(path=DEFAULT_PATH, max_staleness=None, ttls=None):
+    """Turn on the cache for this process. A *max_staleness* of 0 turns it
+    back off."""
+    global _active
+    if max_staleness == 0:
+        _active = None
+    else:
+        _active = ListCache(path, max_staleness=max_staleness, ttls=ttls)
+    return _active
+
+
+def configure_from_args(args, path=DEFAULT_PATH):
+    """Turn on the cache if the namespace from a
+    :py:func:`hammers.util.base_parser` has ``--max-staleness`` set."""
+    max_staleness = getattr(args, 'max_staleness', None)
+    if max_staleness is None:
+        return active()
+    return configure(path, max_staleness=max_staleness)
+
+
+def active():
+    """The configured :py:class:`ListCache`, or ``None``."""
+    return _active
@@ -10,18 +10,23 @@ from hammers.osrest.base import BaseAPI
 API = BaseAPI('image')
 
 
-def images(auth, query=None):
+def iter_images(auth, query=None):
     """
-    Retrieves all images, filtered by `query`, if provided.
-
-    Doesn't support pagination. Don't request too many.
+    Generator over all images, filtered by `query`, if provided. Pages are
+    requested as they're consumed.
 
     For querying, accepts a dictionary. If the value is a non-string iterable,
     the key is repeated in the query with each element in the iterable.
     """
-    response = API.get(auth, '/v2/images', params=query)
+    return API.paginate(auth, '/v2/images', 'images', params=query)
+
 
-    return response.json()['images']
+def images(auth, query=None):
+    """
+    Retrieves all images as a list, filtered by `query`, if provided. See
+    :py:func:`iter_images`.
+    """
+    return list(iter_images(auth, query=query))
 
 
 def image(auth, id=None, name=None):
@@ -53,18 +53,27 @@ def node_update(auth, node, **kwargs):
     return response.json()
 
 
+def iter_nodes(auth, details=False, **params):
+    """Generator over all nodes, a page at a time."""
+    path = '/v1/nodes/detail' if details else '/v1/nodes'
+
+    return API.paginate(auth, path, 'nodes', params=params, marker_key='uuid')
+
+
 def nodes(auth, details=False):
     """Retrieves all nodes, with more info if `details` is true."""
-    response = API.get(auth, '/v1/nodes/detail' if details else '/v1/nodes')
+    return {n['uuid']: n for n in iter_nodes(auth, details=details)}
 
-    return {n['uuid']: n for n in response.json()['nodes']}
+
+def iter_ports(auth, **params):
+    """Generator over all Ironic ports (with details), a page at a time."""
+    return API.paginate(auth, '/v1/ports/detail', 'ports', params=params,
+                        marker_key='uuid')
 
 
 def ports(auth):
     """Retrieves all Ironic ports, returns a dictionary keyed by the port ID"""
-    response = API.get(auth, '/v1/ports/detail')
-
-    return {n['uuid']: n for n in response.json()['ports']}
+    return {n['uuid']: n for n in iter_ports(auth)}
 
 
 __all__ = [
@@ -54,17 +54,22 @@ def user(auth, id):
     return response.json()['user']
 
 
-def users(auth, enabled=None, name=None):
-    """Retrieve multiple users, optionally filtered."""
+def iter_users(auth, enabled=None, name=None):
+    """Generator over users, optionally filtered. Follows ``links.next``
+    if the server paginates; Keystone doesn't take a ``limit``."""
     params = {}
     if name is not None:
         params['name'] = name
     if enabled is not None:
         params['enabled'] = enabled
 
-    response = API.get(auth, '/v3/users', params=params)
+    return API.paginate(auth, '/v3/users', 'users', params=params,
+                        page_size=None)
+
 
-    return {u['id']: u for u in response.json()['users']}
+def users(auth, enabled=None, name=None):
+    """Retrieve multiple users, optionally filtered."""
+    return {u['id']: u for u in iter_users(auth, enabled=enabled, name=name)}
 
 
 def user_lookup(auth, name_or_id):
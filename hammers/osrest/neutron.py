@@ -17,11 +17,15 @@ def floatingip_delete(auth, floatingip):
     return response
 
 
+def iter_floatingips(auth, **params):
+    """Generator over all floating IPs, a page at a time."""
+    return API.paginate(auth, '/v2.0/floatingips', 'floatingips',
+                        params=params)
+
+
 def floatingips(auth):
     """Get all floating IPs, returns a dictionary keyed by ID."""
-    response = API.get(auth, '/v2.0/floatingips')
-
-    return {fip['id']: fip for fip in response.json()['floatingips']}
+    return {fip['id']: fip for fip in iter_floatingips(auth)}
 
 
 def network(auth, net):
@@ -51,12 +55,14 @@ def port_delete(auth, port):
     return response
 
 
+def iter_ports(auth, **params):
+    """Generator over all ports, a page at a time."""
+    return API.paginate(auth, '/v2.0/ports', 'ports', params=params)
+
+
 def ports(auth):
     """Get all ports. Returns a dictionary keyed by port ID."""
-    response = API.get(auth,  '/v2.0/ports')
-    response.raise_for_status()
-    data = response.json()
-    return {n['id']: n for n in data['ports']}
+    return {n['id']: n for n in iter_ports(auth)}
 
 
 def subnet(auth, subnet):
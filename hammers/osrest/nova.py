@@ -19,18 +19,20 @@ def instance(auth, id):
     return response.json()['server']
 
 
-def instances(auth, **params):
+def iter_instances(auth, details=False, **params):
+    """Generator over all instances (of all tenants), a page at a time."""
     params['all_tenants'] = 1
-    response = API.get(auth, '/servers', params=params)
+    path = '/servers/detail' if details else '/servers'
 
-    return {s['id']: s for s in response.json()['servers']}
+    return API.paginate(auth, path, 'servers', params=params)
 
 
-def instances_details(auth, **params):
-    params['all_tenants'] = 1
-    response = API.get(auth, '/servers/detail', params=params)
+def instances(auth, **params):
+    return {s['id']: s for s in iter_instances(auth, **params)}
+
 
-    return {s['id']: s for s in response.json()['servers']}
+def instances_details(auth, **params):
+    return {s['id']: s for s in iter_instances(auth, details=True, **params)}
 
 
 def reset_state(auth, id, state='error'):
@@ -40,9 +42,10 @@ def reset_state(auth, id, state='error'):
 
 
 def aggregates(auth):
-    response = API.get(auth, '/os-aggregates')
+    aggregates = API.paginate(auth, '/os-aggregates', 'aggregates',
+                              page_size=None)
 
-    return {int(a['id']): a for a in response.json()['aggregates']}
+    return {int(a['id']): a for a in aggregates}
 
 
 def aggregate_details(auth, agg_id):
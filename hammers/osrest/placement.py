@@ -5,9 +5,8 @@ API = BaseAPI('placement')
 
 
 def resource_providers(auth):
-    response = API.get(auth, '/resource_providers')
-
-    return response.json()['resource_providers']
+    return list(API.paginate(auth, '/resource_providers',
+                             'resource_providers', page_size=None))
 
 
 def resource_provider(auth, resource_provider_id, category,
@@ -1,17 +1,30 @@
 # coding: utf-8
 
+import collections
+from concurrent.futures import ThreadPoolExecutor
 import functools
+import heapq
+import itertools
+import queue
+import threading
+
+from . import querystats
 
 LIBERTY = 'liberty'
 ROCKY = 'rocky'
 QUERIES = {}
+DEFAULT_CHUNK_SIZE = 500
 
 
 def query(q):
-    '''Decorator to include all the queries into a dictionary'''
+    '''
+    Decorator to include all the queries into a dictionary, instrumented
+    with :py:func:`hammers.querystats.instrument`.
+    '''
     global QUERIES
-    QUERIES[q.__name__] = {'f': q}
-    return q
+    instrumented = querystats.instrument(q)
+    QUERIES[q.__name__] = {'f': instrumented, 'raw': q}
+    return instrumented
 
 
 def project_col(version):
@@ -27,8 +40,264 @@ def project_col(version):
     }[version]
 
 
+def chunks(iterable, size):
+    '''Split *iterable* into lists of at most *size* items.'''
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def bulk_update(db, sql_template, ids, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''
+    Run the write *sql_template* with its ``{ids}`` placeholder filled by
+    ``%s, %s, ...`` for each chunk of (deduplicated) *ids*, all in one
+    transaction that's rolled back if a chunk fails. The caller commits.
+
+    Returns a list of ``(chunk_ids, affected_rows)`` for each chunk.
+    '''
+    ids = list(dict.fromkeys(ids))
+    results = []
+    try:
+        for chunk in chunks(ids, chunk_size):
+            sql = sql_template.format(ids=', '.join(['%s'] * len(chunk)))
+            results.append((chunk, db.query(sql, args=chunk, no_rows=True)))
+    except Exception:
+        db.rollback()
+        raise
+    return results
+
+
+def chunked_in(db, sql_template, ids, chunk_size=DEFAULT_CHUNK_SIZE,
+               pool=None, **query_kwargs):
+    '''
+    Run the read *sql_template* with its ``{ids}`` placeholder filled by
+    ``%s, %s, ...`` for each chunk of (deduplicated) *ids*, and stream the
+    rows of each chunk in turn. *query_kwargs* (``rows``, ...) are passed
+    to :py:meth:`hammers.mysqlshim.MySqlShim.query`; the ``columns`` row
+    mode isn't supported.
+
+    Given a :py:class:`hammers.mysqlshim.MySqlPool` as *pool*, the chunks
+    run concurrently on its connections rather than on *db*, as many of
+    them ahead of the one being read as the pool had connections free when
+    the first chunk was read. Rows still come in chunk order. If none were
+    free (say the caller holds them all), the chunks run on *db* instead.
+    '''
+    query_kwargs.setdefault('limit', None)
+    statements = (
+        (sql_template.format(ids=', '.join(['%s'] * len(chunk))), chunk)
+        for chunk in chunks(dict.fromkeys(ids), int(chunk_size))
+    )
+
+    width = pool.free() if pool is not None else 0
+    if width < 1:
+        for sql, chunk in statements:
+            yield from db.query(sql, args=chunk, **query_kwargs)
+        return
+
+    def run(sql, chunk):
+        with pool.connection() as conn:
+            return conn.query(sql, args=chunk, immediate=True, **query_kwargs)
+
+    with ThreadPoolExecutor(max_workers=width) as executor:
+        pending = collections.deque()
+        for sql, chunk in statements:
+            pending.append(executor.submit(run, sql, chunk))
+            if len(pending) >= width:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+class _Feed(object):
+    '''
+    Streams the rows of a query run on a pooled connection in a thread of
+    its own, handed over in batches through a short queue so a slow reader
+    holds the query back rather than buffering all of it.
+    '''
+    batch_size = 1000
+    depth = 4
+
+    def __init__(self, pool, sql, args, query_kwargs):
+        self.pool = pool
+        self.sql = sql
+        self.args = args
+        self.query_kwargs = query_kwargs
+        self.batches = queue.Queue(self.depth)
+        self.closed = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def _run(self):
+        try:
+            with self.pool.connection() as conn:
+                rows = conn.query(self.sql, args=self.args, stream=True,
+                                  **self.query_kwargs)
+                for batch in chunks(rows, self.batch_size):
+                    if not self._put(batch):
+                        return
+        except Exception as e:
+            self._put(e)
+        else:
+            self._put(None)
+
+    def _put(self, item):
+        # give up if the reader has gone away
+        while not self.closed.is_set():
+            try:
+                self.batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self.batches.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield from item
+        finally:
+            self.closed.set()
+
+
+def fan_out(db, statements, pool=None, key=None, **query_kwargs):
+    '''
+    Run each of *statements*, ``(sql, args)`` pairs (usually the same query
+    on each cell database), and stream all of their rows: one statement's
+    after another, or if *key* is given, merged in its order, which each
+    statement's rows must already be sorted in. *query_kwargs* (``rows``,
+    ...) are passed to :py:meth:`hammers.mysqlshim.MySqlShim.query`.
+
+    Given a :py:class:`hammers.mysqlshim.MySqlPool` as *pool*, the
+    statements run at once on connections of their own, so it takes about
+    as long as the slowest rather than all of them together. Only the
+    connections free at the start are counted on, so a caller holding some
+    of the pool's doesn't wait on itself: unmerged statements run as many
+    at a time as there were free, and merged ones, which all need to run
+    at once, fall back to *db* if there weren't enough.
+    '''
+    query_kwargs.setdefault('limit', None)
+    statements = list(statements)
+
+    width = pool.free() if pool is not None else 0
+    if key is not None and width < len(statements):
+        width = 0
+    if width > 0:
+        feeds = [_Feed(pool, sql, args, query_kwargs) for sql, args in statements]
+        try:
+            if key is None:
+                # keep as many running as there were connections free
+                for feed in feeds[:width]:
+                    feed.start()
+                for n, feed in enumerate(feeds):
+                    yield from feed
+                    if n + width < len(feeds):
+                        feeds[n + width].start()
+            else:
+                yield from heapq.merge(*(feed.start() for feed in feeds),
+                                       key=key)
+        finally:
+            # let any still running finish if we stopped reading early
+            for feed in feeds:
+                feed.closed.set()
+        return
+
+    if key is None:
+        # nothing runs until iterated over, so each stream is read to the
+        # end before the next starts
+        for sql, args in statements:
+            yield from db.query(sql, args=args, stream=True, **query_kwargs)
+    else:
+        # only one stream at a time on a connection, so read them in first
+        yield from heapq.merge(
+            *(db.query(sql, args=args, immediate=True, **query_kwargs)
+              for sql, args in statements),
+            key=key)
+
+
+def _merge_idle_projects(rows):
+    '''
+    Combine per-cell :py:func:`idle_projects` rows, in cell order, into one
+    per project. A project without a deletion date in any cell is dropped.
+    '''
+    latest_for_project = {}
+    for row in rows:
+        if row['id'] in latest_for_project:
+            # no date = ignore
+            if latest_for_project[row['id']]['latest_deletion'] is None:
+                # already ignored
+                continue
+            if row['latest_deletion'] is None:
+                # ignored from now on
+                latest_for_project[row['id']]['latest_deletion'] = None
+                continue
+            latest_for_project[row['id']]['latest_deletion'] = max(
+                # otherwise get latest
+                row['latest_deletion'],
+                latest_for_project[row['id']]['latest_deletion']
+            )
+        else:
+            latest_for_project[row['id']] = row
+
+    return [row for row in latest_for_project.values() if row['latest_deletion']]
+
+
+def _idle_projects_aggregate(db, projcol, novatables):
+    '''
+    :py:func:`idle_projects` for all the cells in *novatables* in one query,
+    counting each cell's instances per project once in a derived table
+    rather than with two correlated subqueries per floating IP. Rows come
+    out in cell order, then by number of down floating IPs like the
+    original.
+    '''
+    # MAX(deleted_at) matches ORDER BY deleted_at DESC LIMIT 1, as NULLs
+    # sort last. A NULL vm_state makes "running" NULL, and not counted,
+    # like it fails the WHERE of the COUNT(*) it replaces.
+    instances_template = '''
+        SELECT {cell} AS cell
+             , project_id
+             , SUM(deleted_at IS NULL
+                   AND vm_state != "deleted"
+                   AND vm_state != "error") AS running
+             , MAX(deleted_at) AS latest_deletion
+        FROM   {novatable}.instances
+        GROUP  BY project_id'''
+    sql = '''
+    SELECT project.id
+         , project.name
+         , MAX(instance.latest_deletion) AS latest_deletion
+    FROM   neutron.floatingips AS ip
+    JOIN   keystone.project AS project
+        ON ip.{projcol} = project.id
+    CROSS JOIN ({cells}) AS cell
+    LEFT JOIN ({instances}) AS instance
+        ON instance.cell = cell.cell
+       AND instance.project_id = project.id
+    WHERE  ip.status = "down"
+           AND COALESCE(instance.running, 0) = 0
+    GROUP  BY cell.cell, ip.{projcol}
+    ORDER  BY cell.cell, Count(*) DESC;
+    '''.format(
+        projcol=projcol,
+        cells=' UNION ALL '.join(
+            'SELECT {} AS cell'.format(n) for n in range(len(novatables))),
+        instances=' UNION ALL '.join(
+            instances_template.format(cell=n, novatable=t)
+            for n, t in enumerate(novatables)),
+    )
+    return db.query(sql, limit=None, rows='dict')
+
+
 @query
-def idle_projects(db):
+def idle_projects(db, method='subquery', pool=None):
     '''
     Returns rows enumerating all projects that are currently idle (number
     of running instances = 0). Also provides since when the project has been
@@ -36,6 +305,13 @@ def idle_projects(db):
 
     There may be NULLs emitted for "latest_deletion" if a project hasn't ever
     had an instance (like an admin project...).
+
+    The default *method*, ``subquery``, looks up each floating IP's project's
+    instances with correlated subqueries, once per cell database.
+    ``aggregate`` gives the same results from a single query that
+    aggregates the instances per project up front, which is much faster
+    with lots of instances. With a *pool*, ``subquery`` queries the cell
+    databases at the same time (see :py:func:`fan_out`).
     '''
     sql_template = '''
     SELECT project.id
@@ -63,39 +339,26 @@ def idle_projects(db):
     '''
 
     projcol = project_col(db.version)
-    old_sql = sql_template.format(projcol=projcol, novatable='nova')
-
+    novatables = ['nova']
     if db.version == 'rocky':
         # smash together data from two databases. newer openstack split the database
         # into nova (legacy?) and nova_cell0 (new schema? distributed?)
-        new_sql = sql_template.format(projcol=projcol, novatable='nova_cell0')
-
-        merged = list(db.query(old_sql, limit=None)) + list(db.query(new_sql, limit=None))
-
-        latest_for_project = {}
-        for row in merged:
-            if row['id'] in latest_for_project:
-                # no date = ignore
-                if latest_for_project[row['id']] is None:
-                    # already ignored
-                    continue
-                if row['latest_deletion'] is None:
-                    # ignored from now on
-                    latest_for_project[row['id']]['latest_deletion'] = None
-                    continue
-                latest_for_project[row['id']]['latest_deletion'] = max(
-                    # otherwise get latest
-                    row['latest_deletion'],
-                    latest_for_project[row['id']]['latest_deletion']
-                )
-            else:
-                latest_for_project[row['id']] = row
-
-        results = [row for row in latest_for_project.values() if row['latest_deletion']]
-        return results
-
+        novatables.append('nova_cell0')
+
+    if method == 'aggregate':
+        rows = _idle_projects_aggregate(db, projcol, novatables)
+    elif method == 'subquery':
+        rows = fan_out(
+            db,
+            [(sql_template.format(projcol=projcol, novatable=t), None)
+             for t in novatables],
+            pool=pool, rows='dict')
     else:
-        return db.query(old_sql, limit=None)
+        raise ValueError('unknown method "{}"'.format(method))
+
+    if len(novatables) == 1:
+        return rows
+    return _merge_idle_projects(rows)
 
 
 _LATEST_INSTANCE_DATABASES = {
@@ -110,6 +373,11 @@ def latest_instance_interaction(db, nova_db_name='nova'):
     Combine as you so desire.
     '''
     #TODO: used in neutron_reaper for KVM site; remove this function with neutron_reaper after KVM upgrading
+    sql = _latest_instance_interaction_sql(nova_db_name) + ';'
+    return db.query(sql, limit=None, stream=True, rows='record')
+
+
+def _latest_instance_interaction_sql(nova_db_name):
     if nova_db_name not in _LATEST_INSTANCE_DATABASES:
         # can't parameterize a database name
         raise RuntimeError('invalid database selection')
@@ -117,7 +385,7 @@ def latest_instance_interaction(db, nova_db_name='nova'):
     first_col = 'project_id'
     second_col = 'project_id'
 
-    sql = '''\
+    return '''\
     SELECT
         {first_col} AS name,
         {second_col} AS id,
@@ -126,35 +394,59 @@ def latest_instance_interaction(db, nova_db_name='nova'):
         MAX(deleted_at is NULL) > 0 AS active
     FROM
         {table}
-    GROUP BY project_id;
-    '''.format(first_col=first_col, second_col=second_col,table=table)
-    return db.query(sql, limit=None)
+    GROUP BY project_id'''.format(first_col=first_col, second_col=second_col,table=table)
+
+
+@query
+def latest_instance_interactions(db, nova_db_names=('nova', 'nova_cell0'),
+                                 pool=None):
+    '''
+    :py:func:`latest_instance_interaction` combined over *nova_db_names*:
+    a row per project, with its latest interaction in any of them, and
+    active if active in any. The databases are queried at the same time if
+    given a *pool*, and merged as they stream in (see :py:func:`fan_out`).
+    '''
+    # BINARY sorts like Python compares strings, for the merge
+    order = '\n    ORDER BY BINARY project_id;'
+    statements = [(_latest_instance_interaction_sql(name) + order, None)
+                  for name in nova_db_names]
+    rows = fan_out(db, statements, pool=pool, key=lambda row: row['id'],
+                   rows='record')
+    for _, project_rows in itertools.groupby(rows, key=lambda row: row['id']):
+        project_rows = list(project_rows)
+        interactions = [row['latest_interaction'] for row in project_rows
+                        if row['latest_interaction'] is not None]
+        yield project_rows[0]._replace(
+            latest_interaction=max(interactions) if interactions else None,
+            active=max(row['active'] for row in project_rows),
+        )
 
 
 @query
-def owned_ips(db, project_ids):
+def owned_ips(db, project_ids, chunk_size=DEFAULT_CHUNK_SIZE, pool=None):
     '''
     Return all IPs associated with *project_ids*
 
-    Maria 5.5 in production doesn't seem to like this, but works fine with
-    a local MySQL 5.7. Is it Maria? 5.5? Too many? See owned_ip_single for one
-    that works, but need to call multiple times.
+    Maria 5.5 in production didn't seem to like this with all the IDs in one
+    ``IN``, but worked fine with a local MySQL 5.7. Is it Maria? 5.5? Too
+    many? They're now looked up *chunk_size* at a time (see
+    :py:func:`chunked_in`), which keeps each statement small.
     '''
     sql = '''
     SELECT id
          , status
          , {projcol} AS project_id
     FROM   neutron.floatingips
-    WHERE  {projcol} IN %s;
+    WHERE  {projcol} IN ({{ids}});
     '''.format(projcol=project_col(db.version))
-    return db.query(sql, args=[project_ids], limit=None)
+    return chunked_in(db, sql, project_ids, chunk_size, pool=pool, rows='dict')
 
 
 @query
-def floating_ips_to_leases(db, floating_ip_ids):
-    """Return the leases for a tuple of floating ip ids."""
-    floating_ips_varargs = ','.join(['%s'] * len(floating_ip_ids))
-
+def floating_ips_to_leases(db, floating_ip_ids, chunk_size=DEFAULT_CHUNK_SIZE,
+                           pool=None):
+    """Return the leases for a tuple of floating ip ids, looked up
+    *chunk_size* at a time (see :py:func:`chunked_in`)."""
     sql = '''
     SELECT bl.id AS lease_id
         , bl.end_date AS end_date
@@ -168,10 +460,10 @@ def floating_ips_to_leases(db, floating_ip_ids):
     LEFT JOIN blazar.reservations br ON bca.reservation_id=br.id
     LEFT JOIN blazar.leases bl ON br.lease_id=bl.id
     WHERE bl.project_id=nfi.project_id
-        AND nfi.id IN ({floating_ips_varargs});
-    '''.format(floating_ips_varargs=floating_ips_varargs)
-
-    return db.query(sql, args=floating_ip_ids, limit=None)
+        AND nfi.id IN ({ids});
+    '''
+    return chunked_in(db, sql, floating_ip_ids, chunk_size, pool=pool,
+                      rows='dict')
 
 
 @query
@@ -192,7 +484,7 @@ def owned_compute_ip_single(db, project_id):
          AND
          ( p.device_owner LIKE 'compute%%' OR p.id is NULL );
     '''.format(projcol=project_col(db.version))
-    return db.query(sql, args=[project_id], limit=None)
+    return db.query(sql, args=[project_id], limit=None, rows='record')
 
 
 @query
@@ -222,7 +514,7 @@ def idle_not_reserved_floating_ips(db, threshold_days):
     AND p.id IS NULL
     AND s.updated_at < UTC_TIMESTAMP() - INTERVAL %s DAY;
     '''
-    return db.query(sql, args=[threshold_days], limit=None)
+    return db.query(sql, args=[threshold_days], limit=None, rows='record')
 
 
 @query
@@ -234,7 +526,7 @@ def projects_with_unowned_ports(db, version='liberty'):
     WHERE  device_owner = ''
     GROUP  BY {projcol};
     '''.format(projcol=project_col(db.version))
-    return db.query(sql, limit=None)
+    return db.query(sql, limit=None, rows='dict')
 
 
 @query
@@ -252,7 +544,118 @@ def owned_compute_port_single(db, project_id):
          AND
          device_owner LIKE 'compute%%';
     '''.format(projcol=project_col(db.version))
-    return db.query(sql, args=[project_id], limit=None)
+    return db.query(sql, args=[project_id], limit=None, rows='record')
+
+
+# projects in a nova database without active instances, and no interaction
+# with any for more than some seconds; as latest_instance_interaction
+# (rows not 'active', 'latest_interaction' too old) but in the database
+_IDLE_PROJECTS_SQL = '''
+    SELECT   project_id
+    FROM     {nova_db_name}.instances
+    GROUP BY project_id
+    HAVING   MAX(deleted_at IS NULL) = 0
+             AND MAX(IFNULL(deleted_at, IFNULL(updated_at, created_at)))
+                 < UTC_TIMESTAMP() - INTERVAL %s SECOND'''
+
+
+def _idle_projects_subquery(nova_db_name):
+    if nova_db_name not in _LATEST_INSTANCE_DATABASES:
+        # can't parameterize a database name
+        raise RuntimeError('invalid database selection')
+    return _IDLE_PROJECTS_SQL.format(nova_db_name=nova_db_name)
+
+
+@query
+def idle_owned_compute_ips(db, idle_days, nova_db_name='nova'):
+    '''
+    :py:func:`owned_compute_ip_single` for every project that's had no
+    active instances, or interactions with any, for *idle_days*, in one
+    query.
+    '''
+    sql = '''
+    SELECT f.id
+         , f.status
+         , f.{projcol} AS project_id
+    FROM   neutron.floatingips AS f
+    JOIN   ({idle}) AS idle
+    ON f.{projcol} = idle.project_id
+    LEFT JOIN  neutron.ports AS p
+    ON f.fixed_port_id = p.id
+    WHERE
+         p.device_owner LIKE 'compute%%' OR p.id is NULL;
+    '''.format(projcol=project_col(db.version),
+               idle=_idle_projects_subquery(nova_db_name))
+    return db.query(sql, args=[float(idle_days) * 86400], limit=None,
+                    rows='record')
+
+
+@query
+def idle_owned_compute_ports(db, idle_days, nova_db_name='nova'):
+    '''
+    :py:func:`owned_compute_port_single` for every project that's had no
+    active instances, or interactions with any, for *idle_days*, in one
+    query.
+    '''
+    sql = '''
+    SELECT p.id
+         , p.status
+         , p.{projcol} AS project_id
+    FROM   neutron.ports AS p
+    JOIN   ({idle}) AS idle
+    ON p.{projcol} = idle.project_id
+    WHERE
+         p.device_owner LIKE 'compute%%';
+    '''.format(projcol=project_col(db.version),
+               idle=_idle_projects_subquery(nova_db_name))
+    return db.query(sql, args=[float(idle_days) * 86400], limit=None,
+                    rows='record')
+
+
+@query
+def owned_compute_ips(db, project_ids, chunk_size=DEFAULT_CHUNK_SIZE,
+                      pool=None):
+    '''
+    :py:func:`owned_compute_ip_single` for all *project_ids*, with a query
+    per *chunk_size* of them (see :py:func:`chunked_in`). Large ``IN`` lists
+    are what seemed to upset Maria 5.5 with :py:func:`owned_ips`; a
+    *chunk_size* of 1 is the same as calling the single version for each.
+    '''
+    sql_template = '''
+    SELECT f.id
+         , f.status
+         , f.{projcol} AS project_id
+    FROM   neutron.floatingips AS f
+    LEFT JOIN  neutron.ports AS p
+    ON f.fixed_port_id = p.id
+    WHERE
+         f.{projcol} IN ({{ids}})
+         AND
+         ( p.device_owner LIKE 'compute%%' OR p.id is NULL );
+    '''.format(projcol=project_col(db.version))
+    return chunked_in(db, sql_template, project_ids, chunk_size, pool=pool,
+                      rows='record')
+
+
+@query
+def owned_compute_ports(db, project_ids, chunk_size=DEFAULT_CHUNK_SIZE,
+                        pool=None):
+    '''
+    :py:func:`owned_compute_port_single` for all *project_ids*, with a query
+    per *chunk_size* of them, like :py:func:`owned_compute_ips`.
+    '''
+    sql_template = '''
+    SELECT id
+         , status
+         , {projcol} AS project_id
+    FROM   neutron.ports
+    WHERE
+         {projcol} IN ({{ids}})
+         AND
+         device_owner LIKE 'compute%%';
+    '''.format(projcol=project_col(db.version))
+    return chunked_in(db, sql_template, project_ids, chunk_size, pool=pool,
+                      rows='record')
 
 
 @query
@@ -268,7 +671,7 @@ def future_reservations(db):
     WHERE  end_date > UTC_TIMESTAMP()
            AND deleted_at is NULL;
     '''
-    return db.query(sql, limit=None)
+    return db.query(sql, limit=None, rows='dict')
 
 @query
 def active_instances(db):
@@ -280,12 +683,19 @@ def active_instances(db):
     FROM nova.instances
     WHERE deleted_at is NULL;
     '''
-    return db.query(sql, limit=None)
+    return db.query(sql, limit=None, stream=True, rows='record')
 
 @query
-def orphans(db, orphan_type):
+def orphans(db, orphan_type, pool=None, keystone=None):
     '''
     Get orphans of certain type that haven't been deleted,  along with users' and projects' information.
+
+    Instances are looked for in each cell database, at the same time if
+    given a *pool* (see :py:func:`fan_out`).
+
+    Given a :py:class:`KeystoneMembership` as *keystone*, only the
+    candidates are read from the database, and checked against that rather
+    than joined with the keystone tables in the query.
     '''
     db_tables = []
     conditions = '0'
@@ -301,7 +711,21 @@ def orphans(db, orphan_type):
         raise RuntimeError('Orphan type of {} is not supported'.format(orphan_type))
 
     projcol = project_col(db.version)
-    result = []
+    if keystone is not None:
+        sql = '''
+        SELECT {id_name} AS id, user_id, {projcol} AS project_id
+        FROM {db_table_name}
+        WHERE {conditions}
+        '''
+        statements = [
+            (sql.format(id_name=id_name, projcol=projcol, db_table_name=t,
+                        conditions=conditions), None)
+            for t in db_tables
+        ]
+        return keystone.orphans(fan_out(db, statements, pool=pool,
+                                        rows='tuple'))
+
+    statements = []
     for t in db_tables:
         sql = '''
         SELECT m.id, m.user_id AS user_id, project_id, lu.name AS user_name, p.name AS project_name, u.enabled AS user_enabled, p.enabled AS project_enabled
@@ -328,9 +752,88 @@ def orphans(db, orphan_type):
             )
         )
         '''.format(id_name=id_name, projcol=projcol, db_table_name=t, conditions=conditions)
-        result += db.query(sql, limit=None)
+        statements.append((sql, None))
+
+    return fan_out(db, statements, pool=pool, rows='record')
 
-    return result
+
+class KeystoneMembership(object):
+    '''
+    Keystone's users, projects and which users are members of which
+    projects (``UserProject`` assignments), read once with :py:meth:`load`
+    so :py:func:`orphans` can check many candidates without the per-row
+    ``NOT EXISTS``. The IDs are compared exactly, unlike MySQL's
+    case-insensitive collations, which is fine for Keystone's hex IDs.
+    '''
+    FIELDS = ('id', 'user_id', 'project_id', 'user_name', 'project_name',
+              'user_enabled', 'project_enabled')
+
+    _UNKNOWN = (None, None, None)
+
+    def __init__(self, users, projects, assignments):
+        # ids to (number, name, enabled)
+        self.users = users
+        self.projects = projects
+        # user number << 32 | project number
+        self.assignments = assignments
+
+    @classmethod
+    def load(cls, db):
+        users = {}
+        rows = db.query('''
+        SELECT u.id, lu.name, u.enabled
+        FROM keystone.user AS u
+        LEFT JOIN keystone.local_user AS lu ON lu.user_id = u.id
+        ''', limit=None, stream=True, rows='tuple')
+        for n, (user_id, name, enabled) in enumerate(rows):
+            users[user_id] = (n, name, enabled)
+
+        projects = {}
+        rows = db.query('''
+        SELECT id, name, enabled
+        FROM keystone.project
+        ''', limit=None, stream=True, rows='tuple')
+        for n, (project_id, name, enabled) in enumerate(rows):
+            projects[project_id] = (n, name, enabled)
+
+        assignments = set()
+        rows = db.query('''
+        SELECT actor_id, target_id
+        FROM keystone.assignment
+        WHERE type = 'UserProject'
+        ''', limit=None, stream=True, rows='tuple')
+        for actor_id, target_id in rows:
+            # membership only matters when both exist (and are enabled)
+            if actor_id in users and target_id in projects:
+                assignments.add(users[actor_id][0] << 32
+                                | projects[target_id][0])
+
+        return cls(users, projects, assignments)
+
+    def orphans(self, candidates):
+        """
+        The rows :py:func:`orphans` would give for *candidates*, ``(id,
+        user_id, project_id)`` tuples. A user or project that doesn't exist
+        makes its enabled flag NULL, and the row isn't an orphan unless
+        something else makes it one, like in the query.
+        """
+        from .mysqlshim import record_class
+        record = functools.partial(tuple.__new__, record_class(self.FIELDS))
+
+        for id_, user_id, project_id in candidates:
+            user_number, user_name, user_enabled = \
+                self.users.get(user_id, self._UNKNOWN)
+            project_number, project_name, project_enabled = \
+                self.projects.get(project_id, self._UNKNOWN)
+            if (user_id is None
+                    or project_id is None
+                    or user_enabled == 0
+                    or project_enabled == 0
+                    or (user_enabled == 1 and project_enabled == 1
+                        and user_number << 32 | project_number
+                        not in self.assignments)):
+                yield record((id_, user_id, project_id, user_name,
+                              project_name, user_enabled, project_enabled))
 
 @query
 def clear_ironic_port_internalinfo(db, port_id):
@@ -345,6 +848,18 @@ def clear_ironic_port_internalinfo(db, port_id):
     '''
     return db.query(sql, args=[port_id], no_rows=True)
 
+@query
+def clear_ironic_port_internalinfo_bulk(db, port_ids,
+                                        chunk_size=DEFAULT_CHUNK_SIZE):
+    """:py:func:`clear_ironic_port_internalinfo` for many ports, see
+    :py:func:`bulk_update`."""
+    sql = '''\
+    UPDATE ironic.ports
+    SET    internal_info = '{{}}'
+    WHERE  uuid IN ({ids});
+    '''
+    return bulk_update(db, sql, port_ids, chunk_size)
+
 
 @query
 def count_orphan_resource_providers(db):
@@ -356,7 +871,7 @@ def count_orphan_resource_providers(db):
     WHERE  cn.deleted = 0
        AND rp.uuid != cn.uuid
     '''
-    return db.query(sql)
+    return db.query(sql, rows='record')
 
 
 @query
@@ -384,7 +899,7 @@ def get_nodes_by_lease(db, lease_id):
     WHERE l.id = %s
     '''
 
-    return db.query(sql, (lease_id,), limit=None)
+    return db.query(sql, (lease_id,), limit=None, rows='dict')
 
 
 @query
@@ -405,7 +920,7 @@ def get_advance_reservations(db):
         AND l.deleted_at IS NULL
     '''
 
-    return db.query(sql, limit=None)
+    return db.query(sql, limit=None, rows='record')
 
 @query
 def find_reservable_retired_nodes(db):
@@ -418,7 +933,7 @@ def find_reservable_retired_nodes(db):
     WHERE  n.name LIKE '%retired'
        AND ch.reservable != 0
     '''
-    return db.query(sql, limit=None)
+    return db.query(sql, limit=None, rows='record')
 
 @query
 def blazar_set_non_reservable(db, node):
@@ -430,6 +945,17 @@ def blazar_set_non_reservable(db, node):
     '''
     return db.query(sql, args=[node], no_rows=True)
 
+@query
+def blazar_set_non_reservable_bulk(db, nodes, chunk_size=DEFAULT_CHUNK_SIZE):
+    """:py:func:`blazar_set_non_reservable` for many nodes, see
+    :py:func:`bulk_update`."""
+    sql = '''\
+    UPDATE blazar.computehosts
+    SET reservable = 0
+    WHERE hypervisor_hostname IN ({ids})
+    '''
+    return bulk_update(db, sql, nodes, chunk_size)
+
 @query
 def blazar_find_old_host_alloc(db):
     """Find computehost allocations tied to expired leases"""
@@ -445,7 +971,7 @@ def blazar_find_old_host_alloc(db):
     WHERE ca.deleted is Null
        AND l.end_date < curdate()
     '''
-    return db.query(sql, limit=None)
+    return db.query(sql, limit=None, rows='record')
 
 @query
 def blazar_old_host_alloc_delete(db, host_alloc):
@@ -457,6 +983,66 @@ def blazar_old_host_alloc_delete(db, host_alloc):
     '''
     return db.query(sql, args=[host_alloc], no_rows=True)
 
+@query
+def blazar_old_host_alloc_delete_bulk(db, host_allocs,
+                                      chunk_size=DEFAULT_CHUNK_SIZE):
+    """:py:func:`blazar_old_host_alloc_delete` for many allocations, see
+    :py:func:`bulk_update`."""
+    sql = '''\
+    UPDATE blazar.computehost_allocations ca
+    SET ca.updated_at = curdate(), ca.deleted_at = curdate(), ca.deleted = ca.id
+    WHERE ca.id IN ({ids})
+    '''
+    return bulk_update(db, sql, host_allocs, chunk_size)
+
+@query
+def blazar_lease_history(db, since):
+    """
+    Every lease ending after *since*, soft-deleted ones included, with a row
+    per host allocated to it, ordered by lease. Dates and times are UTC.
+    """
+    sql = '''\
+    SELECT l.id
+         , l.project_id
+         , l.status
+         , l.start_date
+         , l.end_date
+         , l.created_at
+         , l.deleted_at
+         , ca.compute_host_id AS host_id
+    FROM blazar.leases AS l
+    JOIN blazar.reservations AS r ON l.id = r.lease_id
+    JOIN blazar.computehost_allocations AS ca ON ca.reservation_id = r.id
+    WHERE l.end_date > %s
+    ORDER BY l.id
+    '''
+    return db.query(sql, args=[since], limit=None, rows='dict')
+
+def profile(db, name, qargs, iterations, explain=False):
+    '''
+    Run query *name* *iterations* times and print latency percentiles, with
+    the query plan(s) if *explain*.
+    '''
+    if iterations < 1:
+        raise ValueError('iterations must be at least 1, not {}'.format(iterations))
+    with querystats.collect(explain=explain) as runs:
+        for _ in range(iterations):
+            result = QUERIES[name]['f'](db, *qargs)
+            if result is not None and not isinstance(result, int):
+                for _ in result:
+                    pass
+
+    seconds = sorted(run.seconds for run in runs)
+    print('{}: {} runs, {} rows/run'.format(name, len(runs), runs[0].rows))
+    for pct in [50, 90, 95, 99, 100]:
+        print('  p{:<3} {:9.2f} ms'.format(
+            pct, querystats.percentile(seconds, pct) * 1000))
+    if explain:
+        import json
+        for plan in runs[0].explain:
+            print(json.dumps(plan, indent=2))
+
+
 def main(argv):
     """Run queries!"""
     import sys
@@ -482,10 +1068,25 @@ def main(argv):
     )
     parser.add_argument('--commit', action='store_true',
         help='Commit the connection after the query')
+    parser.add_argument('--profile', action='store_true',
+        help='Run the query repeatedly, reading all the rows, and print '
+             'latency percentiles. Changes are rolled back.')
+    parser.add_argument('-n', '--iterations', type=int, default=10,
+        help='Runs for --profile (defaulting to %(default)s)')
 
     args = parser.parse_args(argv[1:])
+    if args.profile and args.iterations < 1:
+        parser.error('--iterations must be at least 1')
     mysqlargs.extract(args)
 
+    if args.profile:
+        db = mysqlargs.connect()
+        try:
+            return profile(db, args.query, args.qargs, args.iterations,
+                           explain=args.explain_queries)
+        finally:
+            db.rollback()
+
     db = mysqlargs.connect()
 
     # qargs = [ast.literal_eval(a) for a in args.qargs]
@@ -503,7 +1104,7 @@ def main(argv):
             raise
 
     if args.commit:
-        db.db.commit()
+        db.commit()
 
 
 if __name__ == '__main__':
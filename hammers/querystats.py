@@ -0,0 +1,333 @@
+# coding: utf-8
+"""
+Instrumentation for the :py:func:`hammers.query.query` functions. When
+enabled with :py:func:`configure` (or ``--query-stats`` from
+:py:class:`hammers.mysqlargs.MySqlArgs`), every call records its wall time
+(including reading the rows, if it returns an iterator), rows fetched, an
+estimate of bytes transferred, and optionally the ``EXPLAIN FORMAT=JSON``
+of each statement. Each record is passed to the configured sinks.
+
+Sinks are callables taking a :py:class:`QueryStats`; the ones here can be
+picked by a spec string (see :py:func:`sink_from_spec`):
+
+* ``log``: a line per call to this module's logger
+* ``json:PATH``: a JSON object per line appended to *PATH*
+* ``prom:PATH``: cumulative per-query metrics written to *PATH* for the
+  Prometheus node exporter's textfile collector
+"""
+import collections
+import contextlib
+import datetime
+import functools
+import inspect
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+_L = logging.getLogger(__name__)
+
+QueryStats = collections.namedtuple(
+    'QueryStats', ['name', 'seconds', 'rows', 'bytes', 'statements', 'explain'])
+
+_sinks = []
+_explain = False
+
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE', 'INSERT', 'REPLACE')
+
+
+def configure(sinks=(), explain=False):
+    """Send stats to *sinks* (callables, or spec strings), and also capture
+    query plans if *explain*. No sinks turns instrumentation off."""
+    global _sinks, _explain
+    _sinks = [sink_from_spec(s) if isinstance(s, str) else s for s in sinks]
+    _explain = explain
+
+
+@contextlib.contextmanager
+def collect(explain=False):
+    """Context manager that, for its duration, sends stats only to the list
+    it yields."""
+    global _sinks, _explain
+    previous = _sinks, _explain
+    records = []
+    configure([records.append], explain=explain)
+    try:
+        yield records
+    finally:
+        _sinks, _explain = previous
+
+
+def enabled():
+    return bool(_sinks)
+
+
+def emit(stats):
+    for sink in _sinks:
+        try:
+            sink(stats)
+        except Exception:
+            _L.exception('query stats sink {!r} failed'.format(sink))
+
+
+def sink_from_spec(spec):
+    """``log``, ``json:PATH`` or ``prom:PATH`` to a sink."""
+    kind, _, path = spec.partition(':')
+    if kind == 'log':
+        return log_sink
+    if kind == 'json' and path:
+        return JsonLinesSink(path)
+    if kind == 'prom' and path:
+        return PrometheusTextfileSink(path)
+    raise ValueError('unknown query stats sink "{}"'.format(spec))
+
+
+def log_sink(stats):
+    _L.info('query {} took {:.3f}s, {} rows, ~{} bytes'.format(
+        stats.name, stats.seconds, stats.rows, stats.bytes))
+
+
+class JsonLinesSink(object):
+    """Appends each record as a line of JSON to *path*."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, stats):
+        record = dict(stats._asdict(), time=datetime.datetime.utcnow().isoformat())
+        line = json.dumps(record, default=str) + '\n'
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line)
+
+
+class PrometheusTextfileSink(object):
+    """Keeps per-query totals for this process and rewrites *path* with
+    them after each call."""
+
+    METRICS = [
+        ('calls', 'counter', 'Calls of the query'),
+        ('seconds', 'counter', 'Seconds spent in the query'),
+        ('rows', 'counter', 'Rows fetched by the query'),
+        ('bytes', 'counter', 'Approximate bytes fetched by the query'),
+    ]
+
+    def __init__(self, path):
+        self.path = path
+        self.totals = collections.defaultdict(collections.Counter)
+        self._lock = threading.Lock()
+
+    def __call__(self, stats):
+        with self._lock:
+            totals = self.totals[stats.name]
+            totals['calls'] += 1
+            totals['seconds'] += stats.seconds
+            totals['rows'] += stats.rows
+            totals['bytes'] += stats.bytes
+            self._write()
+
+    def _write(self):
+        lines = []
+        for metric, kind, help in self.METRICS:
+            name = 'hammers_query_{}_total'.format(metric)
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for query in sorted(self.totals):
+                lines.append('{}{{query="{}"}} {}'.format(
+                    name, query, self.totals[query][metric]))
+        # the collector may read at any time, so never leave it half-written
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp, self.path)
+
+
+def _size(value):
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return len(str(value))
+
+
+def _row_size(row):
+    if isinstance(row, dict):
+        row = row.values()
+    return sum(_size(v) for v in row)
+
+
+class Recorder(object):
+    """
+    Stands in for a :py:class:`hammers.mysqlshim.MySqlShim` while a query
+    function runs, noting the statements it sends and counting the rows
+    that come back. Statements run on connections from a pool wrapped with
+    :py:meth:`pool` are counted too, from whichever threads run them.
+    """
+
+    def __init__(self, db, name):
+        self._db = db
+        self._name = name
+        self._start = time.perf_counter()
+        self._rows = 0
+        self._bytes = 0
+        self._statements = []
+        self._explain = []
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def pool(self, pool):
+        """Wrap a :py:class:`hammers.mysqlshim.MySqlPool` so the connections
+        it lends record into this."""
+        return _RecordingPool(pool, self)
+
+    def query(self, sql, *args, **kwargs):
+        return self.record(self._db, sql, *args, **kwargs)
+
+    def record(self, db, sql, *args, **kwargs):
+        """Run *sql* on *db*, counting what comes back."""
+        plan = self._explain_plan(db, sql, *args, **kwargs) if _explain else None
+        with self._lock:
+            self._statements.append(sql)
+            if _explain:
+                self._explain.append(plan)
+
+        result = db.query(sql, *args, **kwargs)
+        if isinstance(result, int):
+            # no_rows; the affected count
+            return result
+        if isinstance(result, dict):
+            # column mode
+            columns = list(result.values())
+            with self._lock:
+                self._rows += len(columns[0]) if columns else 0
+                self._bytes += sum(_size(v) for column in columns for v in column)
+            return result
+        if isinstance(result, list):
+            # immediate
+            with self._lock:
+                self._rows += len(result)
+                self._bytes += sum(_row_size(row) for row in result)
+            return result
+        return self._count(result)
+
+    def _add(self, row):
+        with self._lock:
+            self._rows += 1
+            self._bytes += _row_size(row)
+
+    def _count(self, rows):
+        for row in rows:
+            self._add(row)
+            yield row
+
+    def _explain_plan(self, db, sql, *args, **kwargs):
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return None
+        kwargs = {k: v for k, v in kwargs.items() if k in ('args',)}
+        try:
+            rows = db.query('EXPLAIN FORMAT=JSON ' + sql, *args[:1],
+                            rows='tuple', immediate=True, limit=None,
+                            **kwargs)
+            return json.loads(rows[0][0])
+        except Exception as e:
+            _L.warning('EXPLAIN failed for {}: {}'.format(self._name, e))
+            return None
+
+    def finish(self):
+        emit(QueryStats(
+            name=self._name,
+            seconds=time.perf_counter() - self._start,
+            rows=self._rows,
+            bytes=self._bytes,
+            statements=self._statements,
+            explain=self._explain if _explain else None,
+        ))
+
+
+class _RecordingConnection(object):
+    """A pooled connection whose queries go through a :py:class:`Recorder`."""
+
+    def __init__(self, db, recorder):
+        self._db = db
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
+
+    def query(self, sql, *args, **kwargs):
+        return self._recorder.record(self._db, sql, *args, **kwargs)
+
+
+class _RecordingPool(object):
+    """A pool whose connections record into a :py:class:`Recorder`."""
+
+    def __init__(self, pool, recorder):
+        self._pool = pool
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self._pool, name)
+
+    @contextlib.contextmanager
+    def connection(self):
+        with self._pool.connection() as db:
+            yield _RecordingConnection(db, self._recorder)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self._pool.transaction() as db:
+            yield _RecordingConnection(db, self._recorder)
+
+
+def instrument(func):
+    """Wrap query function *func* to record stats when enabled. If it
+    returns an iterator, the record is made once that's used up or
+    closed. A ``pool`` argument is wrapped so the statements run on its
+    connections are part of the record."""
+    params = list(inspect.signature(func).parameters)
+    # position of "pool" among the arguments after db, if any
+    pool_index = params.index('pool') - 1 if 'pool' in params else None
+
+    @functools.wraps(func)
+    def wrapper(db, *args, **kwargs):
+        if not enabled():
+            return func(db, *args, **kwargs)
+
+        recorder = Recorder(db, func.__name__)
+        if pool_index is not None:
+            if len(args) > pool_index:
+                args = list(args)
+                if args[pool_index] is not None:
+                    args[pool_index] = recorder.pool(args[pool_index])
+            elif kwargs.get('pool') is not None:
+                kwargs['pool'] = recorder.pool(kwargs['pool'])
+        try:
+            result = func(recorder, *args, **kwargs)
+        except Exception:
+            recorder.finish()
+            raise
+        if isinstance(result, (list, tuple, dict, int)) or result is None:
+            recorder.finish()
+            return result
+        return _finish_after(result, recorder)
+
+    return wrapper
+
+
+def _finish_after(iterator, recorder):
+    try:
+        yield from iterator
+    finally:
+        recorder.finish()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of *values* (a sorted list)."""
+    if not values:
+        return None
+    rank = max(1, int(math.ceil(pct / 100 * len(values))))
+    return values[rank - 1]
@@ -1,37 +1,15 @@
 from datetime import datetime
 import pytz
 import sys
-import os
 import itertools
-import re
 from hammers.slack import Slackbot
 from hammers import osapi, osrest
+from hammers.osrest import cache
 from hammers.osrest.nova import aggregate_delete, _addremove_host
+from hammers.snapshot import CloudSnapshot
 from hammers.util import base_parser
 from hammers import MySqlArgs, query
 
-# Append "/v3" to OS_AUTH_URL, if necesary
-auth_url = os.environ["OS_AUTH_URL"]
-if not re.search("\/v3$", auth_url):
-  os.environ["OS_AUTH_URL"]=auth_url+"/v3"
-
-parser = base_parser(
-    'Clean old Nova aggregates tied to expired Blazar leases.')
-mysqlargs = MySqlArgs({
-    'user': 'root',
-    'password': '',
-    'host': 'localhost',
-    'port': '3306',
-})
-mysqlargs.inject(parser)
-args = parser.parse_args(sys.argv[1:])
-auth = osapi.Auth.from_env_or_args(args=args)
-mysqlargs.extract(args)
-conn = mysqlargs.connect()
-
-aggregates = osrest.nova.aggregates(auth)
-host_allocs = osrest.blazar.host_allocations(auth)
-leases = osrest.blazar.leases(auth)
 dt_fmt = '%Y-%m-%dT%H:%M:%S.%f'
 
 
@@ -44,7 +22,7 @@ def is_terminated(lease):
     return now > lease_end
 
 
-def aggregates_for_lease(lease):
+def aggregates_for_lease(aggregates, lease):
     physical_reservation_ids = [
         r['id'] for r in lease['reservations']
         if r['resource_type'] == 'physical:host'
@@ -55,7 +33,7 @@ def aggregates_for_lease(lease):
     ]
 
 
-def clear_aggregates(agg_list):
+def clear_aggregates(auth, agg_list):
     report = []
     errors = []
 
@@ -83,16 +61,16 @@ def clear_aggregates(agg_list):
     return errors, report
 
 
-def orphan_find(allaggs):
+def orphan_find(snapshot, allaggs):
     # Find all hosts currently in aggregates
-    hosts_from_aggs = []
+    hosts_from_aggs = set()
     for agg in allaggs.values():
         for host in agg['hosts']:
-            hosts_from_aggs.append(host)
+            hosts_from_aggs.add(host)
 
     # Make list of ironic hosts not in any aggregate
-    ironic_nodes = osrest.ironic.nodes(auth, details=False).keys()
-    blazar_hosts = osrest.blazar.hosts(auth).values()
+    ironic_nodes = snapshot.ironic_nodes.keys()
+    blazar_hosts = snapshot.blazar_hosts.values()
     orphans = []
     for node_uuid in ironic_nodes:
         if node_uuid not in hosts_from_aggs:
@@ -106,37 +84,57 @@ def orphan_find(allaggs):
     return orphans
 
 
-def has_active_allocation(orph):
-    matching_allocs = [
-        alloc for alloc in host_allocs
-        if alloc['resource_id'] == orph
-    ]
-    if not matching_allocs:
+def has_active_allocation(snapshot, orph):
+    alloc = snapshot.allocations_by_resource_id.get(orph)
+    if alloc is None:
         return False
-    res = matching_allocs[0]['reservations'][0]['id']
+    res = alloc['reservations'][0]['id']
     return res
 
 
-def del_expired_alloc(db, old_alloc):
-    ha_id = old_alloc['id']
-    l_id = old_alloc['lid']
-    query.blazar_old_host_alloc_delete(db, ha_id)
-    return ha_id, l_id
+def del_expired_allocs(db, old_allocs):
+    query.blazar_old_host_alloc_delete_bulk(
+        db, [alloc['id'] for alloc in old_allocs])
+    return [(alloc['hypervisor_hostname'], alloc['lid']) for alloc in old_allocs]
 
 
 def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    parser = base_parser(
+        'Clean old Nova aggregates tied to expired Blazar leases.')
+    mysqlargs = MySqlArgs({
+        'user': 'root',
+        'password': '',
+        'host': 'localhost',
+        'port': '3306',
+    })
+    mysqlargs.inject(parser)
+    args = parser.parse_args(argv[1:])
+    cache.configure_from_args(args)
+    auth = osapi.Auth.from_env_or_args(args=args)
+    mysqlargs.extract(args)
+    conn = mysqlargs.connect()
+
+    snapshot = CloudSnapshot(auth).prefetch(
+        'nova_aggregates', 'blazar_allocations', 'blazar_leases',
+        'ironic_nodes', 'blazar_hosts')
+    aggregates = snapshot.nova_aggregates
+    leases = snapshot.blazar_leases
+
     script = 'clean-old-aggregates'
     slack = Slackbot(args.slack, script_name=script) if args.slack else None
 
     try:
         term_leases = [lease for lease in leases.values() if is_terminated(lease)]
-        old_aggregates = [aggs for aggs in (aggregates_for_lease(lease) for lease in term_leases) if aggs != None]
+        old_aggregates = [aggs for aggs in (aggregates_for_lease(aggregates, lease) for lease in term_leases) if aggs != None]
         aggregate_list = list(itertools.chain(*old_aggregates))
-        errors, reports = clear_aggregates(aggregate_list)
-        orphan_list = orphan_find(aggregates)
+        errors, reports = clear_aggregates(auth, aggregate_list)
+        orphan_list = orphan_find(snapshot, aggregates)
 
         for orphan in orphan_list:
-            destiny = has_active_allocation(orphan)
+            destiny = has_active_allocation(snapshot, orphan)
             host = osrest.blazar.host(auth, orphan)
             if destiny is None:
                 reports.append("Error identifying allocation for orphan host {}.".format(orphan))
@@ -148,11 +146,10 @@ def main(argv=None):
                 reports.append("Moving orphan host {} to destined aggregate {}.".format(orphan, destination_agg))
                 osrest.nova.aggregate_add_host(auth, destination_agg, host['hypervisor_hostname'])
 
-        old_allocations = query.blazar_find_old_host_alloc(conn)
-        for alloc in old_allocations:
-            hostname, lease_id = del_expired_alloc(conn, alloc)
+        old_allocations = list(query.blazar_find_old_host_alloc(conn))
+        for hostname, lease_id in del_expired_allocs(conn, old_allocations):
             reports.append("Deleted host_allocation for host {} matching expired lease {}.".format(hostname, lease_id))
-        conn.db.commit()
+        conn.commit()
 
         if reports:
             str_report = '\n'.join(reports)
@@ -23,7 +23,9 @@ import requests
 
 from hammers import osrest
 from hammers.osapi import load_osrc, Auth
+from hammers.osrest import cache
 from hammers.slack import Slackbot
+from hammers.snapshot import CloudSnapshot
 from hammers.util import nullcontext, base_parser
 
 OS_ENV_PREFIX = 'OS_'
@@ -50,6 +52,7 @@ def main(argv=None):
         help='Disable sanity checking (i.e. things really are that bad)')
 
     args = parser.parse_args(argv[1:])
+    cache.configure_from_args(args)
 
     # Validate args
 
@@ -100,9 +103,11 @@ def main(argv=None):
 
 
 def find_conflicts(auth, ignore_subnets):
-    nodes = osrest.ironic_nodes(auth)
-    ports = osrest.ironic_ports(auth)
-    neut_ports = osrest.neutron_ports(auth)
+    snapshot = CloudSnapshot.of(auth).prefetch(
+        'ironic_nodes', 'ironic_ports', 'neutron_ports')
+    nodes = snapshot.ironic_nodes
+    ports = snapshot.ironic_ports
+    neut_ports = snapshot.neutron_ports
 
     # they aren't being ironic
     serious_neut_ports = {
@@ -22,6 +22,7 @@ from pprint import pprint
 import requests
 
 from hammers import osapi, osrest
+from hammers.osrest import cache
 from hammers.slack import Slackbot
 from hammers.util import base_parser
 
@@ -29,6 +30,26 @@ OS_ENV_PREFIX = 'OS_'
 SUBCOMMAND = 'curiouser'
 
 
+def errored_nodes(nodes):
+    """Nodes in "error" provision state that aren't in maintenance."""
+    return [
+        n
+        for n
+        in nodes.values()
+        if n['provision_state'] == 'error' and not n['maintenance']
+    ]
+
+
+def error_message(errored):
+    message = ['Ironic nodes in "error" provision state, not in maintenance']
+    message.extend(
+        '• `{}`, last error: {}'.format(n['uuid'], n.get('last_error'))
+        for n
+        in errored
+    )
+    return '\n'.join(message)
+
+
 def main(argv=None):
     if argv is None:
         argv = sys.argv
@@ -38,6 +59,7 @@ def main(argv=None):
     parser.add_argument('-v', '--verbose', action='store_true')
 
     args = parser.parse_args(argv[1:])
+    cache.configure_from_args(args)
 
     if args.slack:
         slack = Slackbot(args.slack)
@@ -56,30 +78,20 @@ def main(argv=None):
         )
         return -1
 
-    auth = osapi.Auth(os_vars)
+    auth = osapi.Auth(os_vars, interface=args.os_interface,
+                      token_cache=args.token_cache)
 
     nodes = osrest.ironic_nodes(auth, details=True)
     # hypervisors = osrest.nova_hypervisors(auth, details=True)
 
-    errored_nodes = [
-        n
-        for n
-        in nodes.values()
-        if n['provision_state'] == 'error' and not n['maintenance']
-    ]
+    errored = errored_nodes(nodes)
 
-    if not errored_nodes:
+    if not errored:
         if args.verbose:
             print('All good.')
         return
 
-    message = ['Ironic nodes in "error" provision state, not in maintenance']
-    message.extend(
-        '• `{}`, last error: {}'.format(n['uuid'], n.get('last_error'))
-        for n
-        in errored_nodes
-    )
-    message = '\n'.join(message)
+    message = error_message(errored)
 
     print(message.replace('•', '*'))
     if slack:
@@ -22,7 +22,9 @@ from collections import defaultdict
 from MySQLdb import ProgrammingError
 
 from hammers import MySqlArgs, osapi, osrest, query
+from hammers.osrest import cache
 from hammers.slack import Slackbot
+from hammers.snapshot import CloudSnapshot
 from hammers.util import base_parser
 
 OS_ENV_PREFIX = 'OS_'
@@ -48,8 +50,9 @@ def identify_dirty_ports(auth, assert_single):
     Brief race condition hazard if maybe ironic was going to clean it up
     but we mark it as dirty then try to fix it later?
     '''
-    iports = ports_by_node(osrest.ironic.ports(auth), assert_single)
-    nodes = osrest.ironic.nodes(auth)
+    snapshot = CloudSnapshot.of(auth).prefetch('ironic_ports', 'ironic_nodes')
+    iports = ports_by_node(snapshot.ironic_ports, assert_single)
+    nodes = snapshot.ironic_nodes
 
     bad_ports = []
 
@@ -69,10 +72,11 @@ def identify_dirty_ports(auth, assert_single):
 
 
 def clean_ports(db, ports):
-    for port in ports:
-        updated_rows = query.clear_ironic_port_internalinfo(db, port['uuid'])
-        assert updated_rows == 1
-    db.db.commit()
+    updated = query.clear_ironic_port_internalinfo_bulk(
+        db, [port['uuid'] for port in ports])
+    for port_ids, updated_rows in updated:
+        assert updated_rows == len(port_ids)
+    db.commit()
 
 
 def main(argv=None):
@@ -96,6 +100,7 @@ def main(argv=None):
         help='Just display info or actually fix them?')
 
     args = parser.parse_args(argv[1:])
+    cache.configure_from_args(args)
     mysqlargs.extract(args)
 
     auth = osapi.Auth.from_env_or_args(args=args)
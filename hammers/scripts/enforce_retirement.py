@@ -3,6 +3,7 @@
 import os
 import sys
 from hammers import MySqlArgs, query
+from hammers.osrest import cache
 from hammers.slack import Slackbot
 from hammers.util import base_parser
 
@@ -10,16 +11,14 @@ def correct_state(db,slk,dryrun=False):
 
     # Find retired nodes
     retired_nodes = query.find_reservable_retired_nodes(db)
-    node_list = []
-    for node in retired_nodes:
-        node_list.append(node['uuid'])
-        if not dryrun:
-            blazar_fix = query.blazar_set_non_reservable(db, node['uuid'])
-            assert blazar_fix == 1
-    
+    node_list = [node['uuid'] for node in retired_nodes]
+    if not dryrun:
+        for nodes, blazar_fix in query.blazar_set_non_reservable_bulk(db, node_list):
+            assert blazar_fix == len(nodes)
+
     if not dryrun:
         mess = ("Reverted state of node(s) " + str(', '.join(node_list))  + " to non-reservable.")
-        db.db.commit()
+        db.commit()
     else:
         mess = ("State of retired node(s) " + str(', '.join(node_list)) +  " is reservable, run without '--dryrun' to retire.")
 
@@ -42,6 +41,7 @@ def main(argv=None):
     mysqlargs.inject(parser)
     parser.add_argument('--dryrun', help='dryrun mode', action='store_true')
     args = parser.parse_args(argv[1:])
+    cache.configure_from_args(args)
     mysqlargs.extract(args)
     conn = mysqlargs.connect()
     slack = Slackbot(args.slack, script_name='enforce-retirement') if args.slack else None
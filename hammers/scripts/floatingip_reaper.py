@@ -21,6 +21,7 @@ NOTE: Only used for OpenStack database Rocky version!
 import sys
 
 from hammers import MySqlArgs, osapi, osrest, query
+from hammers.osrest import cache
 from hammers.slack import Slackbot
 from hammers.util import base_parser
 
@@ -74,6 +75,7 @@ def main(argv=None):
     parser.add_argument('--dryrun', help='dryrun mode', action='store_true')
 
     args = parser.parse_args(argv[1:])
+    cache.configure_from_args(args)
     mysqlargs.extract(args)
     auth = osapi.Auth.from_env_or_args(args=args)
 
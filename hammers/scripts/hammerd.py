@@ -0,0 +1,313 @@
+# coding: utf-8
+'''
+Runs the other hammers on a schedule from one long-lived daemon, so they
+skip re-importing their libraries and share Keystone tokens and cached
+listings (through the on-disk caches) instead of each cron job starting
+cold. Each run still opens its own HTTP connections; see below.
+
+.. code-block:: bash
+
+    hammerd --config /etc/hammers/hammerd.json [--status-file FILE]
+
+The config is JSON like:
+
+.. code-block:: json
+
+    {
+        "token_cache": "/var/cache/hammers/tokens",
+        "max_staleness": 120,
+        "jitter": 0.1,
+        "jobs": {
+            "undead-instances": {
+                "interval": 600,
+                "args": ["delete", "--slack", "/root/scripts/slack.json"]
+            },
+            "retirement-enforcer": {
+                "module": "enforce_retirement",
+                "interval": 86400
+            }
+        }
+    }
+
+Each job calls the ``main`` of ``hammers.scripts.<module>`` (by default the
+job name with underscores for dashes) with ``args``, every ``interval``
+seconds plus up to ``jitter`` times that at random. A job that's still
+running (or waiting for one of the ``--workers``) when it comes due again
+sits that round out. After every run, the status file gets each job's last
+start, duration and outcome.
+
+The scripts are imported once, up front, and each run happens in a process
+forked from the daemon. Runs start warm and share the token and listing
+caches, which live on disk, but whatever a script sets up for itself (its
+own ``--max-staleness``, query stats, environment variables) stays with
+that run rather than leaking into jobs running beside it.
+'''
+import argparse
+import collections
+import heapq
+import importlib
+import json
+import logging
+import multiprocessing
+from multiprocessing.connection import wait
+import os
+import random
+import signal
+import sys
+import threading
+import time
+import traceback
+
+from hammers import osapi
+from hammers.osrest import cache
+
+DEFAULT_JITTER = 0.1
+DEFAULT_WORKERS = 4
+# longest the scheduler sleeps before checking whether it's been stopped
+POLL_INTERVAL = 1.0
+
+_L = logging.getLogger(__name__)
+
+
+def _run_main(main, argv, results):
+    """Body of a job's child process: run *main* and send back its exit
+    value and any traceback."""
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    error = None
+    try:
+        exit = main(argv)
+    except SystemExit as e:
+        exit = e.code
+    except Exception:
+        exit = None
+        error = traceback.format_exc()
+    try:
+        results.send((exit, error))
+    except Exception:
+        # e.g. an exit value that won't pickle
+        results.send((str(exit), error))
+    results.close()
+
+
+class Job(object):
+    """One hammer and how often to run it."""
+
+    def __init__(self, name, interval, args=(), module=None):
+        self.name = name
+        self.interval = interval
+        self.args = list(args)
+        self.module = module or name.replace('-', '_')
+        self.main = importlib.import_module(
+            'hammers.scripts.' + self.module).main
+        self.process = None
+        self._results = None
+        self._outcome = None
+        self.status = {
+            'state': 'idle',
+            'runs': 0,
+            'skipped': 0,
+            'last_start': None,
+            'last_duration': None,
+            'last_result': None,
+            'last_exit': None,
+            'last_error': None,
+        }
+
+    @property
+    def running(self):
+        return self.process is not None
+
+    def start(self):
+        """Fork a process to run the job's ``main`` once."""
+        context = multiprocessing.get_context('fork')
+        self._results, child_results = context.Pipe(duplex=False)
+        self.process = context.Process(
+            target=_run_main, name='hammerd-' + self.name,
+            args=(self.main, [self.name] + self.args, child_results))
+        self.status.update(state='running', last_start=time.time())
+        self.process.start()
+        child_results.close()
+
+    def waitables(self):
+        """What to :py:func:`multiprocessing.connection.wait` on for news of
+        the running process."""
+        if self.process is None:
+            return []
+        if self._outcome is None:
+            return [self.process.sentinel, self._results]
+        return [self.process.sentinel]
+
+    def poll(self):
+        """Record the outcome if the run has finished, returning whether it
+        had."""
+        if self.process is None:
+            return False
+        # read as it arrives, so a long traceback can't block the child
+        if self._outcome is None and self._results.poll():
+            try:
+                self._outcome = self._results.recv()
+            except EOFError:
+                pass
+        if self.process.is_alive():
+            return False
+
+        self.process.join()
+        duration = time.time() - self.status['last_start']
+        if self._outcome is None:
+            # killed, or died before it could say how it went
+            exit = self.process.exitcode
+            error = 'process exited with code {}'.format(exit)
+            _L.error('job {} {}'.format(self.name, error))
+        else:
+            exit, error = self._outcome
+            if error is not None:
+                _L.error('job {} raised\n{}'.format(self.name, error))
+        self._results.close()
+        self.process = self._results = self._outcome = None
+
+        ok = error is None and exit in (None, 0)
+        self.status.update(
+            state='idle',
+            runs=self.status['runs'] + 1,
+            last_duration=duration,
+            last_result='ok' if ok else 'failed',
+            last_exit=exit,
+            last_error=error,
+        )
+        _L.info('job {} {} in {:.1f}s'.format(
+            self.name, self.status['last_result'], duration))
+        return True
+
+
+class Scheduler(object):
+    """
+    Runs *jobs* on their intervals with up to *workers* at a time, writing
+    their statuses to *status_file* (if given) after each run.
+    """
+
+    def __init__(self, jobs, jitter=DEFAULT_JITTER, workers=DEFAULT_WORKERS,
+                 status_file=None):
+        self.jobs = jobs
+        self.jitter = jitter
+        self.workers = workers
+        self.status_file = status_file
+        self.waiting = collections.deque()
+
+    def delay(self, job):
+        return job.interval * (1 + random.uniform(0, self.jitter))
+
+    def dispatch(self, job):
+        if job.running or job in self.waiting:
+            job.status['skipped'] += 1
+            _L.warning('job {} still running, skipping'.format(job.name))
+            return
+        self.waiting.append(job)
+
+    def start_waiting(self):
+        running = sum(job.running for job in self.jobs)
+        while self.waiting and running < self.workers:
+            self.waiting.popleft().start()
+            running += 1
+
+    def reap(self):
+        finished = [job for job in self.jobs if job.poll()]
+        if finished:
+            self.write_status()
+        return finished
+
+    def wait(self, timeout):
+        """Sleep until *timeout* passes or a running job has news."""
+        waitables = [w for job in self.jobs for w in job.waitables()]
+        if waitables:
+            wait(waitables, timeout)
+        else:
+            time.sleep(timeout)
+
+    def status(self):
+        return {job.name: dict(job.status) for job in self.jobs}
+
+    def write_status(self):
+        if not self.status_file:
+            return
+        tmp = self.status_file + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.status(), f, indent=2, sort_keys=True)
+        os.replace(tmp, self.status_file)
+
+    def run(self, stop):
+        """Loop until the :py:class:`threading.Event` *stop* is set, then
+        wait for running jobs to finish."""
+        now = time.time()
+        # spread the first round out so everything doesn't start at once
+        queue = [
+            (now + random.uniform(0, self.jitter * job.interval), n, job)
+            for n, job in enumerate(self.jobs)
+        ]
+        heapq.heapify(queue)
+
+        while queue and not stop.is_set():
+            self.reap()
+            while queue[0][0] <= time.time():
+                _, n, job = queue[0]
+                heapq.heapreplace(queue, (time.time() + self.delay(job), n, job))
+                self.dispatch(job)
+            self.start_waiting()
+            self.wait(min(POLL_INTERVAL, max(0, queue[0][0] - time.time())))
+
+        self.waiting.clear()
+        while any(job.running for job in self.jobs):
+            self.wait(POLL_INTERVAL)
+            self.reap()
+        self.write_status()
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    parser = argparse.ArgumentParser(
+        description='Run hammers on a schedule in one process')
+    parser.add_argument('--config', type=str, required=True,
+        help='JSON file listing jobs, see the module docs.')
+    parser.add_argument('--status-file', type=str,
+        help='JSON file to keep per-job status in.')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+        help='Most jobs to run at once. Default: %(default)s')
+    parser.add_argument('-v', '--verbose', action='store_true')
+
+    args = parser.parse_args(argv[1:])
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+    with open(args.config) as f:
+        config = json.load(f)
+
+    if config.get('token_cache'):
+        osapi.Auth.default_token_cache = osapi.TokenCache(config['token_cache'])
+    if config.get('max_staleness'):
+        cache.configure(max_staleness=config['max_staleness'])
+
+    jobs = []
+    for name, spec in config['jobs'].items():
+        try:
+            jobs.append(Job(name, **spec))
+        except (TypeError, ImportError) as e:
+            raise RuntimeError('bad job "{}": {}'.format(name, e))
+
+    scheduler = Scheduler(
+        jobs,
+        jitter=config.get('jitter', DEFAULT_JITTER),
+        workers=args.workers,
+        status_file=args.status_file,
+    )
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+
+    _L.info('scheduling {} jobs'.format(len(jobs)))
+    scheduler.run(stop)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -33,7 +33,9 @@ import requests
 
 from hammers import osrest
 from hammers.osapi import load_osrc, Auth
+from hammers.osrest import aio, cache
 from hammers.slack import Slackbot
+from hammers.snapshot import CloudSnapshot
 from hammers.util import error_message_factory, base_parser
 
 OS_ENV_PREFIX = 'OS_'
@@ -172,6 +174,17 @@ class NodeResetter(object):
         osrest.ironic_node_set_state(self.auth, self.nid, 'deleted')
 
 
+def reset_node(auth, node_id, dry_run=False):
+    """Reset a node, returning the number of resets recorded on it."""
+    resetter = NodeResetter(auth, node_id, dry_run=dry_run)
+    resetter.reset()
+    return resetter.tracker.count()
+
+
+# the retry sleeps in NodeResetter.reset overlap across nodes this way
+reset_node_async = aio.coroutine(reset_node, osrest.ironic.API)
+
+
 def main(argv=None):
     if argv is None:
         argv = sys.argv
@@ -183,8 +196,12 @@ def main(argv=None):
     parser.add_argument('-v', '--verbose', action='store_true')
     parser.add_argument('--dry-run', action='store_true',
         help='Dry run, don\'t actually do anything')
+    parser.add_argument('--mirror-dir', type=str, metavar='DIR',
+        help='Keep an incrementally-synced copy of the node list here, '
+        'rather than fetching it in full every run.')
 
     args = parser.parse_args(argv[1:])
+    cache.configure_from_args(args)
 
     slack = Slackbot(args.slack, script_name='ironic-error-resetter') if args.slack else None
 
@@ -200,10 +217,11 @@ def main(argv=None):
         )
         return -1
 
-    auth = Auth(os_vars)
+    auth = Auth(os_vars, interface=args.os_interface,
+                token_cache=args.token_cache)
 
     try:
-        nodes = osrest.ironic_nodes(auth, details=True)
+        nodes = CloudSnapshot(auth, mirror_dir=args.mirror_dir).ironic_nodes
         cureable = cureable_nodes(nodes)
 
         if args.mode == 'info':
@@ -232,12 +250,10 @@ def main(argv=None):
 
         print('To correct: {}'.format(repr(cureable)))
 
-        reset_ok = []
         too_many = []
-        for nid in cureable:
-            resetter = NodeResetter(auth, nid, dry_run=args.dry_run)
-            resetter.reset()
-            reset_ok.append((nid, resetter.tracker.count()))
+        counts = aio.run(aio.gather_map(
+            reset_node_async, auth, cureable, dry_run=args.dry_run))
+        reset_ok = list(zip(cureable, counts))
 
         message_lines = []
         if reset_ok:
@@ -14,6 +14,7 @@ import sys
 
 from kubernetes import client, config
 
+from hammers.osrest import cache
 from hammers.util import base_parser
 
 # Kubernetes 10.x/12.x support
@@ -97,6 +98,7 @@ def main(argv=None):
                         help='Perform a dry run without making changes')
 
     args = parser.parse_args(argv[1:])
+    cache.configure_from_args(args)
 
     global _KUBECONFIG_PATH
     _KUBECONFIG_PATH = args.kubeconfig_path
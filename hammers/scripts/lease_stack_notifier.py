@@ -2,13 +2,20 @@
 '''
 .. code-block:: bash
 
-    lease-stack-notifier {info, notify}
+    lease-stack-notifier {info, notify} [--as-of DATE]
 
 Notify about projects that violate terms of use
 
 * ``info`` to just display violations or notify them on email with ``notify``
+* ``--as-of`` evaluates the policy as of another time (UTC) than now, with
+  the leases Blazar has now
+* ``--state FILE`` keeps what each run found, so the next only evaluates
+  projects whose leases changed (or whose result is older than
+  ``--max-age-hours``), and only reports violations not already notified
 '''
+import hashlib
 import json
+import os
 import sys
 from collections import defaultdict
 from datetime import datetime, timedelta
@@ -19,49 +26,57 @@ from keystoneclient.v3.client import Client as KeystoneClient
 from dateutil.parser import parse as datetime_parse
 
 from hammers.notifications import _email
+from hammers.osrest import cache
 from hammers.util import base_parser
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 DATETIME_NOW = datetime.utcnow()
 SECONDS_IN_DAY = timedelta(days=1).total_seconds()
+# a lease overlapping an earlier one of its node type by this much of its
+# duration isn't counted again towards coverage
+OVERLAP_PERCENTAGE = 90
+MINIMUM_LEASE_WINDOW_DAYS = 21
+EPOCH = datetime(1970, 1, 1)
+IGNORED_LEASE_STATUSES = ['terminated', 'error', 'deleting']
+
+
+def parse_date(value):
+    """Parse a Blazar date, quickly if it's ISO 8601 like they usually are."""
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return datetime_parse(value)
 
 
-def calculate_overlap_percentage(lease1, lease2):
+def calculate_overlap_percentage(lease1, lease2, now=None):
     """
     Calculate the percentage of overlap between param:lease1 and param:lease2
-    returns the overlap percentage of param:lease1 with param:lease2
+    returns the overlap percentage of param:lease1 with param:lease2, from
+    param:now on (default DATETIME_NOW)
     """
-    start = max(max(lease1.start, lease2.start), DATETIME_NOW)
+    if now is None:
+        now = DATETIME_NOW
+    start = max(max(lease1.start, lease2.start), now)
     end = min(lease1.end, lease2.end)
     if start >= end:
         return 0  # No overlap
     overlap_duration = (end - start).total_seconds()
     lease1_duration = (
-        lease1.end - max(lease1.start, DATETIME_NOW)
+        lease1.end - max(lease1.start, now)
     ).total_seconds()
     return (overlap_duration / lease1_duration) * 100
 
 
-def does_host_overlap_with_lease(host, host_lease, other_lease):
-    """
-    Check if the given param:host from param:host_lease
-    overlaps with param:other_lease for at least 90% of its duration.
-    """
-    # Only check overlap for leases with matching node types
-    if (
-        host.node_type in other_lease.node_types
-        and calculate_overlap_percentage(host_lease, other_lease) >= 90
-    ):
-        return True
-    return False
-
-
 class Host:
     """ Represents a Host with host attributes """
     def __init__(self, host_id, node_type):
         self.host_id = host_id
         self.node_type = node_type
-        self.calculate_coverage = True
 
     def __dict__(self):
         return {
@@ -95,8 +110,8 @@ class Lease:
     """ Represents a lease with its attributes """
     def __init__(self, lease_details):
         self.lease_id = lease_details['id']
-        self.start = datetime_parse(lease_details['start_date'])
-        self.end = datetime_parse(lease_details['end_date'])
+        self.start = parse_date(lease_details['start_date'])
+        self.end = parse_date(lease_details['end_date'])
         self.status = lease_details['status']
         self.project_id = lease_details['project_id']
         self.hosts = []
@@ -120,56 +135,121 @@ class Lease:
 
     def add_host(self, host):
         self.hosts.append(host)
-        if host.node_type in self.node_types:
-            host.calculate_coverage = False
         self.node_types.add(host.node_type)
 
 
 class Project:
     """ Represents a project with leases """
-    def __init__(self, project_id, minimum_lease_window_days=21):
+    def __init__(self, project_id,
+                 minimum_lease_window_days=MINIMUM_LEASE_WINDOW_DAYS, now=None):
         self.project_id = project_id
         self.leases = set()
+        self.now = DATETIME_NOW if now is None else now
         self.minimum_lease_window = timedelta(days=minimum_lease_window_days)
-        self.furthest_end_date_by_node_type = defaultdict(
-            lambda: DATETIME_NOW + self.minimum_lease_window
+        self._furthest_end_date_by_node_type = defaultdict(
+            lambda: self.now + self.minimum_lease_window
         )
-        self.start_date_by_node_type = defaultdict(lambda: datetime.max)
+        self._start_date_by_node_type = defaultdict(lambda: datetime.max)
+        self._dates_stale = False
+        self._intervals_by_node_type = None
 
     def __str__(self):
         return {
             "id": self.project_id
         }
 
+    @property
+    def furthest_end_date_by_node_type(self):
+        self._update_dates()
+        return self._furthest_end_date_by_node_type
+
+    @property
+    def start_date_by_node_type(self):
+        self._update_dates()
+        return self._start_date_by_node_type
+
     def add_lease(self, lease):
         """Add a lease to the project."""
         self.leases.add(lease)
-        for host in lease.hosts:
-            # if the host does not have an overlapping reservation
-            # with same node type then calculate coverage of host
-            if not self._host_in_overlapping_reservation(host, lease):
-                host.calculate_coverage = True
-            node_type = host.node_type
-            self.furthest_end_date_by_node_type[node_type] = max(
-                self.furthest_end_date_by_node_type[node_type],
+        self._intervals_by_node_type = None
+        if not self._dates_stale:
+            self._add_dates(lease)
+
+    def remove_lease(self, lease):
+        """Remove a lease from the project, as if it was never added."""
+        self.leases.discard(lease)
+        self._reset()
+
+    def set_now(self, now):
+        """Evaluate the project as of param:now from here on."""
+        self.now = now
+        self._reset()
+
+    def _reset(self):
+        # worked out again when next needed, so replaying many changes
+        # between evaluations doesn't redo it for each
+        self._intervals_by_node_type = None
+        self._dates_stale = True
+
+    def _update_dates(self):
+        if not self._dates_stale:
+            return
+        self._dates_stale = False
+        self._furthest_end_date_by_node_type.clear()
+        self._start_date_by_node_type.clear()
+        for lease in self.leases:
+            self._add_dates(lease)
+
+    def _add_dates(self, lease):
+        for node_type in lease.node_types:
+            self._furthest_end_date_by_node_type[node_type] = max(
+                self._furthest_end_date_by_node_type[node_type],
                 lease.end
             )
-            self.start_date_by_node_type[host.node_type] = min(
-                self.start_date_by_node_type[host.node_type],
+            self._start_date_by_node_type[node_type] = min(
+                self._start_date_by_node_type[node_type],
                 lease.start
             )
 
-    def _host_in_overlapping_reservation(self, host, lease):
-        for other_lease in self.leases:
-            if lease.lease_id == other_lease.lease_id:
-                return True  # The same lease, so it overlaps by definition
-            # if the host's node_type is not already seen/reserved in the
-            # project then node_type does not have an overlapping lease
-            if host.node_type not in self.furthest_end_date_by_node_type:
-                return False
-            if does_host_overlap_with_lease(host, lease, other_lease):
-                return True
-        return False
+    def _lease_intervals_by_node_type(self):
+        """
+        The project's leases reserving each node type, as (start, end,
+        lease) sorted by start (from now, if already started), longest first
+        for the same start, so the order doesn't depend on the order leases
+        were added in.
+        """
+        if self._intervals_by_node_type is None:
+            intervals = defaultdict(list)
+            for lease in self.leases:
+                start = max(lease.start, self.now)
+                for node_type in lease.node_types:
+                    intervals[node_type].append((start, lease.end, lease))
+            for node_type_intervals in intervals.values():
+                node_type_intervals.sort(
+                    key=lambda i: (i[0], i[0] - i[1], i[2].lease_id))
+            self._intervals_by_node_type = intervals
+        return self._intervals_by_node_type
+
+    def counted_leases(self, node_type):
+        """
+        The leases reserving param:node_type that count towards its
+        coverage: any that overlaps a lease before it (in start order) for
+        at least OVERLAP_PERCENTAGE of its duration is only a near copy, so
+        isn't counted again. Of the leases before, the one ending last
+        overlaps the most, so only that needs checking.
+        """
+        counted = []
+        furthest = None
+        for start, end, lease in self._lease_intervals_by_node_type().get(node_type, []):
+            if (
+                furthest is None
+                or calculate_overlap_percentage(
+                    lease, furthest, self.now) < OVERLAP_PERCENTAGE
+            ):
+                counted.append(lease)
+            if furthest is None or end > furthest.end:
+                furthest = lease
+        return counted
 
     def _summarize_stacking_violation(self, seconds_covered, total_seconds):
         return {
@@ -180,17 +260,15 @@ class Project:
 
     def get_coverage_by_node_type(self):
         coverage_by_node_type = defaultdict(int)
-        # Calculate coverage based on the adjusted furthest end date
-        for lease in self.leases:
-            for host in lease.hosts:
-                # Do not calculate coverage for multiple hosts
-                # in almost similar reservation periods
-                if not host.calculate_coverage:
-                    continue
+        # Calculate coverage based on the adjusted furthest end date. Each
+        # lease counts once per node type, however many hosts of it, and
+        # not at all if it's in almost the same period as another
+        for node_type in self._lease_intervals_by_node_type():
+            for lease in self.counted_leases(node_type):
                 seconds_covered = (
-                    lease.end - max(DATETIME_NOW, lease.start)
+                    lease.end - max(self.now, lease.start)
                 ).total_seconds()
-                coverage_by_node_type[host.node_type] += seconds_covered
+                coverage_by_node_type[node_type] += seconds_covered
         return coverage_by_node_type
 
     def get_lease_stacking_violations(self, excluded_node_types, lease_coverage_threshold):
@@ -226,7 +304,7 @@ class Project:
         for lease in self.leases:
             for host in lease.hosts:
                 # check if lease end is within the check window
-                if DATETIME_NOW <= lease.end <= DATETIME_NOW + self.minimum_lease_window:
+                if self.now <= lease.end <= self.now + self.minimum_lease_window:
                     nodes_reserved_in_month[host.node_type] += 1
         for node_type, node_counts in nodes_reserved_in_month.items():
             if high_end_node_types and node_type not in high_end_node_types:
@@ -243,8 +321,68 @@ class Project:
         return violations
 
 
+def _microseconds(dt):
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+
+class LeaseColumns:
+    """
+    The hosts, leases and allocations taken in by a LeaseComplianceManager,
+    as columns of codes and times (in microseconds since the epoch), for
+    working out every project's violations at once.
+    """
+    def __init__(self):
+        self.node_type_codes = {}
+        self.project_codes = {}
+        self.lease_codes = {}
+        self.lease_ids = []
+        self.lease_start = []
+        self.lease_end = []
+        self.lease_project = []
+        # leases taken out again by LeaseComplianceManager.remove_lease
+        # keep their rows, but aren't live
+        self.lease_live = []
+        # a row per (lease, host) allocation, like Lease.hosts
+        self.allocation_lease = []
+        self.allocation_node_type = []
+        self._arrays = {}
+
+    def add_host(self, host):
+        self.node_type_codes.setdefault(host.node_type, len(self.node_type_codes))
+
+    def add_lease(self, lease):
+        self.lease_codes[lease.lease_id] = len(self.lease_ids)
+        self.lease_ids.append(lease.lease_id)
+        self.lease_start.append(_microseconds(lease.start))
+        self.lease_end.append(_microseconds(lease.end))
+        self.lease_project.append(self.project_codes.setdefault(
+            lease.project_id, len(self.project_codes)))
+        self.lease_live.append(True)
+
+    def remove_lease(self, lease):
+        self.lease_live[self.lease_codes[lease.lease_id]] = False
+
+    def add_allocation(self, lease, host):
+        self.allocation_lease.append(self.lease_codes[lease.lease_id])
+        self.allocation_node_type.append(self.node_type_codes[host.node_type])
+
+    def array(self, name):
+        """
+        Column param:name (one only ever appended to) as a NumPy array,
+        converting only the values added since it was last asked for.
+        """
+        values = getattr(self, name)
+        array = self._arrays.get(name)
+        if array is None or len(array) != len(values):
+            done = 0 if array is None else len(array)
+            added = numpy.array(values[done:], dtype=numpy.int64)
+            array = added if array is None else numpy.concatenate([array, added])
+            self._arrays[name] = array
+        return array
+
+
 class LeaseComplianceManager:
-    def __init__(self, config, leases, hosts, allocations):
+    def __init__(self, config, leases, hosts, allocations, now=None):
         """ Manager for checking if leases comply with lease stacking policy
 
         Args:
@@ -252,9 +390,11 @@ class LeaseComplianceManager:
             leases (list)
             hosts (list)
             allocations (list)
-            sender_email (str, optional)
+            now (datetime, optional): evaluate the policy as of this time
+                (UTC) instead of DATETIME_NOW
         """
         self.config = config
+        self.now = DATETIME_NOW if now is None else now
         self.leases = leases
         self.hosts = hosts
         self.allocations = allocations
@@ -263,6 +403,7 @@ class LeaseComplianceManager:
         self.leases_by_id = {}
         self.projects_by_id = {}
         self.node_type_counts = defaultdict(int)
+        self.columns = LeaseColumns()
         self._update_hosts()
         self._update_leases()
         self._update_from_allocations()
@@ -273,15 +414,17 @@ class LeaseComplianceManager:
             host_id = host["id"]
             self.hosts_by_id[host_id] = Host(host_id, node_type)
             self.node_type_counts[node_type] += 1
+            self.columns.add_host(self.hosts_by_id[host_id])
 
     def _update_leases(self):
         # creates lease objects and adds leases to projects
         for lease_details in self.leases:
             lease_id = lease_details['id']
-            if lease_details['status'].lower() in ['terminated', 'error', 'deleting']:
+            if lease_details['status'].lower() in IGNORED_LEASE_STATUSES:
                 continue
             lease = Lease(lease_details)
             self.leases_by_id[lease_id] = lease
+            self.columns.add_lease(lease)
 
     def _update_from_allocations(self):
         # adds hosts to the leases they are allocated to
@@ -291,10 +434,47 @@ class LeaseComplianceManager:
                 if lease:
                     host = self.hosts_by_id[allocation['resource_id']]
                     lease.add_host(host)
-                    project_id = lease.project_id
-                    project = self.projects_by_id.get(project_id, Project(project_id))
-                    project.add_lease(lease)
-                    self.projects_by_id[project_id] = project
+                    self.columns.add_allocation(lease, host)
+                    self._project(lease.project_id).add_lease(lease)
+
+    def _project(self, project_id):
+        project = self.projects_by_id.get(project_id)
+        if project is None:
+            project = Project(project_id, now=self.now)
+            self.projects_by_id[project_id] = project
+        return project
+
+    def add_lease(self, lease_details, host_ids):
+        """
+        Take in another lease, allocated the hosts param:host_ids, as if it
+        had been in the leases and allocations given at the start.
+        """
+        lease = Lease(lease_details)
+        self.leases_by_id[lease.lease_id] = lease
+        self.columns.add_lease(lease)
+        for host_id in host_ids:
+            host = self.hosts_by_id[host_id]
+            lease.add_host(host)
+            self.columns.add_allocation(lease, host)
+        if lease.hosts:
+            self._project(lease.project_id).add_lease(lease)
+        return lease
+
+    def remove_lease(self, lease_id):
+        """Forget a lease, as if it had never been taken in."""
+        lease = self.leases_by_id.pop(lease_id)
+        self.columns.remove_lease(lease)
+        project = self.projects_by_id.get(lease.project_id)
+        if project is not None and lease in project.leases:
+            project.remove_lease(lease)
+            if not project.leases:
+                del self.projects_by_id[lease.project_id]
+
+    def set_now(self, now):
+        """Evaluate the policy as of param:now from here on."""
+        self.now = now
+        for project in self.projects_by_id.values():
+            project.set_now(now)
 
     def get_project_violations(self, project_id):
         violations = {}
@@ -311,6 +491,321 @@ class LeaseComplianceManager:
         ))
         return violations
 
+    def violations_by_project(self):
+        """
+        Violations of every project that has any, like
+        :py:meth:`get_project_violations` for each. With NumPy, they're
+        worked out for all projects at once from arrays of the leases and
+        allocations.
+        """
+        if numpy is None or not self.projects_by_id:
+            violations = {}
+            for project_id in self.projects_by_id:
+                project_violations = self.get_project_violations(project_id)
+                if project_violations:
+                    violations[project_id] = project_violations
+            return violations
+        return _vectorized_violations(self)
+
+
+def _vectorized_violations(lcm):
+    """
+    :py:meth:`LeaseComplianceManager.violations_by_project` with NumPy: the
+    same rules as :py:class:`Project`, on columns of (project, node type,
+    lease) rows grouped by sorting, with times in integer microseconds so
+    the sums and comparisons come out the same.
+    """
+    np = numpy
+    config = lcm.config
+    window = timedelta(days=MINIMUM_LEASE_WINDOW_DAYS)
+    now = _microseconds(lcm.now)
+    window_us = window // timedelta(microseconds=1)
+
+    columns = lcm.columns
+    project_ids = list(columns.project_codes)
+    node_types = list(columns.node_type_codes)
+    allocation_lease = columns.array('allocation_lease')
+    allocation_node_type = columns.array('allocation_node_type')
+    live = np.array(columns.lease_live, dtype=bool)[allocation_lease]
+    allocation_lease = allocation_lease[live]
+    allocation_node_type = allocation_node_type[live]
+    lease_start = columns.array('lease_start')
+    lease_end = columns.array('lease_end')
+    lease_project = columns.array('lease_project')
+    # lease IDs ranked among the live leases only
+    live_leases = np.unique(allocation_lease)
+    lease_id_rank = np.zeros(len(columns.lease_ids), dtype=np.int64)
+    lease_id_rank[live_leases] = np.argsort(np.argsort(
+        [columns.lease_ids[n] for n in live_leases]))
+
+    n_types = len(node_types)
+    violations = defaultdict(dict)
+
+    # lease stacking: a row per (lease, node type), like Lease.node_types
+    pairs = np.unique(allocation_lease * n_types + allocation_node_type)
+    lease, node_type = pairs // n_types, pairs % n_types
+    project = lease_project[lease]
+    start, end = lease_start[lease], lease_end[lease]
+    clipped_start = np.maximum(start, now)
+    duration = end - clipped_start
+    # Project._lease_intervals_by_node_type order within each group
+    order = np.lexsort((lease_id_rank[lease], -duration, clipped_start,
+                        node_type, project))
+    group = (project * n_types + node_type)[order]
+    start, end, clipped_start, duration = (
+        start[order], end[order], clipped_start[order], duration[order])
+    first = np.ones(len(group), dtype=bool)
+    first[1:] = group[1:] != group[:-1]
+
+    # the latest end of the earlier leases in each group (see
+    # Project.counted_leases), by a running max that restarts per group:
+    # ends are ranked, and each group's ranks lifted above the last's
+    end_values, end_rank = np.unique(end, return_inverse=True)
+    group_number = np.cumsum(first) - 1
+    running = np.maximum.accumulate(group_number * len(end_values) + end_rank)
+    furthest = np.empty(len(group), dtype=np.int64)
+    furthest[1:] = end_values[running[:-1] - group_number[1:] * len(end_values)]
+    furthest[first] = 0
+
+    overlap = np.minimum(end, furthest) - clipped_start
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentage = (overlap / 1e6) / (duration / 1e6) * 100
+    counted = first | (overlap <= 0) | (percentage < OVERLAP_PERCENTAGE)
+
+    starts = np.flatnonzero(first)
+    groups = group[starts]
+    seconds_covered = np.bincount(
+        group_number, weights=np.where(counted, duration / 1e6, 0.0))
+    earliest = np.minimum.reduceat(start, starts)
+    furthest_end = np.maximum(np.maximum.reduceat(end, starts), now + window_us)
+    seconds_in_coverage_period = (furthest_end - earliest) / 1e6
+
+    excluded = config['exclude_node_types']
+    threshold = config['lease_coverage_threshold']
+    is_excluded = np.array([t.lower() in excluded for t in node_types], dtype=bool)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        over = seconds_covered / seconds_in_coverage_period >= threshold
+    # only the groups to report on, or to say are skipped
+    for n in np.flatnonzero(
+            (seconds_in_coverage_period >= window.total_seconds())
+            & (over | is_excluded[groups % n_types])):
+        project_id = project_ids[groups[n] // n_types]
+        node_type = node_types[groups[n] % n_types]
+        if node_type.lower() in excluded:
+            print(f"Skipping excluded node type - {node_type}")
+            continue
+        covered, total = seconds_covered[n], seconds_in_coverage_period[n]
+        if covered / total >= threshold:
+            violations[project_id][node_type] = (
+                lcm.projects_by_id[project_id]._summarize_stacking_violation(
+                    float(covered), float(total)))
+
+    # high end hogging: hosts of leases ending within the window
+    allocation_end = lease_end[allocation_lease]
+    in_window = (now <= allocation_end) & (allocation_end <= now + window_us)
+    reserved = np.bincount(
+        lease_project[allocation_lease[in_window]] * n_types
+        + allocation_node_type[in_window],
+        minlength=len(project_ids) * n_types)
+
+    high_end = config['high_end_node_types']
+    not_high_end = np.array([bool(high_end) and t not in high_end
+                             for t in node_types], dtype=bool)
+    nodes_by_type = np.array([lcm.node_type_counts[t] for t in node_types])
+    hogging = (
+        (nodes_by_type > config['min_nodes_for_coverage'])
+        & (reserved.reshape(-1, n_types)
+           > config['high_end_node_coverage_threshold'] * nodes_by_type)
+    ).ravel()
+    # only the ones to report on, or to say aren't high end
+    for n in np.flatnonzero(
+            (reserved > 0) & (hogging | np.tile(not_high_end, len(project_ids)))):
+        project_id = project_ids[n // n_types]
+        node_type = node_types[n % n_types]
+        if high_end and node_type not in high_end:
+            print(f"{node_type} - not included as high end")
+            continue
+        total_nodes = lcm.node_type_counts[node_type]
+        if total_nodes <= config['min_nodes_for_coverage']:
+            continue
+        node_counts = int(reserved[n])
+        if node_counts > config['high_end_node_coverage_threshold'] * total_nodes:
+            violations[project_id][node_type] = {
+                "total_nodes": total_nodes,
+                "nodes_reserved": node_counts,
+            }
+
+    return dict(violations)
+
+
+def _digest(value):
+    return hashlib.sha1(
+        json.dumps(value, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def project_digests(leases, hosts, allocations):
+    """
+    A digest per project of everything about its leases that its violations
+    depend on: their IDs, dates, and hosts with their node types. Leases
+    and projects LeaseComplianceManager would leave out are left out.
+    """
+    node_types = {host['id']: host['node_type'] for host in hosts}
+    hosts_by_lease = defaultdict(list)
+    for allocation in allocations:
+        for reservation in allocation['reservations']:
+            hosts_by_lease[reservation['lease_id']].append(allocation['resource_id'])
+    entries = defaultdict(list)
+    for lease in leases:
+        if lease['status'].lower() in IGNORED_LEASE_STATUSES:
+            continue
+        host_ids = hosts_by_lease.get(lease['id'])
+        if not host_ids:
+            continue
+        entries[lease['project_id']].append('{} {} {} {}'.format(
+            lease['id'], lease['start_date'], lease['end_date'],
+            ' '.join(sorted('{}={}'.format(h, node_types[h]) for h in host_ids))))
+    return {
+        project_id: hashlib.sha1(
+            '\n'.join(sorted(project_entries)).encode()).hexdigest()
+        for project_id, project_entries in entries.items()
+    }
+
+
+def site_digest(config, hosts):
+    """
+    A digest of what every project's violations depend on: the policy, and
+    the number of hosts of each node type.
+    """
+    node_type_counts = defaultdict(int)
+    for host in hosts:
+        node_type_counts[host['node_type']] += 1
+    return _digest([config, node_type_counts])
+
+
+class ViolationState:
+    """
+    What earlier runs found, kept in a JSON file between them: per project,
+    the digest of its leases, when it was evaluated and the violations it
+    had then, and what was last notified about it.
+    """
+    VERSION = 1
+
+    def __init__(self, site=None, projects=None):
+        self.site = site
+        self.projects = projects if projects is not None else {}
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return cls()
+        if state.get('version') != cls.VERSION:
+            return cls()
+        return cls(state['site'], state['projects'])
+
+    def save(self, path):
+        # a run stopped half way mustn't leave it half-written
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({
+                'version': self.VERSION,
+                'site': self.site,
+                'projects': self.projects,
+            }, f, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+
+    def stale_projects(self, digests, site, now, max_age):
+        """
+        The projects of param:digests whose violations need working out
+        again: all of them if the policy or hosts changed, otherwise those
+        whose leases changed or were last evaluated more than param:max_age
+        before param:now (coverage of running leases shrinks as time goes).
+        """
+        if site != self.site:
+            return set(digests)
+        stale = set()
+        for project_id, digest in digests.items():
+            entry = self.projects.get(project_id)
+            if entry is None or entry['digest'] != digest:
+                stale.add(project_id)
+                continue
+            age = now - parse_date(entry['evaluated_at'])
+            if not timedelta(0) <= age <= max_age:
+                stale.add(project_id)
+        return stale
+
+    def unnotified(self):
+        """Projects in violation that haven't been notified about it."""
+        return {project_id for project_id in self.projects
+                if self.needs_notice(project_id)}
+
+    def update(self, site, digests, evaluated, violations_by_project, now):
+        """
+        Record the violations of the projects param:evaluated as of
+        param:now, forget projects no longer in param:digests, and return
+        the violations by project of all of them, kept ones included.
+        """
+        self.site = site
+        for project_id in list(self.projects):
+            if project_id not in digests:
+                del self.projects[project_id]
+        for project_id in evaluated:
+            entry = self.projects.setdefault(project_id, {'notified': None})
+            entry.update(
+                digest=digests[project_id],
+                evaluated_at=now.isoformat(),
+                violations=violations_by_project.get(project_id, {}),
+            )
+        return {project_id: entry['violations']
+                for project_id, entry in self.projects.items()
+                if entry['violations']}
+
+    def _notice(self, project_id):
+        entry = self.projects[project_id]
+        return _digest([entry['digest'], sorted(entry['violations'])])
+
+    def needs_notice(self, project_id):
+        """
+        Whether the project is in violation, and nothing was notified yet
+        about these node types with these leases.
+        """
+        entry = self.projects.get(project_id)
+        return bool(entry and entry['violations']
+                    and entry['notified'] != self._notice(project_id))
+
+    def notified(self, project_id):
+        self.projects[project_id]['notified'] = self._notice(project_id)
+
+
+def evaluate(config, leases, hosts, allocations, now=None,
+             state=None, max_age=timedelta(days=7)):
+    """
+    The LeaseComplianceManager for param:leases and the violations by
+    project. With a ViolationState, the manager only takes in the leases of
+    projects that are stale or have violations not yet notified, and the
+    other projects' violations are the ones kept in param:state. param:now
+    defaults to the time of the call, not of the import, so a long-running
+    process keeps ageing the kept results.
+    """
+    if now is None:
+        now = datetime.utcnow()
+    if state is None:
+        lcm = LeaseComplianceManager(config, leases, hosts, allocations, now=now)
+        return lcm, lcm.violations_by_project()
+    digests = project_digests(leases, hosts, allocations)
+    site = site_digest(config, hosts)
+    evaluated = state.stale_projects(digests, site, now, max_age)
+    evaluated.update(state.unnotified().intersection(digests))
+    lcm = LeaseComplianceManager(
+        config, [l for l in leases if l['project_id'] in evaluated],
+        hosts, allocations, now=now)
+    violations_by_project = state.update(
+        site, digests, evaluated, lcm.violations_by_project(), now)
+    return lcm, violations_by_project
+
 
 def project_lease_violation_body(project, project_violations,
                                  project_name, site_name):
@@ -381,7 +876,25 @@ def main(argv=None):
         type=str,
         help='JSON file with configuration for lease stacking policy'
     )
+    parser.add_argument(
+        '--as-of',
+        type=parse_date,
+        help='Evaluate the policy as of this time (UTC) instead of now'
+    )
+    parser.add_argument(
+        '--state',
+        type=str,
+        help='JSON file to keep violations found in, between runs'
+    )
+    parser.add_argument(
+        '--max-age-hours',
+        type=float,
+        default=24 * 7,
+        help='With --state, re-evaluate projects whose leases are unchanged '
+             'after this long. Default: %(default)s'
+    )
     args = parser.parse_args(argv[1:])
+    cache.configure_from_args(args)
     with open(args.config) as cf_file:
         config = json.loads(cf_file.read())
 
@@ -398,7 +911,11 @@ def main(argv=None):
     projects = keystone.projects.list()
     project_charge_code_map = {p.id: p.name.lower() for p in projects}
     json.dumps(project_charge_code_map, indent=2)
-    lcm = LeaseComplianceManager(config, leases, hosts, allocations)
+    now = args.as_of or datetime.utcnow()
+    state = ViolationState.load(args.state) if args.state else None
+    lcm, violations_by_project = evaluate(
+        config, leases, hosts, allocations, now=now, state=state,
+        max_age=timedelta(hours=args.max_age_hours))
 
     for project_id in lcm.projects_by_id:
         project_name = project_charge_code_map.get(project_id, '')
@@ -408,9 +925,12 @@ def main(argv=None):
         ):
             print(f"Skipping Excluded project - {project_id}")
             continue
-        violations = lcm.get_project_violations(project_id)
+        violations = violations_by_project.get(project_id)
         if not violations:
             continue
+        if state is not None and not state.needs_notice(project_id):
+            print(f"Already notified of violations with Project - {project_id}")
+            continue
         print(f"Found lease stacking violations with Project - {project_id}")
         message = project_lease_violation_body(
             lcm.projects_by_id[project_id], violations,
@@ -421,9 +941,14 @@ def main(argv=None):
                 project_id, message, config['manager_email'],
                 config['sender_email']
             )
+            if state is not None:
+                state.notified(project_id)
         else:
             print(message)
 
+    if state is not None:
+        state.save(args.state)
+
 
 if __name__ == '__main__':
     sys.exit(main(sys.argv))
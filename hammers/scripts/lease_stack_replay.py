@@ -0,0 +1,238 @@
+# coding: utf-8
+'''
+.. code-block:: bash
+
+    lease-stack-replay --config policy.json --start 2024-01-01 --end 2025-01-01 [--step-hours 24] [--thresholds 0.5 0.6 0.7]
+
+Replays the lease stacking policy of :py:mod:`hammers.scripts.lease_stack_notifier`
+over a history of leases, evaluating it every ``--step-hours`` from
+``--start`` to ``--end`` (UTC), and summarizes how many projects would have
+been in violation at each ``--thresholds`` value of
+``lease_coverage_threshold`` (default: the one in the config).
+
+At each step, a lease counts if it had been created, and hadn't ended or
+been deleted. The history comes from the Blazar database (see
+:py:func:`hammers.query.blazar_lease_history`), or a ``--history`` file
+with a JSON lease per line, as Blazar lists them plus ``created_at``,
+``deleted_at`` (``null`` if not) and the IDs of their ``hosts``. Hosts and
+their node types come from Blazar, or a ``--hosts`` JSON file of them.
+'''
+import contextlib
+import io
+import itertools
+import json
+import sys
+from datetime import datetime, timedelta
+
+import openstack
+from blazarclient.client import Client as BlazarClient
+
+from hammers import MySqlArgs, query
+from hammers.scripts.lease_stack_notifier import (
+    EPOCH, LeaseComplianceManager, parse_date,
+)
+from hammers.osrest import cache
+from hammers.util import base_parser
+
+
+class LeaseHistoryReplay:
+    """
+    Evaluates the lease stacking policy at successive times over a history
+    of leases. One :py:class:`LeaseComplianceManager` is kept up to date
+    from step to step, taking in the leases created and forgetting the ones
+    ended or deleted since the last, instead of one being built per step.
+
+    Args:
+        config (dict): lease stacking policy, as for the notifier
+        hosts (list): Blazar hosts, with their node types
+        history (iterable): leases, as Blazar lists them, plus
+            ``created_at``, ``deleted_at`` (None if not) and the IDs of
+            their ``hosts``; hosts no longer in param:hosts are left out
+    """
+    def __init__(self, config, hosts, history):
+        self.lcm = LeaseComplianceManager(config, [], hosts, [], now=EPOCH)
+        # the database's host IDs are numbers, the API's strings
+        host_ids = {str(host['id']): host['id'] for host in hosts}
+        self.leases = {}
+        appearances = []
+        disappearances = []
+        for lease in history:
+            lease_hosts = [host_ids[str(host_id)] for host_id in lease['hosts']
+                           if str(host_id) in host_ids]
+            if lease['status'].lower() == 'error' or not lease_hosts:
+                continue
+            created = (parse_date(lease['created_at'])
+                       if lease.get('created_at') else datetime.min)
+            gone = parse_date(lease['end_date'])
+            if lease.get('deleted_at'):
+                gone = min(gone, parse_date(lease['deleted_at']))
+            if created >= gone:
+                continue
+            self.leases[lease['id']] = dict(lease, hosts=lease_hosts)
+            appearances.append((created, lease['id'], gone))
+            disappearances.append((gone, lease['id']))
+        appearances.sort()
+        disappearances.sort()
+        self._appearances = iter(appearances)
+        self._disappearances = iter(disappearances)
+        self._next_appearance = next(self._appearances, None)
+        self._next_disappearance = next(self._disappearances, None)
+        self.now = None
+
+    def advance(self, now):
+        """
+        Bring the manager up to param:now, which can't be before the last
+        time advanced to.
+        """
+        if self.now is not None and now < self.now:
+            raise ValueError('cannot go back from {} to {}'.format(self.now, now))
+        self.now = now
+        lcm = self.lcm
+        while self._next_appearance is not None and self._next_appearance[0] <= now:
+            _, lease_id, gone = self._next_appearance
+            # skip leases that came and went between steps
+            if gone > now:
+                lease = self.leases[lease_id]
+                lcm.add_lease(lease, lease['hosts'])
+            self._next_appearance = next(self._appearances, None)
+        while self._next_disappearance is not None and self._next_disappearance[0] <= now:
+            _, lease_id = self._next_disappearance
+            if lease_id in lcm.leases_by_id:
+                lcm.remove_lease(lease_id)
+            self._next_disappearance = next(self._disappearances, None)
+        lcm.set_now(now)
+
+    def run(self, times):
+        """
+        Yields each of param:times (in order) with the violations by
+        project at that time, as
+        :py:meth:`LeaseComplianceManager.violations_by_project` finds them.
+        """
+        for now in times:
+            self.advance(now)
+            # the notifier's skip messages would repeat at every step
+            with contextlib.redirect_stdout(io.StringIO()):
+                violations = self.lcm.violations_by_project()
+            yield now, violations
+
+
+def load_history(rows):
+    """
+    Leases for :py:class:`LeaseHistoryReplay` from the rows of
+    :py:func:`hammers.query.blazar_lease_history`.
+    """
+    def isoformat(value):
+        return value.isoformat() if value is not None else None
+
+    for lease_id, allocations in itertools.groupby(rows, key=lambda r: r['id']):
+        allocations = list(allocations)
+        lease = allocations[0]
+        yield {
+            'id': lease_id,
+            'project_id': lease['project_id'],
+            'status': lease['status'],
+            'start_date': isoformat(lease['start_date']),
+            'end_date': isoformat(lease['end_date']),
+            'created_at': isoformat(lease['created_at']),
+            'deleted_at': isoformat(lease['deleted_at']),
+            'hosts': [a['host_id'] for a in allocations],
+        }
+
+
+def summarize(results, thresholds, exclude_projects=()):
+    """
+    Per threshold, the number of (step, project) pairs over the lease
+    stacking threshold, and of distinct projects that ever were, from the
+    violations found at the lowest threshold. High-end hogging doesn't
+    depend on the threshold, so is counted once.
+    """
+    stacking = {threshold: [0, set()] for threshold in thresholds}
+    hogging = [0, set()]
+    for now, violations in results:
+        for project_id, project_violations in violations.items():
+            if project_id in exclude_projects:
+                continue
+            coverage = max((v['coverage_percentage']
+                            for v in project_violations.values()
+                            if 'coverage_percentage' in v), default=None)
+            for threshold in thresholds:
+                if coverage is not None and coverage >= threshold * 100:
+                    stacking[threshold][0] += 1
+                    stacking[threshold][1].add(project_id)
+            if any('nodes_reserved' in v for v in project_violations.values()):
+                hogging[0] += 1
+                hogging[1].add(project_id)
+    return stacking, hogging
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+
+    parser = base_parser('Replay the lease stacking policy over lease history')
+    mysqlargs = MySqlArgs({
+        'user': 'root',
+        'password': '',
+        'host': 'localhost',
+        'port': 3306,
+    })
+    mysqlargs.inject(parser)
+    parser.add_argument('--config', type=str, required=True,
+        help='JSON file with configuration for lease stacking policy')
+    parser.add_argument('--start', type=parse_date, required=True,
+        help='First time (UTC) to evaluate the policy at')
+    parser.add_argument('--end', type=parse_date, required=True,
+        help='Time (UTC) to stop at')
+    parser.add_argument('--step-hours', type=float, default=24,
+        help='Hours between evaluations. Default: %(default)s')
+    parser.add_argument('--thresholds', type=float, nargs='+',
+        help='Values of lease_coverage_threshold to try. Default: the config\'s')
+    parser.add_argument('--history', type=str,
+        help='File with a JSON lease per line, instead of reading Blazar\'s database')
+    parser.add_argument('--hosts', type=str,
+        help='JSON file with the Blazar hosts, instead of listing them')
+
+    args = parser.parse_args(argv[1:])
+    cache.configure_from_args(args)
+    if args.step_hours <= 0:
+        raise ValueError('--step-hours must be positive')
+    with open(args.config) as cf_file:
+        config = json.loads(cf_file.read())
+    thresholds = sorted(args.thresholds or [config['lease_coverage_threshold']])
+    config['lease_coverage_threshold'] = thresholds[0]
+
+    if args.hosts:
+        with open(args.hosts) as hosts_file:
+            hosts = json.load(hosts_file)
+    else:
+        conn = openstack.connect(cloud='envvars')
+        hosts = BlazarClient("1", session=conn.session).host.list()
+
+    if args.history:
+        with open(args.history) as history_file:
+            history = [json.loads(line) for line in history_file if line.strip()]
+    else:
+        mysqlargs.extract(args)
+        db = mysqlargs.connect()
+        history = list(load_history(query.blazar_lease_history(db, args.start)))
+
+    step = timedelta(hours=args.step_hours)
+    steps = int((args.end - args.start) / step) + 1
+    times = [args.start + n * step for n in range(steps)]
+
+    replay = LeaseHistoryReplay(config, hosts, history)
+    stacking, hogging = summarize(
+        replay.run(times), thresholds, config['exclude_projects'])
+
+    print('{} leases, {} steps from {} to {}'.format(
+        len(replay.leases), len(times), times[0], times[-1]))
+    print('{:>10s} {:>14s} {:>10s}'.format('threshold', 'project-steps', 'projects'))
+    for threshold in thresholds:
+        count, projects = stacking[threshold]
+        print('{:10.3f} {:14d} {:10d}'.format(threshold, count, len(projects)))
+    print('high-end hogging: {} project-steps, {} projects'.format(
+        hogging[0], len(hogging[1])))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
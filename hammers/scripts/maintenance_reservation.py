@@ -12,6 +12,7 @@ from keystoneauth1 import adapter, loading, session
 from keystoneauth1.identity import v3
 
 from hammers import MySqlArgs
+from hammers.osrest import cache
 from hammers.slack import Slackbot
 from hammers.util import base_parser
 
@@ -180,6 +181,7 @@ def main(argv=None):
                         help='estimated hours required for maintenance; default is 168 hours (1 week)')
 
     args = parser.parse_args(argv[1:])
+    cache.configure_from_args(args)
 
     slack = Slackbot(args.slack, script_name='maintenance-reservation') if args.slack else None
 
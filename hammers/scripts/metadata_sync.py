@@ -11,6 +11,7 @@ import requests
 import six
 
 from hammers import osapi, osrest
+from hammers.osrest import cache
 from hammers.util import base_parser
 
 # FIXME: this should be looked up from sites.json from the G5k API
@@ -175,6 +176,7 @@ def main(argv=None):
     parser.add_argument('-v', '--verbose', action='store_true')
 
     args = parser.parse_args(argv[1:])
+    cache.configure_from_args(args)
     auth = osapi.Auth.from_env_or_args(args=args)
     dry_run = args.action == 'info'
     any_updates = False
@@ -13,6 +13,14 @@ Required arguments, in order:
 * ``info`` to just display what would be cleaned up, or actually clean it up with ``delete``.
 * Consider floating ``ip``'s or ``port``'s
 * A project needs to be idle for ``grace-days`` days.
+
+By default the idle projects and their resources are found with one query
+(``--lookup join``). ``--lookup chunked`` finds the idle projects first (from
+their instances in both the ``nova`` and ``nova_cell0`` databases) and then
+their resources with a query per ``--chunk-size`` projects, in case the
+database doesn't get along with the join; ``--chunk-size 1`` is a query per
+project, as it used to be. With ``--connections N`` those queries run over up
+to *N* database connections at once.
 '''
 #TODO: Used for KVM site only. After upgrading KVM site to OpenStack Rocky version, remove this script and use floatingip-reaper.
 
@@ -24,14 +32,20 @@ import datetime
 from pprint import pprint
 
 from hammers import MySqlArgs, osapi, osrest, query
+from hammers.osrest import cache
 from hammers.slack import Slackbot
 from hammers.util import base_parser
 
 OS_ENV_PREFIX = 'OS_'
 
 RESOURCE_QUERY = {
-    'ip': query.owned_compute_ip_single,
-    'port': query.owned_compute_port_single,
+    'ip': query.owned_compute_ips,
+    'port': query.owned_compute_ports,
+}
+
+IDLE_RESOURCE_QUERY = {
+    'ip': query.idle_owned_compute_ips,
+    'port': query.idle_owned_compute_ports,
 }
 
 RESOURCE_DELETE_COMMAND = {
@@ -39,7 +53,7 @@ RESOURCE_DELETE_COMMAND = {
     'port': osrest.neutron.port_delete,
 }
 
-assert set(RESOURCE_QUERY) == set(RESOURCE_DELETE_COMMAND)
+assert set(RESOURCE_QUERY) == set(IDLE_RESOURCE_QUERY) == set(RESOURCE_DELETE_COMMAND)
 
 def days_past(dt):
     if isinstance(dt, str):
@@ -63,29 +77,25 @@ def check_lease_past_end_date(db, not_down):
                     del not_down[idx]
 
 
-def find_reapable_resources(db, auth, type_, idle_days, whitelist):
+def too_idle_resources(db, type_, idle_days, whitelist, chunk_size, pool=None):
     future_projects = set()
     db_names = ['nova']
+    if db.version == query.ROCKY:
+        # instances that never got scheduled live in the cell0 database
+        db_names.append('nova_cell0')
 
     project_last_seen = {}
-    for db_name in db_names:
-        for row in query.latest_instance_interaction(db, db_name):
-            # Projects that have active instances are not considered as idled projects
-            if row['active']: continue
-            proj_id = row['id']
-            if (proj_id in whitelist
-                    or row['name'] in whitelist
-                    or proj_id in future_projects):
-                # skip
-                continue
-            try:
-                already_last_seen = project_last_seen[proj_id]
-            except KeyError:
-                # new ID
-                project_last_seen[proj_id] = row['latest_interaction']
-            else:
-                # existing ID, keep the max date
-                project_last_seen[proj_id] = max(row['latest_interaction'], already_last_seen)
+    # a row per project, over all the databases (at once, given a pool)
+    for row in query.latest_instance_interactions(db, db_names, pool=pool):
+        # Projects that have active instances are not considered as idled projects
+        if row['active']: continue
+        proj_id = row['id']
+        if (proj_id in whitelist
+                or row['name'] in whitelist
+                or proj_id in future_projects):
+            # skip
+            continue
+        project_last_seen[proj_id] = row['latest_interaction']
 
     too_idle_project_ids = [
         proj_id
@@ -94,17 +104,31 @@ def find_reapable_resources(db, auth, type_, idle_days, whitelist):
         if days_past(last_seen) > idle_days
     ]
 
-    resource_query = RESOURCE_QUERY[type_]
+    return RESOURCE_QUERY[type_](db, too_idle_project_ids, chunk_size,
+                                 pool=pool)
+
+
+def find_reapable_resources(db, auth, type_, idle_days, whitelist,
+                            lookup='join', chunk_size=query.DEFAULT_CHUNK_SIZE,
+                            pool=None):
+    # TODO replace SQL query by looking at floating IP data from
+    # the HTTP endpoint
+    if lookup == 'join':
+        resources = (
+            resource
+            for resource in IDLE_RESOURCE_QUERY[type_](db, idle_days)
+            if resource['project_id'] not in whitelist
+        )
+    else:
+        resources = too_idle_resources(db, type_, idle_days, whitelist,
+                                       chunk_size, pool=pool)
 
     to_delete = []
     not_down = [] # should be empty, otherwise fail.
-    for proj_id in too_idle_project_ids:
-        # TODO replace SQL query by looking at floating IP data from
-        # the HTTP endpoint
-        for resource in resource_query(db, proj_id):
-            to_delete.append(resource['id'])
-            if (resource['status'] != 'DOWN'):
-                not_down.append(resource)
+    for resource in resources:
+        to_delete.append(resource['id'])
+        if (resource['status'] != 'DOWN'):
+            not_down.append(resource)
 
     if not_down:
         raise RuntimeError('error: not all resources selected are in "DOWN" state'
@@ -136,8 +160,21 @@ def main(argv=None):
     parser.add_argument('idle_days', type=float,
         help='Number of days since last active instance in project was '
         'deleted to consider it idle.')
+    parser.add_argument('--lookup', choices=['join', 'chunked'], default='join',
+        help='Find the idle projects\' resources in one query, or a query '
+        'per chunk of projects. Default: %(default)s')
+    parser.add_argument('--chunk-size', type=int,
+        default=query.DEFAULT_CHUNK_SIZE,
+        help='Projects per query with "--lookup chunked". '
+        'Default: %(default)s')
+    parser.add_argument('--connections', type=int, default=1,
+        help='Database connections to run "--lookup chunked" queries over '
+        'at once. Default: %(default)s')
 
     args = parser.parse_args(argv[1:])
+    if args.connections < 1:
+        parser.error('--connections must be at least 1')
+    cache.configure_from_args(args)
     mysqlargs.extract(args)
     auth = osapi.Authv2.from_env_or_args(args=args)
 
@@ -150,9 +187,15 @@ def main(argv=None):
 
     db = mysqlargs.connect()
     db.version = query.ROCKY
+    pool = None
+    if args.connections > 1:
+        pool = mysqlargs.connect(pool=True, size=args.connections)
+        pool.version = query.ROCKY
 
     try:
-        to_delete = find_reapable_resources(db=db, auth=auth, type_=args.type, idle_days=args.idle_days, whitelist=whitelist)
+        to_delete = find_reapable_resources(db=db, auth=auth, type_=args.type, idle_days=args.idle_days, whitelist=whitelist,
+                                            lookup=args.lookup, chunk_size=args.chunk_size,
+                                            pool=pool)
 
         thing = '{}{}'.format(
             {'ip': 'floating IP', 'port': 'port'}[args.type],
@@ -184,6 +227,9 @@ def main(argv=None):
         if slack:
             slack.exception()
         raise
+    finally:
+        if pool is not None:
+            pool.close()
 
 
 if __name__ == '__main__':
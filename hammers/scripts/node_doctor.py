@@ -5,11 +5,14 @@
     node-doctor <node_name>
 
 '''
+import asyncio
 from datetime import datetime, timedelta
 import re
 import sys
 
 from hammers import osrest, osapi
+from hammers.osrest import aio, cache
+from hammers.snapshot import CloudSnapshot
 from hammers.util import base_parser, now_utc, parse_datestr
 
 MAINTENANCE_LEASE_REGEX = "^[a-zA-Z0-9\-]+-maintenance$"
@@ -89,9 +92,10 @@ def node_stuck_deleting(nodes):
 
 
 def node_maintenance_state_error(auth, nodes):
+    snapshot = CloudSnapshot.of(auth)
     pattern = re.compile(MAINTENANCE_LEASE_REGEX)
     maintenance_leases = {
-        l['name']: l for l_id, l in osrest.blazar.leases(auth).items()
+        l['name']: l for l_id, l in snapshot.blazar_leases.items()
         if re.match(pattern, l['name'])}
 
     for nid, node in nodes.items():
@@ -101,11 +105,12 @@ def node_maintenance_state_error(auth, nodes):
 
 
 def node_not_in_freepool(auth, nodes):
-    freepool = osrest.nova.aggregate_details(auth, '1')
-    hosts = osrest.blazar.hosts(auth)
-    unallocated_nodes = [
+    snapshot = CloudSnapshot.of(auth)
+    freepool = snapshot.nova_aggregates[osrest.nova.FREEPOOL_AGGREGATE_ID]
+    hosts = snapshot.blazar_hosts
+    unallocated_nodes = {
         hosts[x['resource_id']]['hypervisor_hostname'] for x
-        in osrest.blazar.host_allocations(auth) if not x['reservations']]
+        in snapshot.blazar_allocations if not x['reservations']}
 
     for node_id in available_nodes(nodes):
         if node_id in unallocated_nodes and node_id not in freepool['hosts']:
@@ -113,12 +118,13 @@ def node_not_in_freepool(auth, nodes):
 
 
 def node_undead_instance(auth, nodes):
+    snapshot = CloudSnapshot.of(auth)
     node_instance_map = {
         n['instance_uuid']: n for n in nodes.values()
         if n['instance_uuid'] is not None}
 
     node_instance_ids = set(node_instance_map)
-    instance_ids = set(osrest.nova_instances(auth))
+    instance_ids = set(snapshot.nova_instances)
     unbound_instances = node_instance_ids - instance_ids
 
     for instance_id in unbound_instances:
@@ -126,20 +132,33 @@ def node_undead_instance(auth, nodes):
         nodes[node_id]['ailments'].append("undead_instance")
 
 
+async def _resource_provider_state(auth, node_id, provider_by_node):
+    provider_id = provider_by_node.get(node_id)
+    in_use, reserved = await asyncio.gather(
+        aio.placement.resource_provider(auth, provider_id, 'usages'),
+        aio.placement.resource_provider(
+            auth, provider_id, 'inventories',
+            resource_class='CUSTOM_BAREMETAL'))
+
+    allocations = None
+    if in_use:
+        allocations = await aio.placement.resource_provider(
+            auth, node_id, 'allocations')
+
+    return in_use, reserved, allocations
+
+
 def resource_provider_failure(auth, nodes):
+    auth = CloudSnapshot.of(auth).auth
     provider_by_node = {p['name']: p['uuid'] for p
                         in osrest.placement.resource_providers(auth)}
 
-    for node_id in available_nodes(nodes):
-        in_use = osrest.placement.resource_provider(
-            auth, provider_by_node.get(node_id), 'usages')
-        reserved = osrest.placement.resource_provider(
-            auth, provider_by_node.get(node_id), 'inventories',
-            resource_class='CUSTOM_BAREMETAL')
+    node_ids = available_nodes(nodes)
+    states = aio.run(aio.gather_map(
+        _resource_provider_state, auth, node_ids, provider_by_node))
 
+    for node_id, (in_use, reserved, allocations) in zip(node_ids, states):
         if in_use:
-            allocations = osrest.placement.resource_provider(
-                auth, node_id, 'allocations')
             if allocations['allocations']:
                 nodes[node_id]['ailments'].append(
                     "resource_provider_allocated")
@@ -154,20 +173,24 @@ def main(argv=None):
     parser = base_parser('Diagnose node(s) for error states.')
     parser.add_argument('--nodes', nargs="+", type=str, default=[])
 
-    args = parser.parse_args(sys.argv[1:])
+    args = parser.parse_args(argv[1:])
+    cache.configure_from_args(args)
     auth = osapi.Auth.from_env_or_args(args=args)
+    snapshot = CloudSnapshot(auth).prefetch(
+        'ironic_nodes', 'blazar_leases', 'blazar_hosts', 'blazar_allocations',
+        'nova_aggregates', 'nova_instances')
 
     nodes = {
         nid: dict(n, **{"ailments": []}) for nid, n
-        in osrest.ironic_nodes(auth, details=True).items()
+        in snapshot.ironic_nodes.items()
         if n['name'] in args.nodes or not args.nodes}
 
     node_in_error_state(nodes)
     node_stuck_deleting(nodes)
-    node_maintenance_state_error(auth, nodes)
-    node_not_in_freepool(auth, nodes)
-    node_undead_instance(auth, nodes)
-    resource_provider_failure(auth, nodes)
+    node_maintenance_state_error(snapshot, nodes)
+    node_not_in_freepool(snapshot, nodes)
+    node_undead_instance(snapshot, nodes)
+    resource_provider_failure(snapshot, nodes)
 
     for node_id, node in nodes.items():
         print("Checking Node {name} (uuid: {uuid})".format(
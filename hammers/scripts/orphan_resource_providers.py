@@ -15,6 +15,7 @@ errors when launching instances. This detects the issue (``info``) and fixes it
 import sys
 
 from hammers import MySqlArgs, osapi, query
+from hammers.osrest import cache
 from hammers.slack import Slackbot
 from hammers.util import base_parser
 
@@ -27,7 +28,7 @@ def resource_providers_fixer(db, describe=False, quiet=False):
         return count
     else:
         count = query.update_orphan_resource_providers(db)
-        db.db.commit()
+        db.commit()
         print('Updated %d orphaned resource providers' % count)
         return count
 
@@ -51,6 +52,7 @@ def main(argv=None):
                         help='Just display info or actually update them?')
 
     args = parser.parse_args(argv[1:])
+    cache.configure_from_args(args)
     mysqlargs.extract(args)
 
     slack = Slackbot(args.slack, script_name='orphan-resource-providers') if args.slack else None
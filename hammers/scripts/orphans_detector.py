@@ -11,6 +11,11 @@ Optional arguments:
 * ``--dbversion rocky`` needed for the Rocky release as the database schema
   changed slightly.
 * ``--kvm`` run on kvm site.
+* ``--keystone-in-memory`` read Keystone's users, projects and memberships
+  once and check the candidates against them, rather than joining every
+  query with Keystone's tables. Faster with many users and assignments.
+* ``--connections N`` query the cell databases' instances over up to *N*
+  connections at once rather than one after another.
 
 '''
 
@@ -19,6 +24,7 @@ import sys
 import os
 
 from hammers import MySqlArgs, osapi, query
+from hammers.osrest import cache
 from hammers.slack import Slackbot
 from hammers.util import base_parser
 
@@ -45,11 +51,11 @@ def get_orphan_info_from_query(query_result):
 
     return orphans
 
-def get_orphan_leases(db):
-    return get_orphan_info_from_query(query.orphans(db, 'lease'))
+def get_orphan_leases(db, keystone=None, pool=None):
+    return get_orphan_info_from_query(query.orphans(db, 'lease', pool=pool, keystone=keystone))
 
-def get_orphan_instances(db):
-    return get_orphan_info_from_query(query.orphans(db, 'instance'))
+def get_orphan_instances(db, keystone=None, pool=None):
+    return get_orphan_info_from_query(query.orphans(db, 'instance', pool=pool, keystone=keystone))
 
 def get_orphan_instances_kvm(db, kc):
     orphans = {}
@@ -116,18 +122,33 @@ def main(argv=None):
         help='Version of the database. Schemas differ, pick the appropriate one.',
         choices=[query.LIBERTY, query.ROCKY], default=query.ROCKY)
     parser.add_argument('--kvm', help='Run at KVM site', action='store_true')
+    parser.add_argument('--keystone-in-memory', action='store_true',
+        help='Load Keystone memberships once instead of joining them in each query')
+    parser.add_argument('--connections', type=int, default=1,
+        help='Database connections to query the cell databases over at once. '
+             'Default: %(default)s')
     osapi.add_arguments(parser)
 
     args = parser.parse_args(argv[1:])
+    if args.connections < 1:
+        parser.error('--connections must be at least 1')
+    cache.configure_from_args(args)
     mysqlargs.extract(args)
 
     kvm = args.kvm
 
     slack = Slackbot(args.slack, script_name='orphan-detector') if args.slack else None
 
+    pool = None
     try:
         db = mysqlargs.connect()
         db.version = args.dbversion
+        if args.connections > 1:
+            pool = mysqlargs.connect(pool=True, size=args.connections)
+            pool.version = args.dbversion
+        membership = None
+        if args.keystone_in_memory and not kvm:
+            membership = query.KeystoneMembership.load(db)
 
         if kvm:
             # at kvm site
@@ -144,7 +165,7 @@ def main(argv=None):
 
             orphan_instances = get_orphan_instances_kvm(db, keystone)
         else:
-            orphan_instances = get_orphan_instances(db)
+            orphan_instances = get_orphan_instances(db, membership, pool)
 
         orphan_instances_report = generate_report(orphan_instances, "-" * 45 + "ORPHAN INSTANCES" + "-" * 45)
 
@@ -158,7 +179,7 @@ def main(argv=None):
 
         # Additionally perform lease report for CHI
         if not kvm:
-            orphan_leases_report = generate_report(get_orphan_leases(db), "-" * 45 + "ORPHAN LEASES" + "-" * 45)
+            orphan_leases_report = generate_report(get_orphan_leases(db, membership, pool), "-" * 45 + "ORPHAN LEASES" + "-" * 45)
 
             if orphan_leases_report:
                 print(orphan_leases_report)
@@ -171,6 +192,9 @@ def main(argv=None):
         if slack:
             slack.exception()
         raise
+    finally:
+        if pool is not None:
+            pool.close()
 
 if __name__ == '__main__':
     sys.exit(main(sys.argv))
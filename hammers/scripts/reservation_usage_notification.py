@@ -11,6 +11,7 @@ from dateutil import tz
 
 from hammers import MySqlArgs, osapi, query
 from hammers.notifications import _email
+from hammers.osrest import cache
 from hammers.util import base_parser
 
 logging.basicConfig()
@@ -64,6 +65,7 @@ def main(argv=None):
     mysqlargs.inject(parser)
 
     args = parser.parse_args(argv[1:])
+    cache.configure_from_args(args)
     mysqlargs.extract(args)
 
     db = mysqlargs.connect()
@@ -0,0 +1,98 @@
+# coding: utf-8
+import unittest
+from unittest import mock
+
+import argparse
+
+from hammers.events import AmqpSource, FakeSource, parse
+from hammers.scripts import event_responder
+
+
+def node(**fields):
+    data = {
+        'uuid': 'node-1',
+        'provision_state': 'active',
+        'maintenance': False,
+        'last_error': None,
+        'instance_uuid': None,
+    }
+    data.update(fields)
+    return data
+
+
+class TestParse(unittest.TestCase):
+    def test_unwraps_envelope_and_object(self):
+        source = FakeSource()
+        source.publish('instance.delete.end', {'uuid': 'i-1'})
+        notification = parse(source.queue.get())
+        self.assertEqual(notification.event_type, 'instance.delete.end')
+        self.assertEqual(notification.payload, {'uuid': 'i-1'})
+
+
+class TestTopics(unittest.TestCase):
+    def test_per_service_defaults(self):
+        source = AmqpSource('rabbit://')
+        self.assertEqual(source.topic('ironic'), 'ironic_versioned_notifications')
+        self.assertEqual(source.topic('nova'), 'versioned_notifications')
+        self.assertEqual(source.topic('cinder'), 'versioned_notifications')
+
+    def test_override(self):
+        source = AmqpSource('rabbit://', topics={'ironic': 'notifications'})
+        self.assertEqual(source.topic('ironic'), 'notifications')
+        self.assertEqual(source.topic('nova'), 'versioned_notifications')
+
+    def test_parse_override(self):
+        self.assertEqual(event_responder.topic_override('ironic=notes'),
+                         ('ironic', 'notes'))
+        for value in ['ironic', 'ironic=', '=notes']:
+            with self.assertRaises(argparse.ArgumentTypeError):
+                event_responder.topic_override(value)
+
+
+class TestEventResponder(unittest.TestCase):
+    def setUp(self):
+        self.source = FakeSource()
+        self.auth = mock.Mock()
+
+    def run_router(self, **kwargs):
+        with mock.patch('builtins.print'):
+            router = event_responder.build_router(self.auth, **kwargs)
+            self.source.consume(router.dispatch)
+
+    @mock.patch('hammers.scripts.ironic_error_resetter.reset_node', return_value=1)
+    def test_resets_cureable_node(self, reset_node):
+        self.source.publish(
+            'baremetal.node.provision_set.end',
+            node(provision_state='error', last_error='Failed to tear down'),
+            object_key='ironic_object')
+        self.run_router(fix=True)
+        reset_node.assert_called_once_with(self.auth, 'node-1', dry_run=False)
+
+    @mock.patch('hammers.scripts.ironic_error_resetter.reset_node')
+    def test_info_mode_does_not_reset(self, reset_node):
+        self.source.publish(
+            'baremetal.node.provision_set.end',
+            node(provision_state='error', last_error='Failed to tear down'),
+            object_key='ironic_object')
+        self.run_router(fix=False)
+        reset_node.assert_not_called()
+
+    @mock.patch('hammers.scripts.ironic_error_resetter.reset_node')
+    def test_ignores_healthy_node(self, reset_node):
+        self.source.publish('baremetal.node.provision_set.end', node(),
+                            object_key='ironic_object')
+        self.run_router(fix=True)
+        reset_node.assert_not_called()
+
+    @mock.patch('hammers.scripts.undead_instances.clear_node_instance_data')
+    @mock.patch('hammers.osrest.ironic_node')
+    def test_clears_undead_instance(self, ironic_node, clear):
+        ironic_node.return_value = node(instance_uuid='i-1')
+        self.source.publish('instance.delete.end',
+                            {'uuid': 'i-1', 'node': 'node-1'})
+        with mock.patch('threading.Timer') as timer:
+            self.run_router(fix=True)
+        func, args = timer.call_args[0][1], timer.call_args[1]['args']
+        with mock.patch('builtins.print'):
+            func(*args)
+        clear.assert_called_once_with(self.auth, 'node-1')
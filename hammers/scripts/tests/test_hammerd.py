@@ -0,0 +1,84 @@
+# coding: utf-8
+# pytest in hammers dir should invoke these tests
+
+import os
+import threading
+import unittest
+
+from hammers.scripts import hammerd
+from hammers.scripts.hammerd import Job, Scheduler
+
+setting = 'daemon'
+
+
+def configure_and_exit(argv):
+    global setting
+    setting = argv[1]
+    os.environ['HAMMERD_TEST'] = argv[1]
+    return int(argv[2])
+
+
+def raise_error(argv):
+    raise RuntimeError('broken')
+
+
+def call_exit(argv):
+    raise SystemExit('usage')
+
+
+def die(argv):
+    os._exit(3)
+
+
+def job(main, *args):
+    job = Job('node-doctor', interval=60, args=args)
+    job.main = main
+    return job
+
+
+def run_once(job):
+    job.start()
+    while not job.poll():
+        hammerd.wait(job.waitables(), 5)
+    return job.status
+
+
+class TestJob(unittest.TestCase):
+    def test_settings_stay_in_the_run(self):
+        status = run_once(job(configure_and_exit, 'job', '0'))
+        self.assertEqual(status['last_result'], 'ok')
+        self.assertEqual(setting, 'daemon')
+        self.assertNotIn('HAMMERD_TEST', os.environ)
+
+    def test_outcomes(self):
+        for main, args, exit, error in [
+                (configure_and_exit, ('job', '2'), 2, None),
+                (raise_error, (), None, 'RuntimeError: broken'),
+                (call_exit, (), 'usage', None),
+                (die, (), 3, 'process exited with code 3')]:
+            status = run_once(job(main, *args))
+            self.assertEqual(status['last_result'], 'failed')
+            self.assertEqual(status['last_exit'], exit)
+            if error is None:
+                self.assertIsNone(status['last_error'])
+            else:
+                self.assertIn(error, status['last_error'])
+        self.assertFalse(status['state'] == 'running')
+
+
+class TestScheduler(unittest.TestCase):
+    def test_runs_until_stopped(self):
+        jobs = [job(configure_and_exit, 'job', '0')]
+        jobs[0].interval = 0.05
+        scheduler = Scheduler(jobs, jitter=0, workers=1)
+        stop = threading.Event()
+        threading.Timer(0.5, stop.set).start()
+        scheduler.run(stop)
+        status = scheduler.status()['node-doctor']
+        self.assertGreater(status['runs'], 1)
+        self.assertEqual(status['state'], 'idle')
+        self.assertEqual(status['last_result'], 'ok')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,15 +4,19 @@
 import unittest
 from datetime import datetime, timedelta
 import json
+import random
+from unittest import mock
 
 import os
+import tempfile
 
+from hammers.scripts import lease_stack_notifier
 from hammers.scripts.lease_stack_notifier import (
     calculate_overlap_percentage,
-    Host, Lease,
-    LeaseComplianceManager,
+    Host, Lease, Project,
+    LeaseComplianceManager, ViolationState, evaluate,
     project_lease_violation_body,
-    DATETIME_NOW
+    parse_date, DATETIME_NOW, SECONDS_IN_DAY
 )
 
 
@@ -107,6 +111,39 @@ def create_lease(id, days_from_now_start, days_from_now_end,
     }
 
 
+class TestProjectCoverage(unittest.TestCase):
+    def make_project(self, *leases):
+        project = Project('project1')
+        for lease_id, start, end, host_ids in leases:
+            lease = Lease(create_lease(lease_id, start, end))
+            for host_id in host_ids:
+                lease.add_host(Host(host_id, 'compute_skylake'))
+            project.add_lease(lease)
+        return project
+
+    def counted(self, project):
+        return [l.lease_id for l in project.counted_leases('compute_skylake')]
+
+    def test_parallel_leases_counted_once(self):
+        project = self.make_project(
+            ('lease2', 1, 8, ['host1']),
+            ('lease1', 1, 8, ['host2', 'host3']),
+            ('lease3', 8, 15, ['host1']),
+        )
+        self.assertEqual(self.counted(project), ['lease1', 'lease3'])
+        self.assertAlmostEqual(
+            project.get_coverage_by_node_type()['compute_skylake'],
+            timedelta(days=14).total_seconds(), delta=SECONDS_IN_DAY)
+
+    def test_lease_inside_longer_lease_not_counted(self):
+        project = self.make_project(
+            ('lease1', 1, 30, ['host1']),
+            ('lease2', 5, 10, ['host2']),
+            ('lease3', 25, 40, ['host3']),
+        )
+        self.assertEqual(self.counted(project), ['lease1', 'lease3'])
+
+
 class TestLeaseComplianceManager(unittest.TestCase):
     def setUp(self):
         self.hosts = [
@@ -665,5 +702,142 @@ class TestLeaseComplianceManager(unittest.TestCase):
         )
 
 
+@unittest.skipIf(lease_stack_notifier.numpy is None, 'needs NumPy')
+class TestViolationsByProject(unittest.TestCase):
+    def test_numpy_matches_per_project(self):
+        rng = random.Random(0)
+        node_types = ['compute_skylake', 'gpu_v100', 'storage', 'fpga']
+        hosts = [{'id': f'host{n}', 'node_type': node_types[n % 4]}
+                 for n in range(24)]
+        leases = []
+        allocations = []
+        for n in range(300):
+            start = rng.randrange(-10, 40)
+            leases.append(create_lease(
+                f'lease{n}', start, start + rng.randrange(1, 15),
+                project_id=f'project{rng.randrange(8)}'))
+            for host in rng.sample(hosts, rng.randint(1, 3)):
+                allocations.append({'resource_id': host['id'],
+                                    'reservations': [{'lease_id': f'lease{n}'}]})
+        cwd = os.path.dirname(__file__)
+        with open(f'{cwd}/lease-stacking-test-config.json') as cf_file:
+            config = json.loads(cf_file.read())
+        config.update(lease_coverage_threshold=0.3,
+                      high_end_node_coverage_threshold=0.2,
+                      exclude_node_types=['fpga'],
+                      high_end_node_types=['gpu_v100', 'storage'])
+        lcm = LeaseComplianceManager(config, leases, hosts, allocations)
+
+        with mock.patch('builtins.print'):
+            violations = lcm.violations_by_project()
+            with mock.patch.object(lease_stack_notifier, 'numpy', None):
+                expected = lcm.violations_by_project()
+        self.assertTrue(expected)
+        self.assertEqual(violations.keys(), expected.keys())
+        for project_id, project_violations in expected.items():
+            self.assertEqual(violations[project_id].keys(), project_violations.keys())
+            for node_type, violation in project_violations.items():
+                for key, value in violation.items():
+                    self.assertAlmostEqual(violations[project_id][node_type][key], value)
+
+
+class TestViolationState(unittest.TestCase):
+    def setUp(self):
+        cwd = os.path.dirname(__file__)
+        with open(f'{cwd}/lease-stacking-test-config.json') as cf_file:
+            self.config = json.loads(cf_file.read())
+        self.config.update(lease_coverage_threshold=0.5)
+        self.hosts = [{'id': f'host{n}', 'node_type': 'compute_skylake'}
+                      for n in range(8)]
+        # project1 and project2 stack leases back to back, project3 doesn't
+        self.leases = [
+            create_lease('lease1', 0, 10, project_id='project1'),
+            create_lease('lease2', 10, 25, project_id='project1'),
+            create_lease('lease3', 0, 12, project_id='project2'),
+            create_lease('lease4', 12, 24, project_id='project2'),
+            create_lease('lease5', 0, 2, project_id='project3'),
+            create_lease('lease6', 20, 22, project_id='project3'),
+        ]
+        self.allocations = [
+            {'resource_id': f'host{n}', 'reservations': [{'lease_id': f'lease{n}'}]}
+            for n in range(1, 7)
+        ]
+
+    def evaluate(self, state, now=today):
+        with mock.patch('builtins.print'):
+            return evaluate(self.config, self.leases, self.hosts,
+                            self.allocations, now=now, state=state)
+
+    def test_matches_without_state(self):
+        _, expected = self.evaluate(None)
+        self.assertEqual(set(expected), {'project1', 'project2'})
+        lcm, violations = self.evaluate(ViolationState())
+        self.assertEqual(set(lcm.projects_by_id), {'project1', 'project2', 'project3'})
+        self.assertEqual(violations, expected)
+
+    def test_only_changed_projects_evaluated(self):
+        state = ViolationState()
+        _, expected = self.evaluate(state)
+        for project_id in expected:
+            state.notified(project_id)
+
+        lcm, violations = self.evaluate(state)
+        self.assertEqual(lcm.projects_by_id, {})
+        self.assertEqual(violations, expected)
+
+        self.leases[5] = create_lease('lease6', 2, 22, project_id='project3')
+        lcm, violations = self.evaluate(state)
+        self.assertEqual(set(lcm.projects_by_id), {'project3'})
+        self.assertEqual(set(violations), {'project1', 'project2', 'project3'})
+        self.assertTrue(state.needs_notice('project3'))
+        self.assertFalse(state.needs_notice('project1'))
+
+    def test_old_results_evaluated_again(self):
+        state = ViolationState()
+        self.evaluate(state)
+        for entry in state.projects.values():
+            entry['evaluated_at'] = (today - timedelta(days=8)).isoformat()
+        lcm, _ = self.evaluate(state)
+        self.assertEqual(set(lcm.projects_by_id), {'project1', 'project2', 'project3'})
+
+    def test_evaluated_as_of_each_call(self):
+        state = ViolationState()
+        before = datetime.utcnow()
+        self.evaluate(state, now=None)
+        for entry in state.projects.values():
+            self.assertGreaterEqual(parse_date(entry['evaluated_at']), before)
+
+    def test_policy_change_evaluates_all(self):
+        state = ViolationState()
+        self.evaluate(state)
+        for project_id in list(state.unnotified()):
+            state.notified(project_id)
+        self.config['lease_coverage_threshold'] = 1.0
+        lcm, violations = self.evaluate(state)
+        self.assertEqual(set(lcm.projects_by_id), {'project1', 'project2', 'project3'})
+        self.assertEqual(violations, {})
+
+    def test_unnotified_until_notified(self):
+        state = ViolationState()
+        self.evaluate(state)
+        self.assertEqual(state.unnotified(), {'project1', 'project2'})
+        state.notified('project1')
+        self.assertEqual(state.unnotified(), {'project2'})
+
+    def test_save_and_load(self):
+        state = ViolationState()
+        _, expected = self.evaluate(state)
+        state.notified('project1')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'state.json')
+            state.save(path)
+            loaded = ViolationState.load(path)
+            self.assertEqual(ViolationState.load(path + '.missing').projects, {})
+        self.assertEqual(loaded.projects, state.projects)
+        lcm, violations = self.evaluate(loaded)
+        self.assertEqual(set(lcm.projects_by_id), {'project2'})
+        self.assertEqual(violations, expected)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,112 @@
+# coding: utf-8
+# pytest in hammers dir should invoke these tests
+
+import unittest
+from datetime import datetime, timedelta
+import json
+import random
+from unittest import mock
+
+import os
+
+from hammers.scripts import lease_stack_notifier
+from hammers.scripts.lease_stack_notifier import LeaseComplianceManager
+from hammers.scripts.lease_stack_replay import LeaseHistoryReplay, summarize
+
+
+START = datetime(2024, 1, 1)
+
+
+def synthetic_history(rng, hosts, leases):
+    history = []
+    for n in range(leases):
+        created = START + timedelta(hours=rng.randrange(0, 24 * 60))
+        start = created + timedelta(hours=rng.randrange(0, 24 * 20))
+        end = start + timedelta(hours=rng.randrange(1, 24 * 10))
+        deleted = None
+        if rng.random() < 0.2:
+            deleted = created + timedelta(hours=rng.randrange(1, 24 * 20))
+        history.append({
+            'id': f'lease{n}',
+            'project_id': f'project{rng.randrange(6)}',
+            'status': rng.choice(['TERMINATED', 'ACTIVE', 'PENDING']),
+            'start_date': start.isoformat(),
+            'end_date': end.isoformat(),
+            'created_at': created.isoformat(),
+            'deleted_at': deleted.isoformat() if deleted else None,
+            'hosts': [h['id'] for h in rng.sample(hosts, rng.randint(1, 3))],
+        })
+    return history
+
+
+class TestLeaseHistoryReplay(unittest.TestCase):
+    def setUp(self):
+        cwd = os.path.dirname(__file__)
+        with open(f'{cwd}/lease-stacking-test-config.json') as cf_file:
+            self.config = json.loads(cf_file.read())
+        self.config.update(lease_coverage_threshold=0.3,
+                           high_end_node_coverage_threshold=0.2,
+                           high_end_node_types=['gpu_v100'])
+        rng = random.Random(0)
+        node_types = ['compute_skylake', 'gpu_v100', 'storage']
+        self.hosts = [{'id': f'host{n}', 'node_type': node_types[n % 3]}
+                      for n in range(15)]
+        self.history = synthetic_history(rng, self.hosts, 200)
+        self.times = [START + timedelta(hours=n * 36) for n in range(40)]
+
+    def rebuilt(self, now):
+        """What the notifier would have found, listing the leases at now."""
+        leases = []
+        allocations = []
+        for lease in self.history:
+            gone = min(filter(None, [lease['end_date'], lease['deleted_at']]))
+            if not (lease['created_at'] <= now.isoformat() < gone):
+                continue
+            leases.append(dict(lease, status='ACTIVE'))
+            for host_id in lease['hosts']:
+                allocations.append({'resource_id': host_id,
+                                    'reservations': [{'lease_id': lease['id']}]})
+        lcm = LeaseComplianceManager(self.config, leases, self.hosts,
+                                     allocations, now=now)
+        with mock.patch('builtins.print'):
+            return lcm.violations_by_project()
+
+    def check_matches_rebuilt(self):
+        replay = LeaseHistoryReplay(self.config, self.hosts, self.history)
+        found = 0
+        for now, violations in replay.run(self.times):
+            expected = self.rebuilt(now)
+            found += len(expected)
+            self.assertEqual(violations.keys(), expected.keys(), now)
+            for project_id, project_violations in expected.items():
+                self.assertEqual(violations[project_id].keys(),
+                                 project_violations.keys())
+                for node_type, violation in project_violations.items():
+                    for key, value in violation.items():
+                        self.assertAlmostEqual(
+                            violations[project_id][node_type][key], value)
+        self.assertTrue(found)
+
+    def test_matches_rebuilt(self):
+        self.check_matches_rebuilt()
+
+    def test_matches_rebuilt_without_numpy(self):
+        with mock.patch.object(lease_stack_notifier, 'numpy', None):
+            self.check_matches_rebuilt()
+
+    def test_cannot_go_back(self):
+        replay = LeaseHistoryReplay(self.config, self.hosts, self.history)
+        replay.advance(self.times[1])
+        with self.assertRaises(ValueError):
+            replay.advance(self.times[0])
+
+    def test_summarize_thresholds(self):
+        replay = LeaseHistoryReplay(self.config, self.hosts, self.history)
+        stacking, hogging = summarize(replay.run(self.times), [0.3, 0.6, 0.9])
+        counts = [stacking[t][0] for t in [0.3, 0.6, 0.9]]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+        self.assertTrue(counts[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+# coding: utf-8
+# pytest in hammers dir should invoke these tests
+
+import unittest
+from unittest import mock
+
+from hammers import osrest
+from hammers.scripts.node_doctor import resource_provider_failure
+
+
+def node(uuid, provision_state='available', maintenance=False):
+    return {'uuid': uuid, 'name': uuid, 'provision_state': provision_state,
+            'maintenance': maintenance, 'ailments': []}
+
+
+class TestResourceProviderFailure(unittest.TestCase):
+    """Runs the placement checks through the real hammers.osrest.aio
+    plumbing, with only the HTTP GETs faked."""
+    PLACEMENT = {
+        '/resource_providers/rp-allocated/usages': {'usages': {'CUSTOM_BAREMETAL': 1}},
+        '/resource_providers/node-allocated/allocations': {'allocations': {'x': {}}},
+        '/resource_providers/rp-reserved/usages': {},
+        '/resource_providers/rp-reserved/inventories/CUSTOM_BAREMETAL': {'reserved': 1},
+        '/resource_providers/rp-fine/usages': {},
+        '/resource_providers/rp-fine/inventories/CUSTOM_BAREMETAL': {},
+    }
+
+    def get(self, auth, path, params=None):
+        response = mock.Mock()
+        response.json.return_value = self.PLACEMENT.get(path, {})
+        return response
+
+    def test_ailments(self):
+        nodes = {
+            'node-allocated': node('node-allocated'),
+            'node-reserved': node('node-reserved'),
+            'node-fine': node('node-fine'),
+            'node-active': node('node-active', provision_state='active'),
+        }
+        providers = [{'name': n, 'uuid': 'rp-' + n[len('node-'):]}
+                     for n in nodes]
+        with mock.patch.object(osrest.placement, 'resource_providers',
+                               return_value=providers), \
+                mock.patch.object(osrest.placement.API, 'get', side_effect=self.get):
+            resource_provider_failure(mock.Mock(), nodes)
+
+        self.assertEqual(
+            {nid: n['ailments'] for nid, n in nodes.items()},
+            {
+                'node-allocated': ['resource_provider_allocated'],
+                'node-reserved': ['resource_provider_reserved'],
+                'node-fine': [],
+                'node-active': [],
+            })
+
+    def test_no_available_nodes(self):
+        nodes = {'node-active': node('node-active', provision_state='active')}
+        with mock.patch.object(osrest.placement, 'resource_providers',
+                               return_value=[]):
+            resource_provider_failure(mock.Mock(), nodes)
+        self.assertEqual(nodes['node-active']['ailments'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+# coding: utf-8
+# pytest in hammers dir should invoke these tests
+
+import unittest
+from unittest import mock
+
+from hammers.osrest.base import BaseAPI
+
+
+class FakeServer(object):
+    """A listing of *count* items, which may ignore ``limit`` and/or
+    ``marker``."""
+
+    def __init__(self, count, honour_limit=True, honour_marker=True):
+        self.items = [{'id': 'item{:03d}'.format(n)} for n in range(count)]
+        self.honour_limit = honour_limit
+        self.honour_marker = honour_marker
+        self.requests = []
+
+    def request_url(self, method, auth, url, params=None, **kwargs):
+        params = params or {}
+        self.requests.append(params)
+        items = self.items
+        if self.honour_marker and 'marker' in params:
+            ids = [item['id'] for item in items]
+            items = items[ids.index(params['marker']) + 1:]
+        if self.honour_limit and 'limit' in params:
+            items = items[:params['limit']]
+        response = mock.Mock()
+        response.json.return_value = {'things': items}
+        return response
+
+
+class TestPaginate(unittest.TestCase):
+    def paginate(self, server, page_size):
+        api = BaseAPI('thing')
+        auth = mock.Mock()
+        auth.endpoint.return_value = 'http://thing'
+        with mock.patch.object(api, 'request_url', server.request_url):
+            return [item['id'] for item in
+                    api._paginate(auth, '/things', 'things', None,
+                                  page_size, 'id')]
+
+    def test_pages(self):
+        server = FakeServer(5)
+        self.assertEqual(self.paginate(server, 2),
+                         [item['id'] for item in server.items])
+        self.assertEqual(len(server.requests), 3)
+
+    def test_full_last_page(self):
+        server = FakeServer(4)
+        self.assertEqual(len(self.paginate(server, 2)), 4)
+        # the empty page after
+        self.assertEqual(len(server.requests), 3)
+
+    def test_limit_ignored(self):
+        server = FakeServer(5, honour_limit=False)
+        self.assertEqual(self.paginate(server, 2),
+                         [item['id'] for item in server.items])
+        self.assertEqual(len(server.requests), 1)
+
+    def test_marker_ignored(self):
+        server = FakeServer(5, honour_marker=False)
+        self.assertEqual(self.paginate(server, 2), ['item000', 'item001'])
+        self.assertEqual(len(server.requests), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+# coding: utf-8
+# pytest in hammers dir should invoke these tests
+
+import unittest
+from datetime import datetime, timedelta
+
+from hammers.scripts.unutilized_lease_reaper import (
+    EXCLUDED_PROJECT_IDS, UTC,
+    classify_leases, inviolation_filter, lease_usage,
+)
+
+
+now = datetime.utcnow().replace(microsecond=0, tzinfo=UTC)
+
+
+def create_lease(id, hours_ago, nodes, project_id='project1'):
+    start = now - timedelta(hours=hours_ago)
+    return {
+        'id': id,
+        'project_id': project_id,
+        'events': [
+            {'event_type': 'start_lease',
+             'updated_at': start.strftime('%Y-%m-%d %H:%M:%S')},
+            {'event_type': 'end_lease', 'updated_at': None},
+        ],
+        'nodes': [
+            {'provision_state': state,
+             'provision_updated_at': (
+                 start + timedelta(hours=hours)).isoformat()}
+            for state, hours in nodes
+        ],
+    }
+
+
+class TestClassifyLeases(unittest.TestCase):
+    def setUp(self):
+        self.leases = [
+            create_lease('idle-long', 10, [('available', -1), ('available', -2)]),
+            create_lease('idle-short', 7, [('available', -1)]),
+            create_lease('idle-new', 2, [('available', -1)]),
+            create_lease('active', 10, [('available', -1), ('active', -1)]),
+            create_lease('deployed', 10, [('available', 1)]),
+            create_lease('no-nodes', 10, []),
+            create_lease('excluded', 10, [('available', -1)],
+                         project_id=EXCLUDED_PROJECT_IDS[0]),
+        ]
+
+    def test_usage(self):
+        usages = {l['id']: lease_usage(l).idle for l in self.leases}
+        self.assertEqual(usages, {
+            'idle-long': True, 'idle-short': True, 'idle-new': True,
+            'active': False, 'deployed': False, 'no-nodes': False,
+            'excluded': False,
+        })
+
+    def test_longest_threshold_passed(self):
+        classified = classify_leases(self.leases, [6, 9], now=now)
+        self.assertEqual([(l['id'], hours) for l, hours in classified],
+                         [('idle-long', 9), ('idle-short', 6)])
+
+    def test_any_number_of_thresholds(self):
+        classified = classify_leases(self.leases, [9, 1, 6, 1], now=now)
+        self.assertEqual([(l['id'], hours) for l, hours in classified],
+                         [('idle-long', 9), ('idle-short', 6), ('idle-new', 1)])
+
+    def test_matches_filter(self):
+        for hours in [1, 6, 9, 12]:
+            expected = [l['id'] for l in filter(inviolation_filter(hours), self.leases)]
+            classified = classify_leases(self.leases, [hours])
+            self.assertEqual([l['id'] for l, _ in classified], expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -21,7 +21,9 @@ import requests
 
 from hammers import osrest
 from hammers.osapi import load_osrc, Auth
+from hammers.osrest import cache
 from hammers.slack import Slackbot
+from hammers.snapshot import CloudSnapshot
 from hammers.util import error_message_factory, base_parser
 
 OS_ENV_PREFIX = 'OS_'
@@ -84,12 +86,16 @@ def main(argv=None):
         help='Connection parameter file. Should include password. envars used '
         'if not provided by this file.')
     parser.add_argument('-v', '--verbose', action='store_true')
+    parser.add_argument('--mirror-dir', type=str, metavar='DIR',
+        help='Keep incrementally-synced copies of the node and instance '
+        'lists here, rather than fetching them in full every run.')
     parser.add_argument('--force-sane', action='store_true',
         help='Disable sanity checking (i.e. things really are that bad)')
     parser.add_argument('--force-insane', action='store_true',
         help=argparse.SUPPRESS) # for testing
 
     args = parser.parse_args(argv[1:])
+    cache.configure_from_args(args)
 
     slack = Slackbot(args.slack, script_name='undead-instances') if args.slack else None
 
@@ -105,10 +111,12 @@ def main(argv=None):
         )
         return -1
 
-    auth = Auth(os_vars)
+    auth = Auth(os_vars, interface=args.os_interface,
+                token_cache=args.token_cache)
 
-    nodes = osrest.ironic_nodes(auth)
-    instances = osrest.nova_instances(auth)
+    snapshot = CloudSnapshot(auth, mirror_dir=args.mirror_dir).prefetch('ironic_nodes', 'nova_instances')
+    nodes = snapshot.ironic_nodes
+    instances = snapshot.nova_instances
 
     node_instance_map, unbound_instances = find_unbound_instances(
         auth, nodes, instances)
@@ -9,6 +9,8 @@ specified by the admin.
 
 * ``info`` to just display leases or actuall delete them with ``delete``
 '''
+import bisect
+import collections
 from collections import defaultdict
 from datetime import datetime, timedelta
 from pprint import pprint
@@ -18,7 +20,8 @@ import sys
 from hammers import osapi
 from hammers.slack import Slackbot
 from hammers.notifications import _email
-from hammers.osrest import blazar, ironic, keystone
+from hammers.osrest import blazar, cache, ironic, keystone
+from hammers.snapshot import CloudSnapshot
 from hammers.util import base_parser
 
 DEFAULT_WARN_HOURS = 6
@@ -30,6 +33,12 @@ EXCLUDED_PROJECT_IDS = [
     '4140e5f9f65545dbb9f0bdc90ef68d23',
     # Maintenance
     '4ffe61cf850d4b45aef86b46411d33e1']
+UTC = timezone('UTC')
+
+# What a lease's nodes have done since it started: if it's *idle* (none
+# active, none with a provision state change since), it has been since
+# *start_time*.
+LeaseUsage = collections.namedtuple('LeaseUsage', ['lease', 'start_time', 'idle'])
 
 
 def parse_time(time, alt_format=False):
@@ -40,52 +49,82 @@ def parse_time(time, alt_format=False):
         time = time.split('+')[0].split('.')[0]
         dt_fmt = '%Y-%m-%dT%H:%M:%S'
 
-    return datetime.strptime(time, dt_fmt).replace(tzinfo=timezone('UTC'))
+    try:
+        parsed = datetime.fromisoformat(time)
+    except ValueError:
+        parsed = datetime.strptime(time, dt_fmt)
+    return parsed.replace(tzinfo=UTC)
+
+
+def lease_usage(lease):
+    """
+    The :py:data:`LeaseUsage` of a lease with its node details, parsing its
+    start and each node's last provision state change once.
+    """
+    start_event = None
+    for event in lease['events']:
+        if event['event_type'] == 'start_lease':
+            start_event = event
+    start_time = parse_time(start_event['updated_at'], alt_format=True)
+
+    if lease['project_id'] in EXCLUDED_PROJECT_IDS or not lease['nodes']:
+        return LeaseUsage(lease, start_time, False)
+
+    for node in lease['nodes']:
+        if (node['provision_state'] == 'active'
+                or parse_time(node['provision_updated_at']) > start_time):
+            return LeaseUsage(lease, start_time, False)
+    return LeaseUsage(lease, start_time, True)
+
+
+def classify_leases(leases, hours, now=None):
+    """
+    The leases that have been idle for longer than any of the thresholds
+    *hours*, in order, each with the longest threshold it's past, from
+    one pass over them.
+    """
+    if now is None:
+        now = datetime.utcnow().replace(tzinfo=UTC)
+    hours = sorted(set(hours), reverse=True)
+    # ascending, so a start time bisects to the longest threshold passed
+    cutoffs = [now - timedelta(minutes=hour*60) for hour in hours]
+    classified = []
+    for lease in leases:
+        usage = lease_usage(lease)
+        if not usage.idle:
+            continue
+        n = bisect.bisect_left(cutoffs, usage.start_time)
+        if n < len(cutoffs):
+            classified.append((lease, hours[n]))
+    return classified
 
 
 def inviolation_filter(hour):
-    now = datetime.utcnow().replace(tzinfo=timezone('UTC'))
+    now = datetime.utcnow().replace(tzinfo=UTC)
     threshold = now - timedelta(minutes=hour*60)
 
     def inviolation(lease):
-        start_event = [
-            x for x in lease['events']
-            if x['event_type'] == 'start_lease'].pop()
-        start_time = parse_time(start_event['updated_at'], alt_format=True)
-
-        if lease['project_id'] in EXCLUDED_PROJECT_IDS:
-            return False
-
-        if len(lease['nodes']) == 0:
-            return False
-
-        if start_time > threshold:
-            return False
-
-        active_nodes = any([
-            x['provision_state'] == 'active'
-            for x in lease['nodes']])
-        provision_state_change = any([
-            parse_time(x['provision_updated_at']) > start_time
-            for x in lease['nodes']])
-
-        return not active_nodes and not provision_state_change
+        usage = lease_usage(lease)
+        return usage.idle and usage.start_time <= threshold
     return inviolation
 
 
 def leases_with_node_details(auth):
+    snapshot = CloudSnapshot.of(auth).prefetch(
+        'blazar_leases', 'blazar_hosts', 'ironic_nodes', 'blazar_allocations')
+    # copies, as the node details get added to them below
     leases = [
-        l for l in blazar.leases(auth).values()
+        dict(l) for l in snapshot.blazar_leases.values()
         if l['status'] == 'ACTIVE']
     hosts_by_node_uuid = {
-        v['hypervisor_hostname']: v['id']
-        for k, v in blazar.hosts(auth).items()}
+        k: v['id']
+        for k, v in snapshot.blazar_host_by_hypervisor_hostname.items()}
     nodes_by_host = {
         hosts_by_node_uuid[k]: v for k, v
-        in ironic.nodes(auth, details=True).items()}
+        in snapshot.ironic_nodes.items()}
     allocations = [
-        x for x in blazar.host_allocations(auth)
-        if x['resource_id'] in nodes_by_host.keys()]
+        x for x in snapshot.blazar_allocations
+        if x['resource_id'] in nodes_by_host]
     allocs_by_lease = defaultdict(list)
 
     for alloc in allocations:
@@ -114,8 +153,10 @@ def send_notification(auth, lease, sender, warn_period, termination_period,
 
 def find_leases_in_violation(auth, warn_period, grace_period):
     leases = leases_with_node_details(auth)
-    leases_to_warn = list(filter(inviolation_filter(warn_period), leases))
-    leases_to_remove = list(filter(inviolation_filter(grace_period), leases))
+    classified = classify_leases(leases, [warn_period, grace_period])
+    leases_to_warn = [lease for lease, _ in classified]
+    leases_to_remove = [
+        lease for lease, hours in classified if hours >= grace_period]
 
     return leases_to_warn, leases_to_remove
 
@@ -143,6 +184,7 @@ def main(argv=None):
         default='noreply@chameleoncloud.org')
 
     args = parser.parse_args(argv[1:])
+    cache.configure_from_args(args)
     auth = osapi.Auth.from_env_or_args(args=args)
 
     assert args.grace_hours > args.warn_hours, (
@@ -162,8 +204,9 @@ def main(argv=None):
 
         if (len(warn) + len(terminate) > 0):
             if args.action == 'delete':
+                terminate_ids = {lease['id'] for lease in terminate}
                 for lease in warn:
-                    if lease not in terminate:
+                    if lease['id'] not in terminate_ids:
                         send_notification(
                             auth, lease, sender, warn_period, grace_period,
                             "Your lease {} is idle and may be terminated."
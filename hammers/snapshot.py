@@ -0,0 +1,149 @@
+# coding: utf-8
+"""
+Point-in-time view of the OpenStack inventories that several hammers look
+at. Each collection is fetched at most once per snapshot, on first use, and
+:py:meth:`CloudSnapshot.prefetch` pulls several of them in parallel. Indexes
+over the collections are built once and cached as well.
+
+Functions that used to take an :py:class:`hammers.osapi.Auth` can take a
+snapshot instead by calling :py:meth:`CloudSnapshot.of` on their argument;
+the snapshot's ``auth`` is still there for writes and one-off lookups.
+
+Given a *mirror_dir*, collections that :py:mod:`hammers.mirror` knows how
+to poll incrementally come from a :py:class:`~hammers.mirror.Mirror` there
+instead of a full listing.
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import threading
+
+from hammers import osrest
+from hammers.mirror import Mirror, SOURCES as MIRRORED
+
+COLLECTIONS = {
+    'ironic_nodes': lambda auth: osrest.ironic.nodes(auth, details=True),
+    'ironic_ports': osrest.ironic.ports,
+    'neutron_ports': osrest.neutron.ports,
+    'nova_instances': osrest.nova.instances,
+    'nova_aggregates': osrest.nova.aggregates,
+    'blazar_hosts': osrest.blazar.hosts,
+    'blazar_leases': osrest.blazar.leases,
+    'blazar_allocations': osrest.blazar.host_allocations,
+}
+
+
+def _collection(name, doc):
+    return property(lambda self: self.get(name), doc=doc)
+
+
+class CloudSnapshot(object):
+    """
+    Lazily-fetched, shared inventories for *auth*. Collections are the
+    same dictionaries and lists returned by the :py:mod:`hammers.osrest`
+    function they're named after, and shouldn't be modified.
+    """
+
+    def __init__(self, auth, mirror_dir=None):
+        self.auth = auth
+        self.mirror_dir = mirror_dir
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @classmethod
+    def of(cls, auth_or_snapshot):
+        """Returns *auth_or_snapshot* if it's already a snapshot, otherwise
+        a new snapshot around it."""
+        if isinstance(auth_or_snapshot, cls):
+            return auth_or_snapshot
+        return cls(auth_or_snapshot)
+
+    def _future(self, name):
+        with self._lock:
+            if name not in self._futures:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=len(COLLECTIONS),
+                        thread_name_prefix='snapshot')
+                self._futures[name] = self._executor.submit(
+                    self._fetcher(name), self.auth)
+            return self._futures[name]
+
+    def _fetcher(self, name):
+        if self.mirror_dir and name in MIRRORED:
+            return lambda auth: Mirror(auth, name, self.mirror_dir).sync().items
+        return COLLECTIONS[name]
+
+    def get(self, name):
+        """Fetch collection *name* (a key of ``COLLECTIONS``) if it hasn't
+        been already, and return it."""
+        return self._future(name).result()
+
+    def prefetch(self, *names):
+        """Fetch the named collections, or all of them, concurrently."""
+        futures = [self._future(name) for name in (names or COLLECTIONS)]
+        for future in futures:
+            future.result()
+        return self
+
+    ironic_nodes = _collection(
+        'ironic_nodes', 'Ironic nodes (with details) keyed by UUID.')
+    ironic_ports = _collection(
+        'ironic_ports', 'Ironic ports keyed by UUID.')
+    neutron_ports = _collection(
+        'neutron_ports', 'Neutron ports keyed by ID.')
+    nova_instances = _collection(
+        'nova_instances', 'Nova instances of all projects keyed by ID. '
+        'Detailed if mirrored.')
+    nova_aggregates = _collection(
+        'nova_aggregates', 'Nova aggregates keyed by (integer) ID.')
+    blazar_hosts = _collection(
+        'blazar_hosts', 'Blazar hosts keyed by ID.')
+    blazar_leases = _collection(
+        'blazar_leases', 'Blazar leases of all projects keyed by ID.')
+    blazar_allocations = _collection(
+        'blazar_allocations', 'List of Blazar host allocations.')
+
+    @property
+    def nodes_by_uuid(self):
+        return self.ironic_nodes
+
+    @functools.cached_property
+    def nodes_by_instance_uuid(self):
+        return {
+            n['instance_uuid']: n for n in self.ironic_nodes.values()
+            if n['instance_uuid'] is not None
+        }
+
+    @functools.cached_property
+    def ironic_ports_by_mac(self):
+        return {p['address']: p for p in self.ironic_ports.values()}
+
+    @functools.cached_property
+    def ironic_ports_by_node(self):
+        """Lists of Ironic ports keyed by node UUID."""
+        by_node = defaultdict(list)
+        for port in self.ironic_ports.values():
+            by_node[port['node_uuid']].append(port)
+        by_node.default_factory = None
+        return by_node
+
+    @functools.cached_property
+    def neutron_ports_by_mac(self):
+        """Lists of Neutron ports keyed by MAC address. More than one port
+        can claim the same address."""
+        by_mac = defaultdict(list)
+        for port in self.neutron_ports.values():
+            by_mac[port['mac_address']].append(port)
+        by_mac.default_factory = None
+        return by_mac
+
+    @functools.cached_property
+    def blazar_host_by_hypervisor_hostname(self):
+        return {
+            h['hypervisor_hostname']: h for h in self.blazar_hosts.values()}
+
+    @functools.cached_property
+    def allocations_by_resource_id(self):
+        return {a['resource_id']: a for a in self.blazar_allocations}
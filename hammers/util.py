@@ -7,6 +7,8 @@ from pytz import timezone
 from subprocess import Popen, PIPE, check_output
 from time import time
 
+from hammers import osapi
+
 
 def base_parser(description=None):
     parser = argparse.ArgumentParser(description=description)
@@ -14,6 +16,15 @@ def base_parser(description=None):
         'JSON file with Slack webhook information to send a notification to'))
     parser.add_argument('--osrc', type=str, help=(
         'OpenStack parameters file that overrides envvars.'))
+    parser.add_argument('--os-interface', type=str,
+        choices=osapi.INTERFACES, help=(
+        'Endpoint interface to use (overrides OS_INTERFACE, defaulting to '
+        'public). Use "internal" when running on a controller.'))
+    parser.add_argument('--token-cache', type=str, metavar='DIR', help=(
+        'Directory to cache Keystone tokens in, shared between runs.'))
+    parser.add_argument('--max-staleness', type=int, metavar='SECONDS', help=(
+        'Reuse OpenStack listings cached by another run up to this old '
+        '(capped by per-collection TTLs). Off by default.'))
 
     return parser
 
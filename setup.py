@@ -25,7 +25,9 @@ setup(
             'conflict-macs = hammers.scripts.conflict_macs:main',
             'curiouser = hammers.scripts.curiouser:main',
             'dirty-ports = hammers.scripts.dirty_ports:main',
+            'event-responder = hammers.scripts.event_responder:main',
             'lease-stack-notifier = hammers.scripts.lease_stack_notifier:main',
+            'lease-stack-replay = hammers.scripts.lease_stack_replay:main',
             'maintenance-reservation = hammers.scripts.maintenance_reservation:main',
             'metadata-sync = hammers.scripts.metadata_sync:main',
             'neutron-reaper = hammers.scripts.neutron_reaper:main',
@@ -36,6 +38,7 @@ setup(
             'orphans-detector = hammers.scripts.orphans_detector:main',
             'clean-old-aggregates = hammers.scripts.clean_old_aggregates:main',
             'floatingip-reaper = hammers.scripts.floatingip_reaper:main',
+            'hammerd = hammers.scripts.hammerd:main',
             'unutilized-lease-reaper = hammers.scripts.unutilized_lease_reaper:main',
             'node-doctor = hammers.scripts.node_doctor:main',
             'retirement-enforcer = hammers.scripts.enforce_retirement:main',
@@ -55,4 +58,8 @@ setup(
         'requests',
         # 'mysqlclient>=1.3.6', # assume this is installed; could also be mysql-python
     ],
+    extras_require={
+        # lease-stack-notifier uses it if installed, else pure Python
+        'fast': ['numpy'],
+    },
 )